@@ -0,0 +1,204 @@
+"""Benchmark the graph pipeline on synthetic workspaces served by a local stub.
+
+Each size runs in its own process so that peak RSS is measured per size::
+
+    python -m benchmarks.run run --sizes 1000,10000,100000
+    python -m benchmarks.run compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import typer
+
+from benchmarks.stub_server import StubNotionServer
+from benchmarks.workspace import CHILDREN_NAME, SyntheticWorkspace
+from notion_utils.tracing import peak_rss_mb
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+STAGES = ("fetch", "relations", "correlations", "render")
+EMBEDDING_DIM = 384
+# pyvis pages of more pages than this take minutes to write and do not open
+MAX_RENDER_PAGES = 20_000
+
+app = typer.Typer()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(results, stage, n_items, fn):
+    start = time.perf_counter()
+    value = fn()
+    wall = time.perf_counter() - start
+    # Each size runs in its own process, so the process peak is the size's peak
+    peak = peak_rss_mb()
+    results.append(
+        {
+            "stage": stage,
+            "items": n_items,
+            "wall_s": round(wall, 4),
+            "peak_rss_mb": round(peak, 1) if peak is not None else None,
+            "throughput_per_s": round(n_items / wall, 1) if wall else None,
+        }
+    )
+    return value
+
+
+def random_encoder(texts):
+    """Stand-in for the sentence transformer, to time everything but the model."""
+    rng = np.random.default_rng(len(texts))
+    return rng.normal(size=(len(texts), EMBEDDING_DIM)).astype(np.float32)
+
+
+def run_size(
+    n_pages,
+    fan_out=3,
+    summary_words=30,
+    stages=STAGES,
+    encoder="random",
+    cutoff=0.5,
+    rate_limit_every=100,
+    max_workers=4,
+) -> list:
+    """Run the stages on a workspace of ``n_pages`` pages and return their measures."""
+    from notion_utils.network_graph import NetworkGraphCorrelation, NetworkGraphRelation
+    from notion_utils.notion_api import NotionAPI
+    from notion_utils.schema_index import SchemaIndex
+
+    workspace = SyntheticWorkspace(n_pages, fan_out, summary_words)
+    results = []
+    with StubNotionServer(workspace, rate_limit_every) as server:
+        notion_api = NotionAPI(
+            "token",
+            workspace.database_name(),
+            base_url=server.url,
+            max_workers=max_workers,
+            schema_index=SchemaIndex(),
+        )
+        data, id_to_title = measure(
+            results, "fetch", n_pages, lambda: notion_api.full_process(CHILDREN_NAME)
+        )
+        results[-1]["bytes"] = server.bytes_sent
+        results[-1]["requests"] = server.request_count
+    relation_builder = NetworkGraphRelation(data, id_to_title)
+    relations = None
+    if "relations" in stages or "render" in stages:
+        relations = measure(results, "relations", n_pages, relation_builder.build_graph)
+        results[-1]["edges"] = relations.number_of_edges()
+    if "correlations" in stages:
+        builder = NetworkGraphCorrelation(data, id_to_title)
+        if encoder == "random":
+            builder.encode = random_encoder
+        correlations = measure(
+            results, "correlations", n_pages, lambda: builder.build_graph(cutoff=cutoff)
+        )
+        results[-1]["edges"] = correlations.number_of_edges()
+    if "render" in stages and n_pages <= MAX_RENDER_PAGES:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "graph.html")
+            measure(
+                results,
+                "render",
+                n_pages,
+                lambda: relation_builder.save_graph_in_html(relations, path),
+            )
+    return results
+
+
+@app.command("size")
+def size_command(
+    n_pages: int = typer.Argument(..., help="Pages in the synthetic database"),
+    fan_out: int = typer.Option(3, help="Children of each page"),
+    summary_words: int = typer.Option(30, help="Words in each summary"),
+    stages: str = typer.Option(",".join(STAGES), help="Comma separated stages to run"),
+    encoder: str = typer.Option("random", help="random, or model for the real embedding model"),
+    cutoff: float = typer.Option(0.5, help="Cutoff of the correlation graph"),
+    rate_limit_every: int = typer.Option(100, help="Answer every n-th request with a 429"),
+):
+    """Benchmark one size in this process and print the results as JSON."""
+    results = run_size(
+        n_pages, fan_out, summary_words, stages.split(","), encoder, cutoff, rate_limit_every
+    )
+    typer.echo(json.dumps(results))
+
+
+@app.command("run")
+def run_command(
+    sizes: str = typer.Option("1000,10000", help="Comma separated page counts"),
+    fan_out: int = typer.Option(3, help="Children of each page"),
+    summary_words: int = typer.Option(30, help="Words in each summary"),
+    stages: str = typer.Option(",".join(STAGES), help="Comma separated stages to run"),
+    encoder: str = typer.Option("random", help="random, or model for the real embedding model"),
+    rate_limit_every: int = typer.Option(100, help="Answer every n-th request with a 429"),
+    output_dir: str = typer.Option(RESULTS_DIR, help="Directory of the results, one file per commit"),
+):
+    """Benchmark every size, each in a fresh process, and store the results of this commit."""
+    commit = git_commit()
+    report = {"commit": commit, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": {}}
+    for n_pages in [int(el) for el in sizes.split(",")]:
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.run",
+                "size",
+                str(n_pages),
+                f"--fan-out={fan_out}",
+                f"--summary-words={summary_words}",
+                f"--stages={stages}",
+                f"--encoder={encoder}",
+                f"--rate-limit-every={rate_limit_every}",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        report["runs"][n_pages] = json.loads(output.strip().splitlines()[-1])
+        for row in report["runs"][n_pages]:
+            typer.echo(
+                f"{n_pages:>7} pages {row['stage']:<12} {row['wall_s']:>9.3f}s "
+                f"{row['peak_rss_mb'] or 0:>8.1f}MB {row['throughput_per_s'] or 0:>10.1f}/s"
+            )
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    typer.echo(f"Results saved in {path}")
+
+
+@app.command("compare")
+def compare_command(baseline: str, candidate: str):
+    """Print the wall time and peak RSS ratios of two result files."""
+    reports = []
+    for path in (baseline, candidate):
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    for n_pages, rows in reports[1]["runs"].items():
+        before = {row["stage"]: row for row in reports[0]["runs"].get(n_pages, [])}
+        for row in rows:
+            if row["stage"] not in before:
+                continue
+            old = before[row["stage"]]
+            typer.echo(
+                f"{n_pages:>7} pages {row['stage']:<12} "
+                f"time x{row['wall_s'] / max(old['wall_s'], 1e-9):.2f} "
+                f"rss x{(row['peak_rss_mb'] or 0) / max(old['peak_rss_mb'] or 0, 1e-9):.2f}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,113 @@
+"""Local stand-in for the Notion query and search endpoints."""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUERY_PATH = re.compile(r"^/v1/databases/([^/]+)/query$")
+
+
+def matches(page, query_filter) -> bool:
+    """Apply a timestamp filter such as ``{"timestamp": "created_time", ...}``."""
+    if not query_filter or "timestamp" not in query_filter:
+        return True
+    field = query_filter["timestamp"]
+    condition = query_filter.get(field, {})
+    value = page[field]
+    return (
+        value >= condition.get("on_or_after", "")
+        and value > condition.get("after", "")
+        and value < condition.get("before", "9999")
+    )
+
+
+def paginate(items, body, max_page_size=100) -> dict:
+    start = int(body.get("start_cursor") or 0)
+    end = start + min(body.get("page_size", max_page_size), max_page_size)
+    return {
+        "object": "list",
+        "results": items[start:end],
+        "has_more": end < len(items),
+        "next_cursor": str(end) if end < len(items) else None,
+    }
+
+
+class StubNotionHandler(BaseHTTPRequestHandler):
+    """Paginated ``search`` and database ``query`` endpoints of a ``SyntheticWorkspace``.
+
+    Every ``rate_limit_every``-th request is answered with a 429.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        with server.lock:
+            server.request_count += 1
+            rate_limited = (
+                server.rate_limit_every
+                and server.request_count % server.rate_limit_every == 0
+            )
+        if rate_limited:
+            return self.send_json(429, {"object": "error"}, {"Retry-After": "0"})
+        match = QUERY_PATH.match(self.path)
+        if self.path == "/v1/search":
+            databases = server.workspace.databases
+            sort = body.get("sort") or {}
+            if sort.get("timestamp") == "last_edited_time":
+                databases = sorted(
+                    databases,
+                    key=lambda database: database["last_edited_time"],
+                    reverse=sort.get("direction") == "descending",
+                )
+            payload = paginate(databases, body)
+        elif match and match.group(1) in server.workspace.pages:
+            pages = server.workspace.pages[match.group(1)]
+            query_filter = body.get("filter")
+            if query_filter:
+                pages = [page for page in pages if matches(page, query_filter)]
+            payload = paginate(pages, body)
+        else:
+            return self.send_json(404, {"object": "error"})
+        self.send_json(200, payload)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+        self.send_response(status)
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubNotionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, workspace, rate_limit_every=0):
+        super().__init__(("127.0.0.1", 0), StubNotionHandler)
+        self.workspace = workspace
+        self.rate_limit_every = rate_limit_every
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
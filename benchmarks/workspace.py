@@ -0,0 +1,75 @@
+"""Synthetic Notion workspaces of any size."""
+import random
+from datetime import datetime, timedelta
+
+START_TIME = datetime(2023, 1, 1)
+CHILDREN_NAME = "Child Task"
+WORDS = (
+    "plan review draft meeting budget design release bug feature client report "
+    "research notes roadmap hiring launch metrics sprint retro onboarding invoice "
+    "contract analysis prototype feedback migration backup security audit"
+).split()
+
+
+def timestamp(minutes: int) -> str:
+    return (START_TIME + timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def make_database(database_id: str, name: str) -> dict:
+    """A database object as returned by the search endpoint, with a self relation."""
+    return {
+        "object": "database",
+        "id": database_id,
+        "title": [{"text": {"content": name}, "plain_text": name}],
+        "last_edited_time": timestamp(0),
+        "properties": {
+            "Name": {"type": "title", "title": {}},
+            "AI summary": {"type": "rich_text", "rich_text": {}},
+            CHILDREN_NAME: {"type": "relation", "relation": {"database_id": database_id}},
+        },
+    }
+
+
+def make_page(page_id, title, summary, children, minutes) -> dict:
+    return {
+        "object": "page",
+        "id": page_id,
+        "created_time": timestamp(minutes),
+        "last_edited_time": timestamp(minutes),
+        "archived": False,
+        "properties": {
+            "Name": {"type": "title", "title": [{"plain_text": title}]},
+            "AI summary": {"type": "rich_text", "rich_text": [{"plain_text": summary}]},
+            CHILDREN_NAME: {"type": "relation", "relation": [{"id": el} for el in children]},
+        },
+    }
+
+
+class SyntheticWorkspace:
+    """Databases of ``n_pages`` pages, each linking to ``fan_out`` random pages.
+
+    Summaries are ``summary_words`` words drawn from a small vocabulary, so
+    that pages share words and the correlation graph is not empty.
+    """
+
+    def __init__(self, n_pages, fan_out=3, summary_words=30, n_databases=1, seed=0):
+        rng = random.Random(seed)
+        self.databases = []
+        self.pages = {}
+        for db in range(n_databases):
+            database_id = f"db-{db:04d}"
+            self.databases.append(make_database(database_id, f"Database {db}"))
+            ids = [f"{database_id}-page-{i:07d}" for i in range(n_pages)]
+            self.pages[database_id] = [
+                make_page(
+                    page_id,
+                    f"Task {i} {rng.choice(WORDS)}",
+                    " ".join(rng.choices(WORDS, k=summary_words)),
+                    rng.sample(ids, min(fan_out, n_pages)),
+                    i,
+                )
+                for i, page_id in enumerate(ids)
+            ]
+
+    def database_name(self, i=0) -> str:
+        return self.databases[i]["title"][0]["text"]["content"]
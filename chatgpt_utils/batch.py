@@ -0,0 +1,144 @@
+"""Run many independent prompts from a JSONL file, resuming interrupted runs."""
+import asyncio
+import json
+import os
+from itertools import islice
+
+import httpx
+import typer
+
+from chatgpt_utils.cache import CacheMiss
+from chatgpt_utils.client import API_URL, AsyncChatClient, estimate_tokens
+from chatgpt_utils.discussion import JsonlSink
+from chatgpt_utils.interface import ROLE_USER
+
+CHUNK_SIZE = 1000
+
+
+def read_requests(path):
+    """Yield the requests of a JSONL file, their ``id`` defaulting to the line number."""
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                request = json.loads(line)
+                request.setdefault("id", i)
+                yield request
+
+
+def completed_ids(path) -> set:
+    """Ids of the requests already answered in an output file."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return {result["id"] for result in results if "response" in result}
+
+
+def request_messages(request) -> list:
+    if "messages" in request:
+        return request["messages"]
+    return [{"role": ROLE_USER, "content": request["prompt"]}]
+
+
+class BatchRunner:
+    """Send the requests of a JSONL file with at most ``max_concurrency`` in flight.
+
+    Each input line has a ``prompt`` or ``messages``, and optionally an
+    ``id``, a ``model`` and sampling ``params``. Results are appended to the
+    output JSONL as they arrive, which is also the checkpoint: requests
+    already answered there are skipped, and failed ones are sent again, on
+    the next run. Requests are read in chunks and the longest of a chunk are
+    sent first, so that they do not trail at the end while the client's rate
+    limits keep the throughput within budget.
+    """
+
+    def __init__(
+        self,
+        client,
+        model="gpt-3.5-turbo",
+        max_concurrency=16,
+        chunk_size=CHUNK_SIZE,
+        **params,
+    ):
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.params = params
+
+    async def run(self, input_path, output_path) -> dict:
+        """Process the input file, returning the counts of answered, skipped and failed requests."""
+        done = completed_ids(output_path)
+        counts = {"answered": 0, "skipped": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        requests = read_requests(input_path)
+        with JsonlSink(output_path) as sink:
+            while True:
+                chunk = list(islice(requests, self.chunk_size))
+                if not chunk:
+                    return counts
+                pending = [request for request in chunk if request["id"] not in done]
+                counts["skipped"] += len(chunk) - len(pending)
+                pending.sort(
+                    key=lambda request: estimate_tokens(request_messages(request)),
+                    reverse=True,
+                )
+                results = await asyncio.gather(
+                    *[self.process(request, sink, semaphore) for request in pending]
+                )
+                for answered in results:
+                    counts["answered" if answered else "failed"] += 1
+
+    async def process(self, request, sink, semaphore) -> bool:
+        params = {**self.params, **request.get("params", {})}
+        async with semaphore:
+            try:
+                completion = await self.client.complete(
+                    request.get("model", self.model), request_messages(request), **params
+                )
+            except (httpx.HTTPError, CacheMiss) as e:
+                sink.write({"id": request["id"], "error": str(e)})
+                return False
+        sink.write(
+            {
+                "id": request["id"],
+                "response": completion["choices"][0]["message"]["content"],
+                "usage": completion.get("usage"),
+            }
+        )
+        return True
+
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    input_path: str = typer.Argument(..., help="JSONL file of prompts"),
+    output_path: str = typer.Argument(..., help="JSONL file of results, also used to resume"),
+    api_key: str = typer.Option(..., envvar="OPENAI_API_KEY", help="Your OpenAI key"),
+    model: str = typer.Option("gpt-3.5-turbo", help="Default model of the requests"),
+    base_url: str = typer.Option(API_URL, help="Base URL of the API"),
+    max_concurrency: int = typer.Option(16, help="Requests in flight"),
+    requests_per_minute: int = typer.Option(3500, help="Requests per minute limit"),
+    tokens_per_minute: int = typer.Option(90000, help="Tokens per minute limit"),
+):
+    async def run():
+        async with AsyncChatClient(
+            api_key,
+            base_url,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        ) as client:
+            runner = BatchRunner(client, model, max_concurrency)
+            return await runner.run(input_path, output_path)
+
+    counts = asyncio.run(run())
+    typer.echo(
+        f"{counts['answered']} answered, {counts['skipped']} skipped, {counts['failed']} failed"
+    )
+
+
+if __name__ == "__main__":
+    app()
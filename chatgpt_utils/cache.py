@@ -0,0 +1,128 @@
+"""Content addressed cache of chat completions, to replay requests offline."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MODES = ("use", "record", "replay")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    completion TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used);
+"""
+
+
+class CacheMiss(KeyError):
+    """A replayed request was never recorded."""
+
+
+def completion_key(model, messages, params=None) -> str:
+    """Hash of everything that determines a completion: model, messages and sampling."""
+    params = {key: val for key, val in (params or {}).items() if key != "stream"}
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def text_completion(content) -> dict:
+    """A completion holding ``content``, as cached for streamed responses."""
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+
+class CompletionCache:
+    """Completions in an in-memory LRU of ``max_entries`` in front of a SQLite file.
+
+    The on-disk tier, if ``path`` is set, drops the least recently used
+    completions once it holds more than ``max_bytes``. In ``use`` mode, misses
+    are sent to the API and stored. ``record`` always sends requests and
+    overwrites what is stored, and ``replay`` never sends any request,
+    raising ``CacheMiss`` for requests that were not recorded.
+    """
+
+    def __init__(self, path=None, mode="use", max_entries=1024, max_bytes=256 * 2**20):
+        if mode not in MODES:
+            raise ValueError(f"Cache mode {mode} not in {MODES}")
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        if path is not None:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if self.conn is None:
+                return None
+            row = self.conn.execute(
+                "SELECT completion FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            completion = json.loads(row[0])
+            self._remember(key, completion)
+            return completion
+
+    def put(self, key, completion):
+        with self.lock:
+            self._remember(key, completion)
+            if self.conn is None:
+                return
+            data = json.dumps(completion, ensure_ascii=False)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def lookup(self, key):
+        """Return the completion to use instead of sending the request, if any."""
+        if self.mode == "record":
+            return None
+        completion = self.get(key)
+        if completion is None and self.mode == "replay":
+            raise CacheMiss(key)
+        return completion
+
+    def _remember(self, key, completion):
+        self.memory[key] = completion
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM completions ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM completions WHERE key = ?", evicted)
@@ -0,0 +1,184 @@
+"""Async client of the chat completion API."""
+import asyncio
+import json
+import random
+
+import httpx
+
+from chatgpt_utils.cache import completion_key, text_completion
+from chatgpt_utils.history import message_tokens
+from chatgpt_utils.rate_limit import RateLimiter, retry_after_seconds
+
+API_URL = "https://api.openai.com/v1"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+
+
+def estimate_tokens(messages, max_tokens=None, prompt_tokens=None) -> int:
+    """Token count of a request, including the completion budget.
+
+    ``prompt_tokens`` is the count of the messages when the caller already
+    has it, as ``ConversationHistory`` does, so they are not counted again.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = sum(message_tokens(message) for message in messages)
+    return prompt_tokens + (max_tokens or 0)
+
+
+def parse_event(line):
+    """Return the content delta of a server-sent event line, ``None`` at the end of the stream."""
+    if not line.startswith("data: "):
+        return ""
+    data = line[len("data: ") :]
+    if data == "[DONE]":
+        return None
+    choices = json.loads(data)["choices"]
+    if not choices:
+        return ""
+    return choices[0].get("delta", {}).get("content") or ""
+
+
+class AsyncChatClient:
+    """Chat completion client sharing one connection pool between many bots.
+
+    At most ``max_concurrency`` requests are in flight, and requests wait for
+    the requests per minute and tokens per minute budgets. Rate limited and
+    failed requests are retried with exponential backoff and full jitter,
+    never sooner than the ``Retry-After`` header asks. With a
+    ``CompletionCache``, cached completions are returned without any request.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url=API_URL,
+        max_concurrency=16,
+        requests_per_minute=3500,
+        tokens_per_minute=90000,
+        max_retries=MAX_RETRIES,
+        backoff=1.0,
+        timeout=60.0,
+        cache=None,
+    ):
+        self.cache = cache
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    def retry_delay(self, attempt, response=None) -> float:
+        delay = random.uniform(0, self.backoff * 2**attempt)
+        if response is not None:
+            retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    async def complete(self, model, messages, prompt_tokens=None, **params) -> dict:
+        """Return the completion of ``messages`` as decoded from the API.
+
+        ``prompt_tokens``, the token count of ``messages`` if known, is used
+        for rate limiting instead of counting them again.
+        """
+        if self.cache is None:
+            return await self._complete(model, messages, prompt_tokens, **params)
+        key = completion_key(model, messages, params)
+        completion = self.cache.lookup(key)
+        if completion is None:
+            completion = await self._complete(model, messages, prompt_tokens, **params)
+            self.cache.put(key, completion)
+        return completion
+
+    async def _complete(self, model, messages, prompt_tokens=None, **params) -> dict:
+        payload = {"model": model, "messages": messages, **params}
+        estimated = estimate_tokens(messages, params.get("max_tokens"), prompt_tokens)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            response = None
+            try:
+                async with self.semaphore:
+                    response = await self.http.post("/chat/completions", json=payload)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    completion = response.json()
+                    used = completion.get("usage", {}).get("total_tokens", estimated)
+                    self.limiter.record_usage(estimated, used)
+                    return completion
+            await asyncio.sleep(self.retry_delay(attempt, response))
+
+    async def stream(self, model, messages, prompt_tokens=None, **params):
+        """Yield the content deltas of the completion of ``messages``.
+
+        Requests are only retried until the first delta is received. A cached
+        completion is yielded as a single delta. ``prompt_tokens`` is as for
+        ``complete``.
+        """
+        if self.cache is None:
+            async for delta in self._stream(model, messages, prompt_tokens, **params):
+                yield delta
+            return
+        key = completion_key(model, messages, params)
+        completion = self.cache.lookup(key)
+        if completion is not None:
+            yield completion["choices"][0]["message"]["content"]
+            return
+        deltas = []
+        async for delta in self._stream(model, messages, prompt_tokens, **params):
+            deltas.append(delta)
+            yield delta
+        self.cache.put(key, text_completion("".join(deltas)))
+
+    async def _stream(self, model, messages, prompt_tokens=None, **params):
+        payload = {"model": model, "messages": messages, **params, "stream": True}
+        prompt_tokens = estimate_tokens(messages, prompt_tokens=prompt_tokens)
+        estimated = prompt_tokens + (params.get("max_tokens") or 0)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            retry_response = None
+            started = False
+            try:
+                async with self.semaphore, self.http.stream(
+                    "POST", "/chat/completions", json=payload
+                ) as response:
+                    if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        retry_response = response
+                    else:
+                        response.raise_for_status()
+                        length = 0
+                        async for line in response.aiter_lines():
+                            delta = parse_event(line)
+                            if delta is None:
+                                break
+                            if delta:
+                                started = True
+                                length += len(delta)
+                                yield delta
+                        used = prompt_tokens + length // 4
+                        self.limiter.record_usage(estimated, used)
+                        return
+            except httpx.TransportError:
+                if started or attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.retry_delay(attempt, retry_response))
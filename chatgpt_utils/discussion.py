@@ -2,29 +2,149 @@
 A class represent a discussion between two chatgpt bots.
 """
 
-from chatgpt_utils.interface import ChatGPTBot, ROLE_SYSTEM
+import asyncio
+import json
+import threading
+
+from chatgpt_utils.interface import ChatGPTBot, ROLE_SYSTEM, ROLE_USER
 
 
 def generate_iam_initial_prompt(role: str):
     return f"You are {role}. In the rest of this interaction you will interact as him. Do not break character at any time"
 
 
+def stop_on_phrase(phrase: str):
+    """Stop condition ending a discussion once a message contains ``phrase``."""
+    return lambda turn, content: phrase.lower() in content.lower()
+
+
+class JsonlSink:
+    """Append turns to a JSONL file as they complete, safe to share between threads."""
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 class ChatGPTDiscussion:
-    """A class represent a discussion between two chatgpt bots."""
+    """A class represent a discussion between two chatgpt bots.
+
+    A discussion runs turns until ``max_turns`` or until one of the
+    ``stop_conditions``, callables taking the turn number and the message,
+    returns true. Each turn is written to ``sink`` when it completes.
+    """
 
-    def __init__(self, bot1: ChatGPTBot, bot2: ChatGPTBot):
+    def __init__(
+        self,
+        bot1: ChatGPTBot,
+        bot2: ChatGPTBot,
+        max_turns=10,
+        stop_conditions=(),
+        sink=None,
+        discussion_id=None,
+    ):
         self.bot1 = bot1
         self.bot2 = bot2
+        self.max_turns = max_turns
+        self.stop_conditions = list(stop_conditions)
+        self.sink = sink
+        self.discussion_id = discussion_id
 
     def set_role(self, bot1_role: str, bot2_role: str):
-        """Set the role of each bot."""
-        self.bot1.add_message_and_generate_response(
-            ROLE_SYSTEM, generate_iam_initial_prompt(bot1_role)
-        )
-        self.bot2.add_message_and_generate_response(
-            ROLE_SYSTEM, generate_iam_initial_prompt(bot2_role)
-        )
-
-    def kickoff_discussion(self):
-        """TODO: implement this method."""
-        pass
+        """Set the role of each bot, the prompts are sent with their first request."""
+        self.bot1.add_message(ROLE_SYSTEM, generate_iam_initial_prompt(bot1_role))
+        self.bot2.add_message(ROLE_SYSTEM, generate_iam_initial_prompt(bot2_role))
+
+    def record_turn(self, turn, speaker, content) -> bool:
+        """Write the turn to the sink and tell whether the discussion must stop."""
+        if self.sink is not None:
+            self.sink.write(
+                {
+                    "discussion": self.discussion_id,
+                    "turn": turn,
+                    "speaker": "bot1" if speaker is self.bot1 else "bot2",
+                    "content": content,
+                }
+            )
+        return any(condition(turn, content) for condition in self.stop_conditions)
+
+    def turns(self):
+        """Yield the ``(turn, speaker, listener)`` of each turn, bot1 speaking first."""
+        speaker, listener = self.bot1, self.bot2
+        for turn in range(self.max_turns):
+            yield turn, speaker, listener
+            speaker, listener = listener, speaker
+
+    def stream_turn(self, speaker: ChatGPTBot, listener: ChatGPTBot):
+        """Yield the deltas of ``speaker``'s response, then pass it to ``listener``.
+
+        The response reaches the listener as soon as the stream ends, so its
+        next turn can start without waiting for anything else.
+        """
+        yield from speaker.stream_response()
+        listener.add_message(ROLE_USER, speaker.messages[-1]["content"])
+
+    async def astream_turn(self, speaker, listener):
+        """Same as ``stream_turn`` for ``AsyncChatGPTBot`` bots."""
+        async for delta in speaker.stream_response():
+            yield delta
+        listener.add_message(ROLE_USER, speaker.messages[-1]["content"])
+
+    def kickoff_discussion(self, opening_message: str) -> int:
+        """Run the discussion, ``opening_message`` being addressed to bot1.
+
+        Returns the number of turns.
+        """
+        self.bot1.add_message(ROLE_USER, opening_message)
+        done = 0
+        for turn, speaker, listener in self.turns():
+            content = speaker.generate_response()
+            listener.add_message(ROLE_USER, content)
+            done = turn + 1
+            if self.record_turn(turn, speaker, content):
+                break
+        return done
+
+    async def akickoff_discussion(self, opening_message: str) -> int:
+        """Same as ``kickoff_discussion`` for ``AsyncChatGPTBot`` bots."""
+        self.bot1.add_message(ROLE_USER, opening_message)
+        done = 0
+        for turn, speaker, listener in self.turns():
+            content = await speaker.generate_response()
+            listener.add_message(ROLE_USER, content)
+            done = turn + 1
+            if self.record_turn(turn, speaker, content):
+                break
+        return done
+
+
+async def run_discussions(discussions, opening_messages, max_concurrency=32) -> list:
+    """Run many ``AsyncChatGPTBot`` discussions concurrently, returning their turn counts.
+
+    Requests are further limited by the bots' clients, so ``max_concurrency``
+    mostly bounds the number of conversations held in memory at once.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(discussion, opening_message):
+        async with semaphore:
+            return await discussion.akickoff_discussion(opening_message)
+
+    return await asyncio.gather(
+        *[run(el, message) for el, message in zip(discussions, opening_messages)]
+    )
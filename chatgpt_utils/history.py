@@ -0,0 +1,110 @@
+"""Conversation history kept within a token budget."""
+from functools import lru_cache
+
+# Tokens taken by the role and separators of each message
+MESSAGE_OVERHEAD = 4
+SUMMARY_ROLE = "system"
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """The ``tiktoken`` encoding of ``model``, ``None`` when tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-3.5-turbo") -> int:
+    """Token count of ``text``, about four characters per token without tiktoken."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
+def message_tokens(message, model="gpt-3.5-turbo") -> int:
+    return count_tokens(message["content"], model) + MESSAGE_OVERHEAD
+
+
+class ConversationHistory:
+    """Messages of a conversation with their token counts, kept under ``max_tokens``.
+
+    Each message is counted once, when added. Messages appended with ``pin``
+    before any other message, the system prompts, are pinned. When the total
+    goes over the budget, the oldest other messages are evicted, always
+    keeping the last ``keep_last`` ones. With ``summarize``, a callable turning a list of
+    messages into a text, evicted messages are folded into a pinned summary
+    instead of being lost.
+    """
+
+    def __init__(
+        self, max_tokens=None, model="gpt-3.5-turbo", summarize=None, keep_last=2
+    ):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.summarize = summarize
+        self.keep_last = keep_last
+        self.clear()
+
+    def clear(self):
+        self.messages = []
+        self.token_counts = []
+        self.total = 0
+        self.pinned = 0
+        self.summary = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, role, content, pin=False):
+        message = {"role": role, "content": content}
+        tokens = message_tokens(message, self.model)
+        if pin and self.pinned == len(self.messages):
+            self.pinned += 1
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.total += tokens
+
+    def request_tokens(self, max_tokens=None) -> int:
+        """Prompt tokens of a request sending the history, plus the completion budget."""
+        return self.total + (max_tokens or 0)
+
+    def compact(self):
+        """Evict, or summarize, the oldest turns until the history fits the budget."""
+        while self.max_tokens is not None and self.total > self.max_tokens:
+            start = self.pinned + (self.summary is not None)
+            end = start
+            freed = 0
+            last = len(self.messages) - self.keep_last
+            while self.total - freed > self.max_tokens and end < last:
+                freed += self.token_counts[end]
+                end += 1
+            if end == start:
+                return
+            evicted = self.messages[start:end]
+            self._remove(start, end)
+            if self.summarize is not None:
+                # The summary takes tokens too, so this may take another pass
+                self._set_summary(evicted)
+
+    def _remove(self, start, end):
+        self.total -= sum(self.token_counts[start:end])
+        del self.messages[start:end]
+        del self.token_counts[start:end]
+
+    def _set_summary(self, evicted):
+        if self.summary is not None:
+            evicted = [self.summary] + evicted
+            self._remove(self.pinned, self.pinned + 1)
+        text = self.summarize(evicted)
+        self.summary = {"role": SUMMARY_ROLE, "content": f"{SUMMARY_PREFIX}{text}"}
+        tokens = message_tokens(self.summary, self.model)
+        self.messages.insert(self.pinned, self.summary)
+        self.token_counts.insert(self.pinned, tokens)
+        self.total += tokens
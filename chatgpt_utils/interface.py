@@ -1,32 +1,200 @@
-import openai
+import time
+
+from chatgpt_utils.cache import completion_key, text_completion
+from chatgpt_utils.history import ConversationHistory
 
 ROLE_ASSISTANT: str = "assistant"
 ROLE_USER: str = "user"
 ROLE_SYSTEM: str = "system"
 
 
+class StreamStats:
+    """Latency of a streamed response, each delta counting as one token."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock()
+        self.first_token = None
+        self.end = None
+        self.tokens = 0
+
+    def record(self):
+        if self.first_token is None:
+            self.first_token = self.clock()
+        self.tokens += 1
+
+    def finish(self):
+        self.end = self.clock()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token is None:
+            return None
+        return self.first_token - self.start
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token is None or self.end is None or self.end == self.first_token:
+            return None
+        return self.tokens / (self.end - self.first_token)
+
+
 class ChatGPTBot:
-    """An interface to the OpenAi chatgpt API."""
+    """An interface to the OpenAi chatgpt API.
 
-    def __init__(self, api_key, model="gpt-3.5-turbo"):
-        openai.api_key = api_key
+    The history is kept under ``max_history_tokens``, see
+    ``ConversationHistory``, and ``on_request`` is called with the token count
+    of each request before it is sent. Completions found in ``cache``, a
+    ``CompletionCache``, are not requested again.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        model="gpt-3.5-turbo",
+        max_history_tokens=None,
+        summarize=None,
+        on_request=None,
+        cache=None,
+    ):
+        self.api_key = api_key
+        self.cache = cache
         self.model = model
-        self.messages = []
+        self.history = ConversationHistory(max_history_tokens, model, summarize)
+        self.on_request = on_request
+        self.request_tokens = None
+        self.stream_stats = None
+
+    @property
+    def messages(self):
+        return self.history.messages
 
     def add_message(self, role, content):
-        self.messages.append({"role": role, "content": content})
+        self.history.append(role, content, pin=role == ROLE_SYSTEM)
+
+    def prepare_request(self, max_tokens=None):
+        """Compact the history and report the token count of the request to send."""
+        self.history.compact()
+        self.request_tokens = self.history.request_tokens(max_tokens)
+        if self.on_request is not None:
+            self.on_request(self.request_tokens)
+        return self.messages
+
+    def cached_response(self, messages):
+        """Return the cache key of the request and the cached response, if any."""
+        if self.cache is None:
+            return None, None
+        key = completion_key(self.model, messages)
+        completion = self.cache.lookup(key)
+        if completion is None:
+            return key, None
+        return key, completion["choices"][0]["message"]["content"]
 
     def generate_response(self):
-        completion = openai.ChatCompletion.create(
-            model=self.model, messages=self.messages
-        )
-        response = completion.choices[0].message.content
-        self.add_message(ChatGPTBot.ASSISTANT, response)
+        messages = self.prepare_request()
+        key, response = self.cached_response(messages)
+        if response is None:
+            import openai
+
+            # The key is passed per request so that bots can use different keys
+            completion = openai.ChatCompletion.create(
+                model=self.model, messages=messages, api_key=self.api_key
+            )
+            response = completion.choices[0].message.content
+            if key is not None:
+                self.cache.put(key, text_completion(response))
+        self.add_message(ROLE_ASSISTANT, response)
         return response
 
+    def stream_response(self):
+        """Yield the response deltas as they arrive.
+
+        The full response is added to the messages once the stream ends, and
+        its latency is kept in ``stream_stats``. A cached response is yielded
+        as a single delta, and a streamed one is cached once complete.
+        """
+        self.stream_stats = StreamStats()
+        messages = self.prepare_request()
+        key, response = self.cached_response(messages)
+        if response is not None:
+            self.stream_stats.record()
+            yield response
+            self.stream_stats.finish()
+            self.add_message(ROLE_ASSISTANT, response)
+            return
+        import openai
+
+        chunks = openai.ChatCompletion.create(
+            model=self.model, messages=messages, api_key=self.api_key, stream=True
+        )
+        deltas = []
+        for chunk in chunks:
+            delta = chunk["choices"][0]["delta"].get("content")
+            if delta:
+                self.stream_stats.record()
+                deltas.append(delta)
+                yield delta
+        self.stream_stats.finish()
+        response = "".join(deltas)
+        if key is not None:
+            self.cache.put(key, text_completion(response))
+        self.add_message(ROLE_ASSISTANT, response)
+
     def add_message_and_generate_response(self, role, content):
         self.add_message(role, content)
         return self.generate_response()
 
     def reset_conversation(self):
-        self.messages = []
+        self.history.clear()
+
+
+class AsyncChatGPTBot(ChatGPTBot):
+    """A bot whose completions go through a shared ``AsyncChatClient``.
+
+    Many bots, possibly with clients using different keys, can then hold
+    conversations concurrently in one event loop.
+    """
+
+    def __init__(
+        self,
+        client,
+        model="gpt-3.5-turbo",
+        max_history_tokens=None,
+        summarize=None,
+        on_request=None,
+        **params,
+    ):
+        super().__init__(None, model, max_history_tokens, summarize, on_request)
+        self.client = client
+        self.params = params
+
+    def prepare_request(self, max_tokens=None):
+        return super().prepare_request(max_tokens or self.params.get("max_tokens"))
+
+    async def generate_response(self):
+        messages = self.prepare_request()
+        # The history counted the messages as they were added
+        completion = await self.client.complete(
+            self.model, messages, prompt_tokens=self.history.total, **self.params
+        )
+        response = completion["choices"][0]["message"]["content"]
+        self.add_message(ROLE_ASSISTANT, response)
+        return response
+
+    async def add_message_and_generate_response(self, role, content):
+        self.add_message(role, content)
+        return await self.generate_response()
+
+    async def stream_response(self):
+        """Yield the response deltas as they arrive, see ``ChatGPTBot.stream_response``."""
+        self.stream_stats = StreamStats()
+        deltas = []
+        messages = self.prepare_request()
+        async for delta in self.client.stream(
+            self.model, messages, prompt_tokens=self.history.total, **self.params
+        ):
+            self.stream_stats.record()
+            deltas.append(delta)
+            yield delta
+        self.stream_stats.finish()
+        self.add_message(ROLE_ASSISTANT, "".join(deltas))
@@ -0,0 +1,176 @@
+"""Persistent, content addressed cache of text embeddings."""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+INDEX_FILE = "index.json"
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embeddings keyed by a hash of the model name and the text.
+
+    Vectors are rows of a memory-mapped matrix stored in ``vectors.npy`` and
+    ``index.json`` maps each key to its row and to the run in which it was last
+    used. When the entries outgrow ``max_bytes``, the least recently used
+    are evicted and their rows reused, and a matrix left larger than
+    ``max_bytes`` is compacted to the live rows on ``save``. The matrix has a single width,
+    so models with embeddings of different sizes need separate caches.
+    """
+
+    def __init__(self, path, dtype="float32", max_bytes=512 * 2**20):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.vectors = None
+        self.entries = {}
+        self.free = []
+        self.generation = 0
+        self.lock = threading.Lock()
+        index_path = os.path.join(path, INDEX_FILE)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        if os.path.exists(index_path) and os.path.exists(vectors_path):
+            with open(index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            self.entries = {key: tuple(val) for key, val in index["entries"].items()}
+            self.free = index["free"]
+            self.generation = index["generation"] + 1
+            self.vectors = np.load(vectors_path, mmap_mode="r+")
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def nbytes(self) -> int:
+        if self.vectors is None:
+            return 0
+        return len(self.entries) * self.vectors.shape[1] * self.vectors.dtype.itemsize
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries[key] = (entry[0], self.generation)
+        return self.vectors[entry[0]]
+
+    def put(self, keys, vectors):
+        vectors = np.asarray(vectors)
+        if self.vectors is not None and vectors.shape[1] != self.vectors.shape[1]:
+            raise ValueError(
+                f"The cache at {self.path} holds embeddings of size {self.vectors.shape[1]}, "
+                f"not {vectors.shape[1]}; use a separate cache directory for this model"
+            )
+        self._reserve(len(keys), vectors.shape[1])
+        for key, vector in zip(keys, vectors):
+            row = self.entries[key][0] if key in self.entries else self.free.pop()
+            self.vectors[row] = vector
+            self.entries[key] = (row, self.generation)
+
+    def _reserve(self, count, dim):
+        """Make sure ``count`` more rows are free, growing the matrix if needed."""
+        if self.vectors is None:
+            capacity = 0
+        else:
+            capacity = len(self.vectors)
+        if len(self.free) >= count:
+            return
+        new_capacity = max(2 * capacity, capacity + count - len(self.free), 1024)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        tmp_path = vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=self.dtype, shape=(new_capacity, dim)
+        )
+        if capacity:
+            grown[:capacity] = self.vectors
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp_path, vectors_path)
+        self.vectors = np.load(vectors_path, mmap_mode="r+")
+        self.free.extend(range(new_capacity - 1, capacity - 1, -1))
+
+    def evict(self):
+        """Drop the least recently used entries until the cache fits ``max_bytes``."""
+        if self.nbytes <= self.max_bytes:
+            return
+        row_bytes = self.vectors.shape[1] * self.vectors.dtype.itemsize
+        keep = self.max_bytes // row_bytes
+        by_age = sorted(self.entries, key=lambda key: self.entries[key][1])
+        for key in by_age[: len(self.entries) - keep]:
+            self.free.append(self.entries.pop(key)[0])
+
+    def compact(self):
+        """Rewrite the matrix with only the live rows when it is larger than ``max_bytes``."""
+        if self.vectors is None:
+            return
+        row_bytes = self.vectors.shape[1] * self.vectors.dtype.itemsize
+        if len(self.vectors) * row_bytes <= self.max_bytes:
+            return
+        keys = sorted(self.entries, key=lambda key: self.entries[key][0])
+        capacity = max(len(keys), 1)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        tmp_path = vectors_path + ".tmp"
+        compacted = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, self.vectors.shape[1])
+        )
+        if keys:
+            compacted[: len(keys)] = self.vectors[[self.entries[key][0] for key in keys]]
+        compacted.flush()
+        del compacted
+        self.vectors = None
+        os.replace(tmp_path, vectors_path)
+        self.vectors = np.load(vectors_path, mmap_mode="r+")
+        self.entries = {key: (i, self.entries[key][1]) for i, key in enumerate(keys)}
+        self.free = list(range(capacity - 1, len(keys) - 1, -1))
+
+    def save(self):
+        self.evict()
+        self.compact()
+        if self.vectors is not None:
+            self.vectors.flush()
+        index_path = os.path.join(self.path, INDEX_FILE)
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "entries": self.entries,
+                    "free": self.free,
+                    "generation": self.generation,
+                },
+                f,
+            )
+        os.replace(index_path + ".tmp", index_path)
+
+    def embed(self, model_name, texts, encode, batch_size=256) -> np.ndarray:
+        """Return the embeddings of ``texts``, encoding only the ones not cached.
+
+        ``encode`` is called on batches of missing texts, or once on all of
+        them without ``batch_size``, so it is never called, and the model
+        never loaded, when every text is cached.
+        """
+        with self.lock:
+            return self._embed(model_name, texts, encode, batch_size)
+
+    def _embed(self, model_name, texts, encode, batch_size):
+        keys = [embedding_key(model_name, text) for text in texts]
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.entries:
+                missing.setdefault(key, texts[i])
+        missing_keys = list(missing)
+        batch_size = batch_size or max(len(missing_keys), 1)
+        for start in range(0, len(missing_keys), batch_size):
+            batch = missing_keys[start : start + batch_size]
+            self.put(batch, encode([missing[key] for key in batch]))
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        result = np.stack([self.get(key) for key in keys]).astype(np.float32)
+        self.save()
+        return result
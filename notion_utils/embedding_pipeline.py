@@ -0,0 +1,99 @@
+"""Batched, multi-process text embedding for large corpora."""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from notion_utils.models import DEFAULT_MODEL, get_model, registry
+
+BATCH_SIZE = 64
+
+
+def length_sorted_batches(texts, batch_size=BATCH_SIZE) -> list:
+    """Split the indices of ``texts`` into batches of texts of similar length.
+
+    Sorting by length keeps the padding added to each batch small.
+    """
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    return [order[start : start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def print_progress(done, total, rate):
+    print(f"Encoded {done}/{total} texts ({rate:.1f} texts/sec)", flush=True)
+
+
+def _init_worker(model_name, backend, quantize, num_threads):
+    registry.configure(idle_timeout=0, num_threads=num_threads)
+    get_model(model_name, backend, quantize)
+
+
+def _encode_batch(model_name, backend, quantize, indices, texts):
+    model = get_model(model_name, backend, quantize)
+    return indices, model.encode(texts, convert_to_numpy=True, batch_size=len(texts))
+
+
+def encode_parallel(
+    texts,
+    model_name=DEFAULT_MODEL,
+    backend="torch",
+    quantize=False,
+    batch_size=BATCH_SIZE,
+    workers=None,
+    out=None,
+    progress=None,
+) -> np.ndarray:
+    """Encode ``texts`` in length sorted batches spread over a process pool.
+
+    Each worker loads the model once and uses its share of the CPU threads.
+    Embeddings are written into ``out`` as batches complete; ``out`` can be
+    a preallocated (possibly memory-mapped) array, otherwise one is created.
+    ``progress`` is called with the number of encoded texts, the total and
+    the throughput in texts per second, e.g. ``print_progress``.
+    """
+    workers = workers or os.cpu_count() or 1
+    batches = length_sorted_batches(texts, batch_size)
+    done = 0
+    start = time.perf_counter()
+
+    def store(indices, embeddings):
+        nonlocal out, done
+        if out is None:
+            out = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+        out[indices] = embeddings
+        done += len(indices)
+        if progress is not None:
+            progress(done, len(texts), done / max(time.perf_counter() - start, 1e-9))
+
+    if workers <= 1 or len(batches) <= 1:
+        for indices in batches:
+            store(
+                *_encode_batch(
+                    model_name, backend, quantize, indices, [texts[i] for i in indices]
+                )
+            )
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, quantize, threads),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _encode_batch,
+                    model_name,
+                    backend,
+                    quantize,
+                    indices,
+                    [texts[i] for i in indices],
+                )
+                for indices in batches
+            ]
+            for future in as_completed(futures):
+                store(*future.result())
+    if out is None:
+        out = np.zeros((0, 0), dtype=np.float32)
+    return out
@@ -0,0 +1,49 @@
+"""Compact export formats for graphs too large to render in a browser."""
+import gzip
+import json
+
+import numpy as np
+
+from notion_utils.layout import graph_arrays
+
+
+def export_json_gz(graph, path):
+    """Gzipped node-link JSON, readable by networkx and most JS graph libraries."""
+    import networkx as nx
+
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(nx.node_link_data(graph, edges="links"), f, default=float)
+
+
+def export_gexf(graph, path):
+    """GEXF, readable by Gephi."""
+    import networkx as nx
+
+    nx.write_gexf(graph, path)
+
+
+def export_npz(graph, path):
+    """Binary edge list: node names plus int32 source/target and float32 weight arrays."""
+    nodes, sources, targets = graph_arrays(graph)
+    weights = np.array(
+        [data.get("weight", 1.0) for _, _, data in graph.edges(data=True)],
+        dtype=np.float32,
+    )
+    np.savez_compressed(
+        path,
+        nodes=np.array([str(node) for node in nodes]),
+        labels=np.array([str(graph.nodes[node].get("label", node)) for node in nodes]),
+        sources=sources.astype(np.int32),
+        targets=targets.astype(np.int32),
+        weights=weights,
+        directed=graph.is_directed(),
+    )
+
+
+EXPORT_FORMATS = {"json.gz": export_json_gz, "gexf": export_gexf, "npz": export_npz}
+
+
+def export_graph(graph, path, fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Export format {fmt} not in {list(EXPORT_FORMATS)}")
+    EXPORT_FORMATS[fmt](graph, path)
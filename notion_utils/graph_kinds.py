@@ -0,0 +1,25 @@
+"""Graph kinds by name, their builders imported only when a graph is built.
+
+The builders pull in networkx, pandas, pyvis and the embedding model, so the
+CLI and the app list the kinds from here without paying for those imports.
+"""
+from importlib import import_module
+
+GRAPH_KINDS = {
+    "relations_graph": "notion_utils.network_graph:NetworkGraphRelation",
+    "correlations_graph": "notion_utils.network_graph:NetworkGraphCorrelation",
+}
+GRAPH_NAMES_STRING = ", ".join(GRAPH_KINDS)
+
+
+def register_graph_kind(name, target):
+    """Register a builder as ``"module:ClassName"``, imported on first use."""
+    GRAPH_KINDS[name] = target
+
+
+def get_graph_kind(name):
+    """Import and return the builder class of a graph kind."""
+    if name not in GRAPH_KINDS:
+        raise ValueError(f"Graph name {name} not in {list(GRAPH_KINDS)}")
+    module_name, _, class_name = GRAPH_KINDS[name].partition(":")
+    return getattr(import_module(module_name), class_name)
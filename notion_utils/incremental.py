@@ -0,0 +1,217 @@
+"""Incremental maintenance of the relation and similarity graphs."""
+import hashlib
+import json
+import os
+
+import networkx as nx
+import numpy as np
+
+from notion_utils.neighbours import ExactIndex, load_index
+from notion_utils.similarity import BLOCK_SIZE
+
+RELATIONS_FILE = "relations.json"
+SIMILARITIES_FILE = "similarities.json"
+EMBEDDINGS_FILE = "embeddings.npz"
+META_FILE = "meta.json"
+
+
+def text_hash(record: dict) -> str:
+    text = f"{record['title']}{record['summary']}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IncrementalGraphs:
+    """Relation and similarity graphs updated from changesets of pages.
+
+    Both graphs are keyed by page id with the title as label. Applying a
+    changeset only touches the edges of the changed pages: relation edges are
+    rebuilt from their ``children``, and similarity edges are recomputed for
+    the pages whose text changed, against the embeddings of the rest of the
+    corpus. The state is persisted in the ``path`` directory, along with the
+    ``watermark`` of the last changeset, so that it only moves forward once
+    the graphs it produced are saved. Loading the state with another
+    ``cutoff`` rescores the similarity graph from the stored embeddings.
+    """
+
+    def __init__(self, path, encode, cutoff=0.5):
+        self.path = path
+        self.encode = encode
+        self.cutoff = cutoff
+        self.relations = nx.DiGraph()
+        self.similarities = nx.Graph()
+        self.embeddings = ExactIndex()
+        self.text_hashes = {}
+        # Parents listing a child page that is not known yet, and the reverse
+        self.pending = {}
+        self.waiting = {}
+        self.watermark = None
+        self.rescored = False
+        if os.path.exists(os.path.join(path, META_FILE)):
+            self.load()
+            if self.cutoff != cutoff:
+                self.rescore(cutoff)
+
+    def load(self):
+        with open(os.path.join(self.path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.cutoff = meta["cutoff"]
+        self.watermark = meta.get("watermark")
+        self.text_hashes = meta["text_hashes"]
+        self.pending = {key: set(val) for key, val in meta["pending"].items()}
+        for child, parents in self.pending.items():
+            for parent in parents:
+                self.waiting.setdefault(parent, set()).add(child)
+        for name, graph_type in [(RELATIONS_FILE, nx.DiGraph), (SIMILARITIES_FILE, nx.Graph)]:
+            with open(os.path.join(self.path, name), encoding="utf-8") as f:
+                graph = nx.node_link_graph(json.load(f), edges="links")
+            setattr(self, "relations" if name == RELATIONS_FILE else "similarities", graph_type(graph))
+        embeddings_path = os.path.join(self.path, EMBEDDINGS_FILE)
+        if os.path.exists(embeddings_path):
+            self.embeddings = load_index(embeddings_path)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name, graph in [(RELATIONS_FILE, self.relations), (SIMILARITIES_FILE, self.similarities)]:
+            with open(os.path.join(self.path, name), "w", encoding="utf-8") as f:
+                json.dump(nx.node_link_data(graph, edges="links"), f, default=float)
+        if self.embeddings.vectors is not None:
+            self.embeddings.save(os.path.join(self.path, EMBEDDINGS_FILE))
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "cutoff": self.cutoff,
+                    "watermark": self.watermark,
+                    "text_hashes": self.text_hashes,
+                    "pending": {key: sorted(val) for key, val in self.pending.items()},
+                },
+                f,
+            )
+
+    def apply(self, records, deleted=(), full=False) -> set:
+        """Apply upserted ``records`` and ``deleted`` page ids to both graphs.
+
+        With ``full`` the records are every page, and the known pages missing
+        from them are deleted too. Returns the names of the graphs that changed.
+        """
+        if full:
+            seen = {record["id"] for record in records}
+            missing = [page_id for page_id in self.text_hashes if page_id not in seen]
+            deleted = set(deleted).union(missing)
+        changed = set()
+        if self.rescored:
+            changed.add("similarities")
+            self.rescored = False
+        if self._delete(deleted):
+            changed.update(["relations", "similarities"])
+        if self._update_relations(records):
+            changed.add("relations")
+        if self._update_similarities(records):
+            changed.add("similarities")
+        return changed
+
+    def rescore(self, cutoff):
+        """Rebuild the similarity graph at ``cutoff`` from the stored embeddings."""
+        self.cutoff = cutoff
+        self.similarities = nx.Graph()
+        if self.embeddings.vectors is not None:
+            alive = np.flatnonzero(self.embeddings.alive)
+            self._link([self.embeddings.ids[i] for i in alive])
+        self.rescored = True
+
+    def _drop_pending(self, parent, keep=()):
+        """Forget that ``parent`` waits for children, except those in ``keep``."""
+        children = self.waiting.pop(parent, set())
+        for child in children - set(keep):
+            self.pending[child].discard(parent)
+            if not self.pending[child]:
+                del self.pending[child]
+        if children & set(keep):
+            self.waiting[parent] = children & set(keep)
+
+    def _delete(self, deleted) -> bool:
+        deleted = [page_id for page_id in deleted if page_id in self.text_hashes]
+        for page_id in deleted:
+            self._drop_pending(page_id)
+            for children in [self.relations, self.similarities]:
+                if page_id in children:
+                    children.remove_node(page_id)
+            del self.text_hashes[page_id]
+        self.embeddings.remove(deleted)
+        return bool(deleted)
+
+    def _update_relations(self, records) -> bool:
+        graph = self.relations
+        before = graph.number_of_edges(), graph.number_of_nodes()
+        changed = False
+        for record in records:
+            page_id = record["id"]
+            if graph.nodes.get(page_id, {}).get("label") != str(record["title"]):
+                changed = True
+            graph.add_node(page_id, label=str(record["title"]))
+            old_children = set(graph.successors(page_id))
+            new_children = set(record["children"])
+            if old_children != {child for child in new_children if child in graph}:
+                changed = True
+            graph.remove_edges_from([(page_id, child) for child in old_children])
+            self._drop_pending(page_id, keep=new_children)
+            for child in new_children:
+                if child in graph:
+                    graph.add_edge(page_id, child)
+                else:
+                    self.pending.setdefault(child, set()).add(page_id)
+                    self.waiting.setdefault(page_id, set()).add(child)
+            for parent in self.pending.pop(page_id, ()):
+                self.waiting[parent].discard(page_id)
+                if parent in graph:
+                    graph.add_edge(parent, page_id)
+                    changed = True
+        return changed or before != (graph.number_of_edges(), graph.number_of_nodes())
+
+    def _update_similarities(self, records) -> bool:
+        graph = self.similarities
+        changed = False
+        stale = []
+        for record in records:
+            page_id = record["id"]
+            digest = text_hash(record)
+            if self.text_hashes.get(page_id) != digest:
+                stale.append(record)
+                self.text_hashes[page_id] = digest
+            if page_id in graph and graph.nodes[page_id].get("label") != str(record["title"]):
+                graph.nodes[page_id]["label"] = str(record["title"])
+                changed = True
+        if not stale:
+            return changed
+        ids = [record["id"] for record in stale]
+        self.embeddings.upsert(
+            ids, self.encode([f"{el['title']}{el['summary']}" for el in stale])
+        )
+        for page_id in ids:
+            if page_id in graph:
+                graph.remove_edges_from(list(graph.edges(page_id)))
+                changed = True
+        return self._link(ids) or changed
+
+    def _link(self, ids) -> bool:
+        """Add the similarity edges of the pages ``ids`` to every other page."""
+        graph = self.similarities
+        labels = self.relations.nodes
+        changed = False
+        alive = np.flatnonzero(self.embeddings.alive)
+        vectors = self.embeddings.vectors
+        rows = np.array([self.embeddings.positions[page_id] for page_id in ids])
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block_rows = rows[start : start + BLOCK_SIZE]
+            scores = vectors[block_rows] @ vectors[alive].T
+            query_idx, member_idx = np.nonzero(scores > self.cutoff)
+            for i, j in zip(query_idx, member_idx):
+                source, target = self.embeddings.ids[block_rows[i]], self.embeddings.ids[alive[j]]
+                if source == target:
+                    continue
+                for node in (source, target):
+                    if node not in graph:
+                        graph.add_node(node, label=labels[node].get("label", node) if node in labels else node)
+                graph.add_edge(source, target, weight=float(scores[i, j]))
+                changed = True
+        graph.remove_nodes_from([node for node in ids if graph.degree(node) == 0])
+        return changed
@@ -0,0 +1,127 @@
+"""Server-side force-directed graph layout."""
+import hashlib
+import os
+
+import numpy as np
+
+EXACT_LIMIT = 1000
+
+
+def graph_arrays(graph):
+    """Return the node list and the (sources, targets) index arrays of a networkx graph."""
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array(
+        [(index[u], index[v]) for u, v in graph.edges], dtype=np.int64
+    ).reshape(-1, 2)
+    return nodes, edges[:, 0], edges[:, 1]
+
+
+def _exact_repulsion(pos, k2, block_size=1024):
+    disp = np.zeros_like(pos)
+    x, y = pos[:, 0], pos[:, 1]
+    for start in range(0, len(pos), block_size):
+        dx = x[start : start + block_size, None] - x[None, :]
+        dy = y[start : start + block_size, None] - y[None, :]
+        dist2 = dx * dx + dy * dy
+        dist2[dist2 == 0] = np.inf
+        weight = k2 / dist2
+        disp[start : start + block_size, 0] = (dx * weight).sum(axis=1)
+        disp[start : start + block_size, 1] = (dy * weight).sum(axis=1)
+    return disp
+
+
+def _grid_repulsion(pos, k2, block_size=4096):
+    """Approximate the repulsion Barnes-Hut style with a single level grid.
+
+    Nodes in the same cell repel each other exactly, the other cells act as
+    point masses at their centroid.
+    """
+    n = len(pos)
+    cells_per_side = max(2, int(np.sqrt(np.sqrt(n) * 4)))
+    # Percentiles rather than extremes, so that a few outliers do not squeeze
+    # every other node into a handful of cells
+    low, high = np.percentile(pos, [1, 99], axis=0)
+    scaled = (pos - low) / np.maximum(high - low, 1e-9)
+    cell_xy = np.clip((scaled * cells_per_side).astype(np.int64), 0, cells_per_side - 1)
+    cell = cell_xy[:, 0] * cells_per_side + cell_xy[:, 1]
+    occupied, cell, mass = np.unique(cell, return_inverse=True, return_counts=True)
+    centroids = np.zeros((len(occupied), 2))
+    np.add.at(centroids, cell, pos)
+    centroids /= mass[:, None]
+
+    # Far field: every other cell acts as a point mass
+    disp = np.zeros_like(pos)
+    x, y = pos[:, 0], pos[:, 1]
+    for start in range(0, n, block_size):
+        block = slice(start, start + block_size)
+        dx = x[block, None] - centroids[None, :, 0]
+        dy = y[block, None] - centroids[None, :, 1]
+        dist2 = dx * dx + dy * dy
+        dist2[np.arange(len(dist2)), cell[block]] = np.inf
+        dist2[dist2 == 0] = np.inf
+        weight = k2 * mass / dist2
+        disp[block, 0] = (dx * weight).sum(axis=1)
+        disp[block, 1] = (dy * weight).sum(axis=1)
+
+    # Near field: exact repulsion between the nodes of each cell
+    order = np.argsort(cell, kind="stable")
+    for members in np.split(order, np.cumsum(mass)[:-1]):
+        if len(members) > 1:
+            disp[members] += _exact_repulsion(pos[members], k2)
+    return disp
+
+
+def force_layout(n, sources, targets, iterations=100, seed=0, exact_limit=EXACT_LIMIT):
+    """Compute node positions with a vectorized Fruchterman-Reingold layout.
+
+    Repulsion is exact up to ``exact_limit`` nodes and approximated with a
+    grid above. Returns an ``(n, 2)`` array of positions in ``[-1, 1]``.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-1, 1, size=(n, 2))
+    if n <= 1:
+        return pos * 0
+    k = 2 / np.sqrt(n)
+    temperature = 0.2
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        if n <= exact_limit:
+            disp = _exact_repulsion(pos, k**2)
+        else:
+            disp = _grid_repulsion(pos, k**2)
+        delta = pos[sources] - pos[targets]
+        dist = np.linalg.norm(delta, axis=1, keepdims=True)
+        attraction = delta * dist / k
+        np.add.at(disp, sources, -attraction)
+        np.add.at(disp, targets, attraction)
+        length = np.linalg.norm(disp, axis=1, keepdims=True)
+        length[length == 0] = 1
+        pos += disp / length * np.minimum(length, temperature)
+        temperature -= cooling
+    pos -= pos.mean(axis=0)
+    return pos / max(np.abs(pos).max(), 1e-9)
+
+
+def graph_key(nodes, sources, targets) -> str:
+    digest = hashlib.sha256()
+    digest.update("\0".join(map(str, nodes)).encode("utf-8"))
+    digest.update(np.ascontiguousarray(sources).tobytes())
+    digest.update(np.ascontiguousarray(targets).tobytes())
+    return digest.hexdigest()
+
+
+def compute_layout(graph, cache_dir=None, iterations=100) -> dict:
+    """Return ``{node: (x, y)}`` for a networkx graph, cached per graph in ``cache_dir``."""
+    nodes, sources, targets = graph_arrays(graph)
+    path = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        key = graph_key(nodes, sources, targets)
+        path = os.path.join(cache_dir, f"{key}-{iterations}.npy")
+        if os.path.exists(path):
+            return dict(zip(nodes, np.load(path)))
+    pos = force_layout(len(nodes), sources, targets, iterations)
+    if path:
+        np.save(path, pos)
+    return dict(zip(nodes, pos))
@@ -1,15 +1,19 @@
-"""Main module to draw a notes graph from Notion."""
+"""Main module to draw a notes graph from Notion.
+
+Only what the options need is imported here, the commands import the rest
+so that ``--help`` and ``list-databases`` start without loading pandas,
+networkx, pyvis or the embedding model.
+"""
+import os
 import typer
 from typing import List
-from notion_utils.notion_api import NotionAPI, list_databases
-from notion_utils.network_graph import NetworkGraphCorrelation, NetworkGraphRelation
+from notion_utils.export import EXPORT_FORMATS
+from notion_utils.graph_kinds import GRAPH_NAMES_STRING, get_graph_kind
+from notion_utils.neighbours import BACKENDS
+from notion_utils.tracing import TRACE_FORMATS, tracer
 
 app = typer.Typer()
 
-AVAILABLE_GRAPHS = [NetworkGraphRelation, NetworkGraphCorrelation]
-AVAILABLE_GRAPHS_NAMES = [gr.name for gr in AVAILABLE_GRAPHS]
-GRAPH_NAMES_STRING = ", ".join(AVAILABLE_GRAPHS_NAMES)
-
 
 @app.command("draw_graph")
 def main(
@@ -18,6 +22,16 @@ def main(
         0.5,
         help="Correlation cutoff for when we draw the graph with the correlation matrix",
     ),
+    cutoffs: str = typer.Option(
+        "",
+        help="Comma separated correlation cutoffs, one correlation graph is "
+        "drawn per cutoff, overrides --cutoff",
+    ),
+    top_k: int = typer.Option(
+        0,
+        help="Only link each page to its top k most similar pages in the "
+        "correlation graph, 0 to link every pair above the cutoff",
+    ),
     overlap: int = typer.Option(-1000, help="Overlap for force atlas 2 based"),
     graph_kinds: str = typer.Option(
         GRAPH_NAMES_STRING,
@@ -26,36 +40,292 @@ def main(
     children_name: str = typer.Option(
         "Child Task", help="Name of the children property in Notion"
     ),
-    database_name: str = typer.Option("GTD Tasks", help="Notion database"),
+    database_name: str = typer.Option(
+        "GTD Tasks", help="Notion database, or comma separated databases"
+    ),
     file_prefix: str = typer.Option("", help="Prefix for the output files"),
+    partitions: str = typer.Option(
+        "",
+        help="Comma separated ISO 8601 created_time boundaries used to fetch "
+        "the database in concurrent partitions",
+    ),
+    max_workers: int = typer.Option(4, help="Number of concurrent fetch workers"),
+    store_path: str = typer.Option(
+        "",
+        help="SQLite file caching the pages between runs, only pages edited "
+        "since the last run are fetched",
+    ),
+    full_sync: bool = typer.Option(
+        False,
+        help="Fetch every page into --store-path again, dropping the pages deleted "
+        "in Notion, which incremental syncs do not see",
+    ),
+    embedding_cache: str = typer.Option(
+        "", help="Directory caching the page embeddings between runs"
+    ),
+    embedding_cache_mb: int = typer.Option(
+        512, help="Size budget of the embedding cache in MB"
+    ),
+    neighbour_backend: str = typer.Option(
+        "",
+        help="Neighbour index used by the correlation graph, one of "
+        f"{', '.join(BACKENDS)}, empty for a plain blockwise computation",
+    ),
+    index_path: str = typer.Option(
+        "", help="npz file persisting the neighbour index between runs"
+    ),
+    n_probe: int = typer.Option(4, help="Clusters probed by the ivf index"),
+    report_recall: bool = typer.Option(
+        False, help="Report the recall of the neighbour index against exact search"
+    ),
+    model_backend: str = typer.Option(
+        "torch", help="Inference backend of the embedding model, torch or onnx"
+    ),
+    quantize: bool = typer.Option(False, help="Use int8 quantized model weights"),
+    model_threads: int = typer.Option(0, help="CPU threads used by the model, 0 for all"),
+    embedding_workers: int = typer.Option(
+        1, help="Processes encoding the pages, 0 for one per CPU core"
+    ),
+    precompute_layout: bool = typer.Option(
+        False, help="Compute the node positions server-side and disable physics"
+    ),
+    layout_cache: str = typer.Option(
+        "", help="Directory caching the precomputed node positions"
+    ),
+    export_format: str = typer.Option(
+        "html",
+        help=f"Output format, html or one of {', '.join(EXPORT_FORMATS)} for huge graphs",
+    ),
+    analytics: bool = typer.Option(
+        False,
+        help="Size the nodes by PageRank, colour them by community and print "
+        "the components, degrees and deepest chains of each graph",
+    ),
+    trace: str = typer.Option(
+        "", help="File where the timings, counts and peak memory of each stage are saved"
+    ),
+    trace_format: str = typer.Option(
+        "json", help=f"Format of the trace, one of {', '.join(TRACE_FORMATS)}"
+    ),
 ):
-    graph_kinds = graph_kinds.split(",")
-    for input_graph_name in graph_kinds:
-        if input_graph_name not in AVAILABLE_GRAPHS_NAMES:
-            raise ValueError(
-                f"Graph name {input_graph_name} not in {AVAILABLE_GRAPHS_NAMES}"
-            )
+    from notion_utils.analytics import GraphAnalytics
+    from notion_utils.embedding_cache import EmbeddingCache
+    from notion_utils.export import export_graph
+    from notion_utils.models import registry
+    from notion_utils.neighbours import IVFIndex, load_index
+    from notion_utils.notion_api import NotionAPI
+    from notion_utils.page_store import PageStore
+    from notion_utils.pipeline import GraphPipeline, slugify
+
+    graph_kinds = list(dict.fromkeys(el.strip() for el in graph_kinds.split(",")))
+    graph_builders = [get_graph_kind(el) for el in graph_kinds]
     print(graph_kinds)
-    # Get data from Notion API
-    notion_api = NotionAPI(token, database_name)
-    data, id_to_title = notion_api.full_process(children_name)
+    recording = tracer.start() if trace else None
+    registry.configure(num_threads=model_threads or None)
+    databases = database_name.split(",")
+    boundaries = [el for el in partitions.split(",") if el]
+    store = PageStore(store_path) if store_path else None
+    cache = None
+    if embedding_cache:
+        cache = EmbeddingCache(embedding_cache, max_bytes=embedding_cache_mb * 2**20)
+    indexes = {}
+
+    def fetch(database):
+        # Get data from Notion API
+        notion_api = NotionAPI(token, database, max_workers=max_workers)
+        return notion_api.record_store(children_name, boundaries, store, full=full_sync)
+
+    def get_index_path(database):
+        if not index_path or len(databases) == 1:
+            return index_path
+        root, ext = os.path.splitext(index_path)
+        return f"{root}_{slugify(database)}{ext}"
 
-    # Build and display graph
-    for GraphBuilder in AVAILABLE_GRAPHS:
-        name = GraphBuilder.name
-        if name in graph_kinds:
-            filename = f"{file_prefix}_{name}.html"
-            network_graph = GraphBuilder(data, id_to_title)
-            graph = network_graph.build_graph(cutoff=cutoff)
-            typer.echo(f"Saving {name} graph in {filename}")
-            network_graph.save_graph_in_html(graph, filename, overlap=overlap)
+    def builder_options(GraphBuilder, database):
+        if not GraphBuilder.uses_cutoff:
+            return {}
+        path = get_index_path(database)
+        index = None
+        if path and os.path.exists(path):
+            index = load_index(path)
+            if neighbour_backend and index.name != neighbour_backend:
+                typer.echo(
+                    f"Warning: {path} holds a {index.name} index, so --neighbour-backend "
+                    f"{neighbour_backend} is ignored; remove the file to switch backend",
+                    err=True,
+                )
+            if isinstance(index, IVFIndex) and index.n_probe != n_probe:
+                # Only used when searching, so it can change between runs
+                typer.echo(
+                    f"Probing {n_probe} clusters instead of the {index.n_probe} saved in {path}"
+                )
+                index.n_probe = n_probe
+        elif neighbour_backend == IVFIndex.name:
+            index = IVFIndex(n_probe=n_probe)
+        elif neighbour_backend:
+            index = BACKENDS[neighbour_backend]()
+        indexes[database] = index
+        return {
+            "cache": cache,
+            "index": index,
+            "backend": model_backend,
+            "quantize": quantize,
+            "workers": embedding_workers or os.cpu_count(),
+        }
+
+    def render(network_graph, graph, filename):
+        if analytics:
+            summary = GraphAnalytics.from_graph(graph).annotate(graph)
+            typer.echo(
+                f"{filename}: {summary['nodes']} nodes, {summary['edges']} edges, "
+                f"{summary['components']} components (largest {summary['largest_component']}), "
+                f"{summary['communities']} communities, "
+                f"mean degree {summary['degrees']['mean']:.2f}, "
+                f"top pages {', '.join(map(str, summary['top_pagerank']))}"
+            )
+            for chain in summary.get("deepest_chains", []):
+                typer.echo(f"  chain of {len(chain)}: {' > '.join(map(str, chain))}")
+        typer.echo(f"Saving {network_graph.name} graph in {filename}")
+        if export_format == "html":
+            network_graph.save_graph_in_html(
+                graph,
+                filename,
+                overlap=overlap,
+                layout=precompute_layout,
+                layout_cache=layout_cache or None,
+            )
+        else:
+            export_graph(graph, filename, export_format)
+
+    # Build and display graphs
+    pipeline = GraphPipeline(
+        fetch,
+        graph_builders,
+        render,
+        builder_options=builder_options,
+        cutoffs=[float(el) for el in cutoffs.split(",") if el] or [cutoff],
+        build_kwargs={"top_k": top_k},
+        max_workers=max_workers,
+    )
+    with tracer.span("pipeline.run", databases=len(databases)):
+        pipeline.run(databases, file_prefix, export_format)
+    if len(pipeline.cutoffs) > 1 and not top_k:
+        for (database, name), network_graph in pipeline.built.items():
+            if not hasattr(network_graph, "sweep"):
+                continue
+            for stats in network_graph.sweep(pipeline.cutoffs):
+                typer.echo(
+                    f"{database} {name} cutoff {stats['cutoff']:g}: "
+                    f"{stats['edges']} edges, {stats['nodes']} nodes, "
+                    f"{stats['components']} components "
+                    f"(largest {stats['largest_component']})"
+                )
+    for database, index in indexes.items():
+        if index is None:
+            continue
+        if report_recall:
+            recall = index.recall(pipeline.cutoffs[0])
+            typer.echo(f"Neighbour index recall for {database}: {recall:.3f}")
+        if get_index_path(database):
+            index.save(get_index_path(database))
+    if recording is not None:
+        tracer.stop(recording)
+        recording.export(trace, trace_format)
+        for stage in recording.summary():
+            memory = ""
+            if stage["max_rss_delta_mb"] is not None:
+                memory += f", RSS {stage['max_rss_delta_mb']:+.0f}MB"
+            if stage["process_peak_rss_mb"] is not None:
+                memory += f", process peak RSS {stage['process_peak_rss_mb']:.0f}MB"
+            typer.echo(
+                f"{stage['name']}: {stage['total_s']:.3f}s in {stage['calls']} calls{memory}"
+            )
+
+
+@app.command("refresh_graphs")
+def refresh_graphs(
+    token: str = typer.Option(..., help="Your Notion token"),
+    store_path: str = typer.Option(..., help="SQLite file caching the pages between runs"),
+    state_dir: str = typer.Option(..., help="Directory persisting the graphs between runs"),
+    full_sync: bool = typer.Option(
+        False,
+        help="Fetch every page again, dropping the pages deleted in Notion, "
+        "which incremental syncs do not see",
+    ),
+    cutoff: float = typer.Option(0.5, help="Correlation cutoff of the correlation graph"),
+    children_name: str = typer.Option(
+        "Child Task", help="Name of the children property in Notion"
+    ),
+    database_name: str = typer.Option("GTD Tasks", help="Notion database"),
+    file_prefix: str = typer.Option("", help="Prefix for the output files"),
+    overlap: int = typer.Option(-1000, help="Overlap for force atlas 2 based"),
+    embedding_cache: str = typer.Option(
+        "", help="Directory caching the page embeddings between runs"
+    ),
+    model_backend: str = typer.Option(
+        "torch", help="Inference backend of the embedding model, torch or onnx"
+    ),
+    quantize: bool = typer.Option(False, help="Use int8 quantized model weights"),
+):
+    """Apply the pages changed since the last run to the persisted graphs.
+
+    Graphs are only rendered again when the changes touched them.
+    """
+    from notion_utils.embedding_cache import EmbeddingCache
+    from notion_utils.incremental import IncrementalGraphs
+    from notion_utils.notion_api import NotionAPI
+    from notion_utils.page_store import PageStore
+    from notion_utils.pipeline import graph_filename
+
+    NetworkGraphRelation = get_graph_kind("relations_graph")
+    NetworkGraphCorrelation = get_graph_kind("correlations_graph")
+    cache = EmbeddingCache(embedding_cache) if embedding_cache else None
+    builder = NetworkGraphCorrelation(
+        [], cache=cache, backend=model_backend, quantize=quantize
+    )
+
+    def encode(texts):
+        if cache is None:
+            return builder.encode(texts)
+        return cache.embed(builder.model_name, texts, builder.encode)
+
+    graphs = IncrementalGraphs(state_dir, encode, cutoff)
+    notion_api = NotionAPI(token, database_name)
+    since = None if full_sync else graphs.watermark
+    records, deleted, watermark = notion_api.changes(
+        PageStore(store_path), children_name, since=since
+    )
+    changed = graphs.apply(records, deleted, full=since is None)
+    # Only saved along with the graphs, so a crash before refetches the changes
+    graphs.watermark = watermark
+    graphs.save()
+    for graph_name, graph_builder in [
+        ("relations", NetworkGraphRelation),
+        ("similarities", NetworkGraphCorrelation),
+    ]:
+        if graph_name not in changed:
+            continue
+        filename = graph_filename(file_prefix, graph_builder.name)
+        typer.echo(f"Saving {graph_builder.name} graph in {filename}")
+        builder.save_graph_in_html(getattr(graphs, graph_name), filename, overlap=overlap)
+    if not changed:
+        typer.echo("No changes")
 
 
 @app.command("list-databases")
-def list_databases_command(token: str = typer.Option(..., help="Your Notion token")):
-    # TODO : make it work
-    databases = list_databases(token)
-    for key, val in databases.items():
+def list_databases_command(
+    token: str = typer.Option(..., help="Your Notion token"),
+    full_refresh: bool = typer.Option(
+        False, help="Search the whole workspace again, dropping deleted databases"
+    ),
+):
+    """List the databases having a self relation, from the cached schema index."""
+    from notion_utils.notion_api import get_schema_index, sync_databases
+
+    index = get_schema_index(token)
+    if full_refresh:
+        sync_databases(token, index, full=True)
+    for key, val in index.databases().items():
         if val["self_relation_properties"]:
             typer.echo(f"{key} : {val}")
 
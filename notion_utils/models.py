@@ -0,0 +1,99 @@
+"""Process-wide registry of sentence transformer models."""
+import threading
+import time
+
+from notion_utils.tracing import tracer
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+QUANTIZED_ONNX_FILE = "onnx/model_qint8_avx512.onnx"
+
+
+class ModelRegistry:
+    """Load each model once, on first use, and share it between builders.
+
+    Models unused for ``idle_timeout`` seconds are unloaded by a background
+    timer. ``num_threads`` caps the CPU threads used by torch. With the
+    ``onnx`` backend inference runs through ONNX Runtime, and ``quantize``
+    selects int8 weights (dynamic quantization of the linear layers for torch,
+    the quantized export for ONNX).
+    """
+
+    def __init__(self, idle_timeout=600, num_threads=None):
+        self.idle_timeout = idle_timeout
+        self.num_threads = num_threads
+        self._models = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def configure(self, idle_timeout=None, num_threads=None):
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+        if num_threads is not None:
+            self.num_threads = num_threads
+
+    def get(self, model_name=DEFAULT_MODEL, backend="torch", quantize=False):
+        key = (model_name, backend, quantize)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                with tracer.span("model.load", model=model_name, backend=backend):
+                    entry = self._models[key] = [self._load(*key), None]
+            entry[1] = time.monotonic()
+            self._schedule_unload()
+            return entry[0]
+
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._models)
+
+    def _load(self, model_name, backend, quantize):
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads:
+            import torch
+
+            torch.set_num_threads(self.num_threads)
+        if backend == "onnx":
+            model_kwargs = {"file_name": QUANTIZED_ONNX_FILE} if quantize else None
+            return SentenceTransformer(
+                model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs
+            )
+        model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            import torch
+
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return model
+
+    def unload_idle(self, now=None):
+        """Unload the models unused for more than ``idle_timeout`` seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for key, (_, last_used) in list(self._models.items()):
+                if now - last_used > self.idle_timeout:
+                    del self._models[key]
+            self._timer = None
+            self._schedule_unload()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule_unload(self):
+        if self._timer is not None or not self._models or not self.idle_timeout:
+            return
+        self._timer = threading.Timer(self.idle_timeout, self.unload_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_name=DEFAULT_MODEL, backend="torch", quantize=False):
+    return registry.get(model_name, backend, quantize)
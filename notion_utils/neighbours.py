@@ -0,0 +1,238 @@
+"""Persistent neighbour search indexes over page embeddings."""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from notion_utils.similarity import BLOCK_SIZE, normalize, threshold_pairs
+
+
+class NeighbourIndex(ABC):
+    """Base class of the neighbour search backends.
+
+    An index keeps the normalized embedding of every page, keyed by page id,
+    and is updated in place with ``upsert`` and ``remove`` so that pages can
+    be added between runs without a rebuild.
+    """
+
+    name: str = None
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.vectors = None
+        self.alive = np.zeros(0, dtype=bool)
+
+    def upsert(self, ids, embeddings):
+        """Add new pages and replace the embeddings of the known ones."""
+        embeddings = normalize(embeddings)
+        if self.vectors is None:
+            self.vectors = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+        new_ids = [page_id for page_id in ids if page_id not in self.positions]
+        start = len(self.ids)
+        for i, page_id in enumerate(dict.fromkeys(new_ids)):
+            self.positions[page_id] = start + i
+            self.ids.append(page_id)
+        grow = len(self.ids) - len(self.vectors)
+        self.vectors = np.vstack(
+            [self.vectors, np.zeros((grow, self.vectors.shape[1]), dtype=np.float32)]
+        )
+        self.alive = np.concatenate([self.alive, np.zeros(grow, dtype=bool)])
+        rows = np.array([self.positions[page_id] for page_id in ids], dtype=np.int64)
+        self.vectors[rows] = embeddings
+        self.alive[rows] = True
+        self._on_update(rows)
+
+    def remove(self, ids):
+        rows = [self.positions[page_id] for page_id in ids if page_id in self.positions]
+        self.alive[rows] = False
+
+    def retain(self, ids):
+        """Remove every page whose id is not in ``ids``."""
+        keep = set(ids)
+        self.remove([page_id for page_id in self.ids if page_id not in keep])
+
+    def _on_update(self, rows):
+        pass
+
+    @abstractmethod
+    def search_pairs(self, cutoff=0.5):
+        """Return the ``(rows, cols, scores)`` of the live pairs above ``cutoff``."""
+        pass
+
+    def recall(self, cutoff=0.5, sample_size=1000, seed=0) -> float:
+        """Estimate the share of the exact pairs above ``cutoff`` that are found.
+
+        The exact pairs are computed for a random sample of pages only.
+        """
+        alive = np.flatnonzero(self.alive)
+        if len(alive) == 0:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(alive, min(sample_size, len(alive)), replace=False)
+        rows, cols, _ = self.search_pairs(cutoff)
+        found = set(zip(rows.tolist(), cols.tolist()))
+        expected = total = 0
+        for start in range(0, len(sample), BLOCK_SIZE):
+            queries = sample[start : start + BLOCK_SIZE]
+            scores = self.vectors[queries] @ self.vectors[alive].T
+            query_idx, member_idx = np.nonzero(scores > cutoff)
+            for i, j in zip(queries[query_idx], alive[member_idx]):
+                if i == j:
+                    continue
+                total += 1
+                expected += (min(i, j), max(i, j)) in found
+        return expected / total if total else 1.0
+
+    def state(self) -> dict:
+        return {}
+
+    def save(self, path):
+        # Through a file, as np.savez appends .npz to paths lacking it
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                backend=self.name,
+                ids=np.array(self.ids, dtype=str),
+                vectors=self.vectors,
+                alive=self.alive,
+                **self.state(),
+            )
+
+    @classmethod
+    def from_state(cls, state):
+        return cls()
+
+
+class ExactIndex(NeighbourIndex):
+    """Exact blockwise search, O(n^2) but with every pair found."""
+
+    name = "exact"
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        super().__init__()
+        self.block_size = block_size
+
+    def search_pairs(self, cutoff=0.5):
+        alive = np.flatnonzero(self.alive)
+        rows, cols, scores = threshold_pairs(
+            self.vectors[alive], cutoff, self.block_size
+        )
+        return alive[rows], alive[cols], scores
+
+
+class IVFIndex(NeighbourIndex):
+    """Inverted file index: pages are clustered around k-means centroids.
+
+    Each page is only compared with the members of its ``n_probe`` closest
+    clusters. Centroids are trained on the pages present at the first update,
+    later pages are assigned to the existing centroids.
+    """
+
+    name = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=4, n_iter=10, seed=0):
+        super().__init__()
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int64)
+
+    def _on_update(self, rows):
+        if self.centroids is None:
+            self.train()
+            return
+        self.assignments = np.concatenate(
+            [
+                self.assignments,
+                np.zeros(len(self.ids) - len(self.assignments), dtype=np.int64),
+            ]
+        )
+        self.assignments[rows] = self._nearest(self.vectors[rows], 1)[:, 0]
+
+    def train(self):
+        """(Re)train the centroids with spherical k-means over the live pages."""
+        alive = np.flatnonzero(self.alive)
+        if len(alive) == 0:
+            return
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(alive))))
+        n_lists = min(n_lists, len(alive))
+        rng = np.random.default_rng(self.seed)
+        data = self.vectors[alive]
+        self.centroids = data[rng.choice(len(data), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            labels = self._nearest(data, 1)[:, 0]
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = data[rng.choice(len(data), empty.sum())]
+            self.centroids = normalize(sums)
+        self.assignments = self._nearest(self.vectors, 1)[:, 0]
+
+    def _nearest(self, vectors, count):
+        """Return the ``count`` closest centroids of each vector."""
+        count = min(count, len(self.centroids))
+        nearest = np.zeros((len(vectors), count), dtype=np.int64)
+        for start in range(0, len(vectors), BLOCK_SIZE):
+            scores = vectors[start : start + BLOCK_SIZE] @ self.centroids.T
+            top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            nearest[start : start + BLOCK_SIZE] = top
+        return nearest
+
+    def search_pairs(self, cutoff=0.5):
+        if self.centroids is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        alive = self.alive
+        probes = self._nearest(self.vectors, self.n_probe)
+        rows, cols, scores = [], [], []
+        for c in range(len(self.centroids)):
+            members = np.flatnonzero((self.assignments == c) & alive)
+            queries = np.flatnonzero((probes == c).any(axis=1) & alive)
+            if len(members) == 0 or len(queries) == 0:
+                continue
+            for start in range(0, len(queries), BLOCK_SIZE):
+                block_queries = queries[start : start + BLOCK_SIZE]
+                block = self.vectors[block_queries] @ self.vectors[members].T
+                query_idx, member_idx = np.nonzero(block > cutoff)
+                i, j = block_queries[query_idx], members[member_idx]
+                keep = i != j
+                rows.append(np.minimum(i, j)[keep])
+                cols.append(np.maximum(i, j)[keep])
+                scores.append(block[query_idx, member_idx][keep])
+        if not rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        rows, cols, scores = np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+        _, unique = np.unique(rows * len(self.ids) + cols, return_index=True)
+        return rows[unique], cols[unique], scores[unique]
+
+    def state(self) -> dict:
+        return {
+            "centroids": self.centroids if self.centroids is not None else np.zeros(0),
+            "assignments": self.assignments,
+            "params": np.array([self.n_lists or 0, self.n_probe, self.n_iter, self.seed]),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        n_lists, n_probe, n_iter, seed = (int(el) for el in state["params"])
+        index = cls(n_lists or None, n_probe, n_iter, seed)
+        if state["centroids"].size:
+            index.centroids = state["centroids"]
+        index.assignments = state["assignments"]
+        return index
+
+
+BACKENDS = {backend.name: backend for backend in [ExactIndex, IVFIndex]}
+
+
+def load_index(path) -> NeighbourIndex:
+    with np.load(path) as state:
+        index = BACKENDS[str(state["backend"])].from_state(state)
+        index.ids = state["ids"].tolist()
+        index.positions = {page_id: i for i, page_id in enumerate(index.ids)}
+        index.vectors = state["vectors"]
+        index.alive = state["alive"]
+    return index
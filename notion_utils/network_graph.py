@@ -1,67 +1,177 @@
 """Module for building network graphs from Notion data."""
 from abc import ABC, abstractmethod
-import pandas as pd
+import numpy as np
 import networkx as nx
-from pyvis.network import Network
-from sklearn.metrics.pairwise import cosine_similarity
+from notion_utils.embedding_pipeline import encode_parallel, print_progress
+from notion_utils.layout import compute_layout
+from notion_utils.models import DEFAULT_MODEL, get_model
+from notion_utils.records import RecordStore
+from notion_utils.similarity import (
+    SimilarityEdges,
+    normalize,
+    threshold_pairs,
+    top_k_pairs,
+)
+from notion_utils.tracing import tracer
 
 
 class GraphBuilder(ABC):
-    def __init__(self, data, id_to_title):
+    name: str = None
+    uses_cutoff: bool = False
+
+    def __init__(self, data, id_to_title=None):
         self.data = data
         self.id_to_title = id_to_title
+        self.store = data if isinstance(data, RecordStore) else None
+
+    def get_store(self) -> RecordStore:
+        if self.store is None:
+            self.store = RecordStore.from_records(self.data, self.id_to_title)
+        return self.store
+
+    def columns(self, *names) -> list:
+        """The ``names`` fields, among id, title and summary, of every known page.
+
+        A ``RecordStore`` answers from its arrays, without a dict per page.
+        """
+        if self.store is None:
+            return [[el[name] for el in self.data] for name in names]
+        store = self.store
+        arrays = {"id": store.ids, "title": store.titles, "summary": store.summaries}
+        known = np.flatnonzero(store.known)
+        if len(known) == len(store):
+            return [arrays[name] for name in names]
+        return [[arrays[name][i] for i in known] for name in names]
 
     @abstractmethod
     def build_graph(self, **kwargs):
         pass
 
-    def save_graph_in_html(self, DG, filename, overlap=-1000):
-        net = Network(notebook=True, directed=False)
+    def get_network(
+        self, DG, overlap=-1000, layout=False, layout_cache=None, **network_kwargs
+    ):
+        """Convert the graph to a pyvis network.
+
+        With ``layout`` the node positions are computed here, and cached in
+        ``layout_cache``, so that the page renders with the physics disabled
+        instead of simulating it in the browser.
+        """
+        # pyvis pulls in IPython and jinja, so it is only imported to render
+        from pyvis.network import Network
+
+        tracer.count("render.nodes", DG.number_of_nodes())
+        net = Network(directed=False, **network_kwargs)
         net.from_nx(DG)
-        net.force_atlas_2based(overlap=overlap)
-        net.show(filename)
+        if layout:
+            positions = compute_layout(DG, layout_cache)
+            scale = 50 * np.sqrt(max(len(positions), 1))
+            for node in net.nodes:
+                x, y = positions[node["id"]]
+                node["x"], node["y"] = float(x * scale), float(y * scale)
+            net.toggle_physics(False)
+        else:
+            net.force_atlas_2based(overlap=overlap)
+        return net
+
+    def save_graph_in_html(
+        self, DG, filename, overlap=-1000, layout=False, layout_cache=None
+    ):
+        """Render the graph with pyvis in ``filename``.
+
+        The scripts are loaded from a CDN, as pyvis would otherwise copy them
+        in a ``lib`` directory of the working directory, which fails when
+        graphs are rendered concurrently.
+        """
+        html = self.render_html(DG, overlap, layout, layout_cache)
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(html)
+
+    def render_html(self, DG, overlap=-1000, layout=False, layout_cache=None) -> str:
+        """Render the graph with pyvis in memory, loading its scripts from a CDN."""
+        with tracer.span("render.html", nodes=DG.number_of_nodes()):
+            net = self.get_network(DG, overlap, layout, layout_cache, cdn_resources="remote")
+            return net.generate_html()
 
 
 class NetworkGraphRelation(GraphBuilder):
     name: str = "relations_graph"
 
     def build_graph(self, **kwargs):
-        edges = [
-            (self.id_to_title[row["id"]], self.id_to_title[child])
-            for row in self.data
-            for child in row["children"]
-            if row["id"] in self.id_to_title and child in self.id_to_title
-        ]
-        return nx.DiGraph(edges)
+        with tracer.span("build.relations_graph"):
+            store = self.get_store()
+            sources, targets = store.edges()
+            graph = nx.DiGraph(zip(store.titles[sources], store.titles[targets]))
+        tracer.count("graph.edges", graph.number_of_edges())
+        return graph
 
 
 class NetworkGraphCorrelation(GraphBuilder):
     name: str = "correlations_graph"
+    uses_cutoff: bool = True
 
     def __init__(
         self,
         data,
-        id_to_title,
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        id_to_title=None,
+        model_name=DEFAULT_MODEL,
+        cache=None,
+        index=None,
+        backend="torch",
+        quantize=False,
+        workers=1,
     ):
-        from sentence_transformers import SentenceTransformer
-
         super().__init__(data, id_to_title)
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.cache = cache
+        self.index = index
+        self.backend = backend
+        self.quantize = quantize
+        self.workers = workers
+        self.embeddings = None
+        self.similarity_edges = None
+
+    @property
+    def model(self):
+        """The sentence transformer, shared by every builder through the model registry."""
+        return get_model(self.model_name, self.backend, self.quantize)
+
+    def encode(self, texts):
+        model = self.model if self.workers <= 1 else None
+        with tracer.span("embeddings.encode", texts=len(texts)):
+            tracer.count("embeddings.encoded", len(texts))
+            if model is None:
+                return encode_parallel(
+                    texts,
+                    self.model_name,
+                    self.backend,
+                    self.quantize,
+                    workers=self.workers,
+                    progress=print_progress,
+                )
+            return model.encode(texts, convert_to_numpy=True)
 
     def get_embeddings(self):
-        title_summary = [f"{el['title']}{el['summary']}" for el in self.data]
-        return self.model.encode(title_summary, convert_to_tensor=True)
+        titles, summaries = self.columns("title", "summary")
+        title_summary = [f"{title}{summary}" for title, summary in zip(titles, summaries)]
+        if self.cache is None:
+            return self.encode(title_summary)
+        # A process pool is started per encode call, so give it every missing text at once
+        batch_size = 256 if self.workers <= 1 else None
+        return self.cache.embed(self.model_name, title_summary, self.encode, batch_size)
 
     def get_correlation_matrix(self):
+        import pandas as pd
+        from sklearn.metrics.pairwise import cosine_similarity
+
         embeddings = self.get_embeddings()
         cosine_sim_matrix = cosine_similarity(embeddings)
-        titles = [el["title"] for el in self.data]
+        (titles,) = self.columns("title")
         return pd.DataFrame(cosine_sim_matrix, columns=titles, index=titles)
 
     def get_links(self):
         correlation_matrix = self.get_correlation_matrix()
-        return correlation_matrix.stack().reset_index()
+        with tracer.span("pandas.stack"):
+            return correlation_matrix.stack().reset_index()
 
     def filter_links(self, links, cutoff=0.5):
         links.columns = ["var1", "var2", "value"]
@@ -69,8 +179,73 @@ class NetworkGraphCorrelation(GraphBuilder):
             (links["value"] > cutoff) & (links["var1"] != links["var2"])
         ].dropna()
 
+    def get_normalized_embeddings(self):
+        if self.embeddings is None:
+            self.embeddings = normalize(self.get_embeddings())
+        return self.embeddings
+
+    def get_similarity_edges(self, min_cutoff=0.5, block_size=1024) -> SimilarityEdges:
+        """Return the sorted similarity pairs above ``min_cutoff``.
+
+        They are computed once, block by block or with the neighbour
+        ``index`` when the builder has one, and reused for any higher cutoff.
+        """
+        edges = self.similarity_edges
+        if edges is None or edges.min_cutoff > min_cutoff:
+            embeddings = self.get_normalized_embeddings()
+            with tracer.span("similarity", pages=len(embeddings), index=self.index is not None):
+                if self.index is not None:
+                    rows, cols, scores = self.search_index(embeddings, min_cutoff)
+                else:
+                    rows, cols, scores = threshold_pairs(embeddings, min_cutoff, block_size)
+            edges = SimilarityEdges(rows, cols, scores, len(embeddings), min_cutoff)
+            self.similarity_edges = edges
+        return edges
+
+    def get_pairs(self, cutoff=0.5, top_k=None, block_size=1024, min_cutoff=None):
+        """Return the ``(rows, cols, scores)`` of the similar pages.
+
+        Keeps the pairs above ``cutoff``, or only each page's ``top_k`` nearest
+        neighbours. Passing the lowest cutoff that will be asked for as
+        ``min_cutoff`` lets every later cutoff reuse the same computation.
+        """
+        if top_k:
+            embeddings = self.get_normalized_embeddings()
+            with tracer.span("similarity", pages=len(embeddings), top_k=top_k):
+                return top_k_pairs(embeddings, top_k, cutoff, block_size)
+        if min_cutoff is None or min_cutoff > cutoff:
+            min_cutoff = cutoff
+        return self.get_similarity_edges(min_cutoff, block_size).edges(cutoff)
+
+    def sweep(self, cutoffs) -> list:
+        """Edge and connected component counts of the graph at each cutoff."""
+        return self.get_similarity_edges(min(cutoffs)).sweep(cutoffs)
+
+    def search_index(self, embeddings, cutoff=0.5):
+        (ids,) = self.columns("id")
+        self.index.upsert(ids, embeddings)
+        self.index.retain(ids)
+        rows, cols, scores = self.index.search_pairs(cutoff)
+        position = {page_id: i for i, page_id in enumerate(ids)}
+        to_position = np.array([position.get(page_id, -1) for page_id in self.index.ids])
+        return to_position[rows], to_position[cols], scores
+
     def build_graph(self, **kwargs):
-        cutoff = kwargs.get("cutoff", 0.5)
-        links = self.get_links()
-        links_filtered = self.filter_links(links, cutoff=cutoff)
-        return nx.from_pandas_edgelist(links_filtered, "var1", "var2")
+        """Build the similarity graph, whose nodes are page ids labelled by title."""
+        rows, cols, scores = self.get_pairs(
+            cutoff=kwargs.get("cutoff", 0.5),
+            top_k=kwargs.get("top_k"),
+            block_size=kwargs.get("block_size", 1024),
+            min_cutoff=kwargs.get("min_cutoff"),
+        )
+        ids, titles = self.columns("id", "title")
+        with tracer.span("build.correlations_graph", edges=len(rows)):
+            graph = nx.Graph()
+            graph.add_nodes_from(
+                (ids[i], {"label": str(titles[i])}) for i in np.union1d(rows, cols)
+            )
+            graph.add_weighted_edges_from(
+                (ids[i], ids[j], float(score)) for i, j, score in zip(rows, cols, scores)
+            )
+        tracer.count("graph.edges", graph.number_of_edges())
+        return graph
@@ -1,9 +1,26 @@
 """Notion API module."""
-import requests
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import lru_cache
+from queue import Full, Queue
+
+import requests
+from requests.adapters import HTTPAdapter
+from notion_utils.records import RecordStore
+from notion_utils.schema_index import SchemaIndex, default_index_path
+from notion_utils.tracing import tracer, with_context
 
 NOTION_VERSION = "2022-02-22"
-API_URL = "https://api.notion.com/v1/databases/{database_id}/query"
+BASE_URL = "https://api.notion.com/v1"
+API_URL = BASE_URL + "/databases/{database_id}/query"
+PAGE_SIZE = 100
+MAX_RETRIES = 5
+DATABASE_FILTER = {"value": "database", "property": "object"}
+SEARCH_SORT = {"direction": "descending", "timestamp": "last_edited_time"}
 
 
 def get_headers(token, notion_version=NOTION_VERSION):
@@ -25,55 +42,351 @@ def parse_db_object(db_obj: dict):
     return {"self_relation_properties": self_relation_properties, "id": db_id}
 
 
-@lru_cache()
-def list_databases(token) -> dict:
-    objs = requests.post(
-        "https://api.notion.com/v1/search",
-        json={
-            "filter": {
-                "value": "database",
-                "property": "object",
-            },
-        },
-        headers=get_headers(token, NOTION_VERSION),
-    )
-    objs = objs.json()["results"]
-    db_to_id = dict()
-    for obj in objs:
+def parse_database(db_obj: dict):
+    """Parse a database object for the ``SchemaIndex``, ``None`` if it has no title."""
+    try:
+        name = db_obj["title"][0]["text"]["content"]
+    except (KeyError, IndexError):
+        return None
+    return {
+        "name": name,
+        "last_edited_time": db_obj.get("last_edited_time"),
+        **parse_db_object(db_obj),
+    }
+
+
+def get_session(pool_size=10) -> requests.Session:
+    """Build a keep-alive session whose connection pool fits ``pool_size`` workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def retry_after_seconds(value):
+    """Seconds to wait given a ``Retry-After`` header, in seconds or as an HTTP date.
+
+    Returns ``None`` when the header is missing or unreadable.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def post_with_backoff(
+    session,
+    url,
+    headers,
+    payload=None,
+    max_retries=MAX_RETRIES,
+    backoff=1.0,
+    stream=False,
+):
+    """POST to the Notion API, waiting and retrying when rate limited (HTTP 429).
+
+    The wait honours the ``Retry-After`` header when present and otherwise
+    grows exponentially, with some jitter so that concurrent workers spread out.
+    Returns the decoded JSON, or the raw response when ``stream`` is set.
+    """
+    for attempt in range(max_retries + 1):
+        with tracer.span("notion.http", attempt=attempt):
+            resp = session.post(url, json=payload, headers=headers, stream=stream)
+        tracer.count("notion.requests")
+        if resp.status_code != 429 or attempt == max_retries:
+            resp.raise_for_status()
+            if stream:
+                return resp
+            tracer.count("notion.bytes", len(resp.content))
+            with tracer.span("notion.json"):
+                return resp.json()
+        tracer.count("notion.rate_limited")
+        delay = retry_after_seconds(resp.headers.get("Retry-After"))
+        if delay is None:
+            delay = backoff * 2**attempt
+        # Give the connection back to the pool, a streamed body is not read otherwise
+        resp.close()
+        time.sleep(delay + random.uniform(0, backoff / 10))
+
+
+def query_pages(session, url, headers, query_filter=None, page_size=PAGE_SIZE, sort=None):
+    """Yield the results of a database query one API page at a time.
+
+    Follows ``next_cursor`` until ``has_more`` is false. ``sort`` is the sort
+    of the search endpoint, database queries do not use it.
+    """
+    payload = {"page_size": page_size}
+    if query_filter is not None:
+        payload["filter"] = query_filter
+    if sort is not None:
+        payload["sort"] = sort
+    while True:
+        resp = post_with_backoff(session, url, headers, payload)
+        tracer.count("notion.pages", len(resp["results"]))
+        yield resp["results"]
+        if not resp.get("has_more") or not resp.get("next_cursor"):
+            return
+        payload["start_cursor"] = resp["next_cursor"]
+
+
+def parse_results_stream(stream, cursor: dict):
+    """Yield the ``results`` of a query response while it is being read.
+
+    Requires the optional ``ijson`` package. ``has_more`` and ``next_cursor``
+    are stored in ``cursor`` once they have been read.
+    """
+    import ijson
+
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "results.item" and event == "end_map":
+                yield builder.value
+                builder = None
+        elif prefix == "results.item" and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix in ("has_more", "next_cursor"):
+            cursor[prefix] = value
+
+
+def iter_results(
+    session, url, headers, query_filter=None, page_size=PAGE_SIZE, incremental=False
+):
+    """Yield the results of a database query one by one.
+
+    With ``incremental`` each response body is parsed while it downloads,
+    so a whole API page is never held in memory at once.
+    """
+    if not incremental:
+        for results in query_pages(session, url, headers, query_filter, page_size):
+            yield from results
+        return
+    payload = {"page_size": page_size}
+    if query_filter is not None:
+        payload["filter"] = query_filter
+    while True:
+        cursor = {}
+        with post_with_backoff(session, url, headers, payload, stream=True) as resp:
+            resp.raw.decode_content = True
+            yield from parse_results_stream(resp.raw, cursor)
+        if not cursor.get("has_more") or not cursor.get("next_cursor"):
+            return
+        payload["start_cursor"] = cursor["next_cursor"]
+
+
+def prefetch(iterable, depth=PAGE_SIZE):
+    """Iterate over ``iterable`` from a background thread, up to ``depth`` items ahead.
+
+    This lets the next API page download while the caller processes the
+    current one. When the caller stops early, the thread stops at the next
+    item, closes ``iterable`` and is joined.
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def worker():
         try:
-            db_name = obj["title"][0]["text"]["content"]
-            db_to_id[db_name] = parse_db_object(obj)
-        except (KeyError, IndexError):
-            pass
-    return db_to_id
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except Exception as exc:
+            put((None, exc))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=with_context(worker), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = queue.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def edited_since(watermark):
+    """Query filter on the pages edited since ``watermark``, ``None`` for every page."""
+    if watermark is None:
+        return None
+    return {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": watermark}}
+
+
+def created_time_partitions(boundaries) -> list:
+    """Split a database query into filters on ``created_time`` ranges.
+
+    ``boundaries`` is a sorted sequence of ISO 8601 timestamps. The first and
+    last partitions are open-ended so that no page is left out. Without
+    boundaries a single unfiltered partition (``None``) is returned.
+    """
+    if not boundaries:
+        return [None]
+    edges = [None, *boundaries, None]
+    partitions = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        condition = {}
+        if start is not None:
+            condition["on_or_after"] = start
+        if end is not None:
+            condition["before"] = end
+        partitions.append({"timestamp": "created_time", "created_time": condition})
+    return partitions
+
+
+def search_databases(session, headers, base_url=BASE_URL, since=None):
+    """Yield the database objects of the workspace, most recently edited first.
+
+    With ``since``, stops at the first database last edited before it.
+    Notion rounds ``last_edited_time`` to the minute, so databases edited at
+    ``since`` itself are yielded again.
+    """
+    url = f"{base_url}/search"
+    for results in query_pages(session, url, headers, DATABASE_FILTER, sort=SEARCH_SORT):
+        for db_obj in results:
+            if since is not None and (db_obj.get("last_edited_time") or "") < since:
+                return
+            yield db_obj
+
+
+@tracer.traced("notion.sync_databases")
+def sync_databases(token, index, base_url=BASE_URL, full=False) -> dict:
+    """Bring a ``SchemaIndex`` up to date with the workspace.
+
+    Only databases edited since the index's watermark are searched, unless
+    ``full`` is set, in which case databases missing from the search are
+    dropped.
+    """
+    with index.lock:
+        since = None if full else index.watermark
+        databases = [
+            parse_database(db_obj)
+            for db_obj in search_databases(
+                get_session(1), get_headers(token, NOTION_VERSION), base_url, since
+            )
+        ]
+        return index.apply(
+            [database for database in databases if database is not None],
+            full=full or since is None,
+        )
+
+
+_schema_indexes = {}
+_schema_indexes_lock = threading.Lock()
+
+
+def get_schema_index(token, base_url=BASE_URL, path=None) -> SchemaIndex:
+    """The workspace's schema index, shared in the process and refreshed once stale.
+
+    The index is persisted in ``path``, by default a file of the user's cache
+    directory, so a warm index makes no request, even in a new process.
+    """
+    path = path or default_index_path(token, base_url)
+    with _schema_indexes_lock:
+        if path not in _schema_indexes:
+            _schema_indexes[path] = SchemaIndex(path)
+        index = _schema_indexes[path]
+    with index.lock:
+        if not index.is_fresh():
+            sync_databases(token, index, base_url)
+    return index
+
+
+def list_databases(token, base_url=BASE_URL) -> dict:
+    """Databases of the workspace by name, with their id and self relations."""
+    return get_schema_index(token, base_url).databases()
 
 
 class NotionAPI:
-    def __init__(self, token, datatabase_name):
+    def __init__(
+        self, token, datatabase_name, base_url=BASE_URL, max_workers=4, schema_index=None
+    ):
         self.token = token
         self.headers = get_headers(token, NOTION_VERSION)
-        databases = list_databases(token)
-        try:
-            database_id = databases[datatabase_name]["id"]
-        except KeyError:
-            print(f"Database not found. List of available databases {databases}")
-        self.api_url = API_URL.format(database_id=database_id)
+        self.max_workers = max_workers
+        self.session = get_session(max_workers)
+        index = schema_index or get_schema_index(token, base_url)
+        if index.get(datatabase_name) is None:
+            # The database may have been created since the last refresh
+            sync_databases(token, index, base_url)
+        database_id = index.resolve(datatabase_name)
+        self.database_id = database_id
+        self.api_url = f"{base_url}/databases/{database_id}/query"
+
+    def query_all(self, query_filter=None) -> list:
+        """Retrieve every page matching ``query_filter``, following pagination."""
+        return [
+            result
+            for results in query_pages(
+                self.session, self.api_url, self.headers, query_filter
+            )
+            for result in results
+        ]
 
     @lru_cache()
-    def retrieve_data(self) -> dict:
-        """Retrieve data from Notion API."""
-        resp = requests.post(self.api_url, headers=self.headers).json()
-        return resp["results"]
+    def retrieve_data(self, created_time_boundaries=()) -> list:
+        """Retrieve data from Notion API.
+
+        When ``created_time_boundaries`` is given, the query is split into
+        ``created_time`` partitions that are fetched concurrently.
+        """
+        partitions = created_time_partitions(created_time_boundaries)
+        if len(partitions) == 1:
+            return self.query_all(partitions[0])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunks = executor.map(with_context(self.query_all), partitions)
+            return [result for chunk in chunks for result in chunk]
+
+    def sync(self, store, full=False) -> dict:
+        """Bring a ``PageStore`` up to date with the database.
+
+        Only pages edited since the store's watermark are queried, unless
+        ``full`` is set, in which case the whole database is fetched and pages
+        that disappeared from it are tombstoned. Database queries do not return
+        archived or trashed pages, so only a full sync sees deletions.
+        """
+        watermark = None if full else store.get_watermark(self.database_id)
+        results = self.query_all(edited_since(watermark))
+        return store.apply(self.database_id, results, full=full or watermark is None)
 
     @staticmethod
     def get_property(
         result: dict, prop_name: str, prop_type: str, prop_subtype: str
     ) -> str:
         """Get a property from a result."""
-        try:
-            return result["properties"][prop_name][prop_type][0][prop_subtype]
-        except (KeyError, IndexError):
+        values = result.get("properties", {}).get(prop_name, {}).get(prop_type)
+        if not values:
             return None
+        return values[0].get(prop_subtype)
 
     @staticmethod
     def get_id(result: dict) -> str:
@@ -82,30 +395,98 @@ class NotionAPI:
 
     @staticmethod
     def get_relation_id(result: dict, prop_name: str) -> list:
-        try:
-            return [el["id"] for el in result["properties"][prop_name]["relation"]]
-        except KeyError:
-            return []
+        relations = result.get("properties", {}).get(prop_name, {}).get("relation", [])
+        return [el["id"] for el in relations]
+
+    @staticmethod
+    def parse_page(result: dict, children_name="Children") -> dict:
+        """Parse a raw page into a record."""
+        return {
+            "title": NotionAPI.get_property(result, "Name", "title", "plain_text"),
+            "id": NotionAPI.get_id(result),
+            "children": NotionAPI.get_relation_id(result, children_name),
+            "summary": NotionAPI.get_property(
+                result, "AI summary", "rich_text", "plain_text"
+            ),
+        }
 
     def process_data(self, results: dict, children_name="Children") -> list:
-        return [
-            {
-                "title": self.get_property(result, "Name", "title", "plain_text"),
-                "id": self.get_id(result),
-                "children": self.get_relation_id(result, children_name),
-                "summary": self.get_property(
-                    result, "AI summary", "rich_text", "plain_text"
-                ),
-            }
-            for result in results
-        ]
+        with tracer.span("notion.process_data", pages=len(results)):
+            return [self.parse_page(result, children_name) for result in results]
+
+    def iter_records(self, children_name="Children", query_filter=None, incremental=False):
+        """Yield parsed records as pages arrive from the API.
+
+        Pages are fetched in a background thread, so that downloading, parsing
+        and whatever consumes the records overlap. ``incremental`` parses
+        responses with ``ijson`` as they stream in.
+        """
+        results = iter_results(
+            self.session,
+            self.api_url,
+            self.headers,
+            query_filter,
+            incremental=incremental,
+        )
+        for result in prefetch(results):
+            yield self.parse_page(result, children_name)
+
+    def record_store(
+        self,
+        children_name="Children",
+        created_time_boundaries=(),
+        store=None,
+        incremental=False,
+        full=False,
+    ) -> RecordStore:
+        """Stream the database straight into a compact ``RecordStore``.
+
+        Records are parsed one at a time as the store is built, so the list of
+        record dicts of ``full_process`` is never held. ``store`` and
+        ``created_time_boundaries`` fetch the pages as ``full_process`` does,
+        and ``full`` syncs the whole database into ``store``.
+        """
+        if store is not None:
+            self.sync(store, full)
+            results = store.pages(self.database_id)
+        elif created_time_boundaries:
+            results = self.retrieve_data(tuple(created_time_boundaries))
+        else:
+            return RecordStore.from_records(
+                self.iter_records(children_name, incremental=incremental)
+            )
+        with tracer.span("notion.process_data", pages=len(results)):
+            return RecordStore.from_records(
+                self.parse_page(result, children_name) for result in results
+            )
 
     @staticmethod
     def map_id_to_title(data: list) -> dict:
         return {row["id"]: row["title"] for row in data}
 
-    def full_process(self, children_name="Children"):
-        response = self.retrieve_data()
+    def changes(self, store, children_name="Children", since=None):
+        """Return the records of the pages edited since ``since``, the deleted ids and the new watermark.
+
+        The pages are merged into ``store`` without moving its watermark, so
+        that a caller keeping its own watermark does not skip the pages that
+        ``sync`` has not seen, nor the other way round. Without ``since`` the
+        whole database is fetched.
+        """
+        results = self.query_all(edited_since(since))
+        changes = store.apply(self.database_id, results, full=since is None, advance=False)
+        records = self.process_data(store.get_pages(changes["upserted"]), children_name)
+        stamps = [page["last_edited_time"] for page in results if page.get("last_edited_time")]
+        watermark = max(stamps + ([since] if since else []), default=None)
+        return records, changes["deleted"], watermark
+
+    def full_process(
+        self, children_name="Children", created_time_boundaries=(), store=None
+    ):
+        if store is not None:
+            self.sync(store)
+            response = store.pages(self.database_id)
+        else:
+            response = self.retrieve_data(tuple(created_time_boundaries))
         data = self.process_data(response, children_name)
         id_to_title = self.map_id_to_title(data)
         return data, id_to_title
@@ -0,0 +1,116 @@
+"""Persistent local store of Notion pages, used to sync databases incrementally."""
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    last_edited_time TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    page TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id, deleted);
+CREATE TABLE IF NOT EXISTS sync_state (
+    database_id TEXT PRIMARY KEY,
+    watermark TEXT
+);
+"""
+
+
+def is_deleted(page: dict) -> bool:
+    return bool(page.get("archived") or page.get("in_trash"))
+
+
+class PageStore:
+    """SQLite store of raw Notion pages and of a sync watermark per database.
+
+    The watermark is the latest ``last_edited_time`` seen for a database, so
+    that the next sync only needs to query pages edited since then. Archived
+    pages are kept as tombstones rather than removed, which lets incremental
+    consumers know which pages went away.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_watermark(self, database_id):
+        row = self.conn.execute(
+            "SELECT watermark FROM sync_state WHERE database_id = ?", (database_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def page_ids(self, database_id) -> set:
+        rows = self.conn.execute(
+            "SELECT id FROM pages WHERE database_id = ? AND deleted = 0",
+            (database_id,),
+        )
+        return {row[0] for row in rows}
+
+    def pages(self, database_id) -> list:
+        """Return the raw pages of a database, without tombstones."""
+        rows = self.conn.execute(
+            "SELECT page FROM pages WHERE database_id = ? AND deleted = 0 ORDER BY rowid",
+            (database_id,),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_pages(self, ids) -> list:
+        """Return the raw pages with the given ids, without tombstones."""
+        pages = []
+        for page_id in ids:
+            row = self.conn.execute(
+                "SELECT page FROM pages WHERE id = ? AND deleted = 0", (page_id,)
+            ).fetchone()
+            if row:
+                pages.append(json.loads(row[0]))
+        return pages
+
+    def apply(self, database_id, results, full=False, advance=True) -> dict:
+        """Merge query results into the store and move the watermark forward.
+
+        With ``full`` the results are the whole database, so any stored page
+        missing from them has been deleted and is tombstoned. Without
+        ``advance`` the watermark is left where it is.
+        Returns the ids of the ``upserted`` and ``deleted`` pages.
+        """
+        upserted = [page for page in results if not is_deleted(page)]
+        deleted = [page["id"] for page in results if is_deleted(page)]
+        if full:
+            seen = {page["id"] for page in results}
+            deleted += [
+                page_id for page_id in self.page_ids(database_id) if page_id not in seen
+            ]
+        stamps = [page["last_edited_time"] for page in results if page.get("last_edited_time")]
+        watermark = max(stamps, default=None)
+        previous = self.get_watermark(database_id)
+        if previous is not None and (watermark is None or previous > watermark):
+            watermark = previous
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO pages (id, database_id, last_edited_time, deleted, page) "
+                "VALUES (?, ?, ?, 0, ?) ON CONFLICT (id) DO UPDATE SET "
+                "database_id = excluded.database_id, "
+                "last_edited_time = excluded.last_edited_time, "
+                "deleted = 0, page = excluded.page",
+                [
+                    (page["id"], database_id, page.get("last_edited_time"), json.dumps(page))
+                    for page in upserted
+                ],
+            )
+            self.conn.executemany(
+                "UPDATE pages SET deleted = 1 WHERE id = ?",
+                [(page_id,) for page_id in deleted],
+            )
+            if advance:
+                self.conn.execute(
+                    "INSERT INTO sync_state (database_id, watermark) VALUES (?, ?) "
+                    "ON CONFLICT (database_id) DO UPDATE SET watermark = excluded.watermark",
+                    (database_id, watermark),
+                )
+        return {"upserted": [page["id"] for page in upserted], "deleted": deleted}
@@ -0,0 +1,111 @@
+"""Pipeline fetching each database once and building every requested graph from it."""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from notion_utils.tracing import with_context
+
+
+def slugify(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+
+
+def graph_filename(file_prefix, name, database=None, cutoff=None, extension="html") -> str:
+    """Output file of a graph, naming the database and cutoff only when given."""
+    parts = [file_prefix]
+    if database is not None:
+        parts.append(slugify(database))
+    parts.append(name)
+    if cutoff is not None:
+        parts.append(f"{cutoff:g}")
+    return f"{'_'.join(parts)}.{extension}"
+
+
+class GraphPipeline:
+    """Run the fetch stage once per database and the graph builders concurrently.
+
+    ``fetch`` maps a database name to its records, ``builder_options`` gives
+    the extra keyword arguments of a builder class for a database, and
+    ``render`` writes a graph to a file. Builds run in one worker pool and
+    renders in another, so the cheap relation graph is written while the
+    correlation graph is still being computed. A correlation builder is
+    reused for every cutoff, so embeddings and similarities are computed once
+    per database. Builders are kept in ``built``, keyed by database and
+    graph name.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        builders,
+        render,
+        builder_options=None,
+        cutoffs=(0.5,),
+        build_kwargs=None,
+        max_workers=4,
+    ):
+        self.fetch = fetch
+        self.builders = builders
+        self.render = render
+        self.builder_options = builder_options or (lambda GraphBuilder, database: {})
+        self.cutoffs = list(cutoffs)
+        self.build_kwargs = build_kwargs or {}
+        self.max_workers = max_workers
+        self.built = {}
+
+    def output_filename(self, file_prefix, database, name, cutoff, databases, extension):
+        return graph_filename(
+            file_prefix,
+            name,
+            database if len(databases) > 1 else None,
+            cutoff if len(self.cutoffs) > 1 else None,
+            extension,
+        )
+
+    def run(self, databases, file_prefix="", extension="html") -> list:
+        """Build and render every graph, returning the written file names."""
+        with ThreadPoolExecutor(self.max_workers) as build_pool, ThreadPoolExecutor(
+            self.max_workers
+        ) as render_pool:
+            records = {
+                database: build_pool.submit(with_context(self.fetch), database)
+                for database in databases
+            }
+            builds = [
+                build_pool.submit(
+                    with_context(self._build),
+                    GraphBuilder,
+                    database,
+                    records[database].result(),
+                    render_pool,
+                    file_prefix,
+                    databases,
+                    extension,
+                )
+                for database in databases
+                for GraphBuilder in self.builders
+            ]
+            renders = [render for build in builds for render in build.result()]
+            return [render.result() for render in renders]
+
+    def _build(self, GraphBuilder, database, records, render_pool, file_prefix, databases, extension):
+        network_graph = GraphBuilder(records, **self.builder_options(GraphBuilder, database))
+        self.built[database, GraphBuilder.name] = network_graph
+        cutoffs = self.cutoffs if GraphBuilder.uses_cutoff else [None]
+        renders = []
+        for cutoff in cutoffs:
+            kwargs = dict(self.build_kwargs)
+            if cutoff is not None:
+                kwargs["cutoff"] = cutoff
+                kwargs["min_cutoff"] = min(self.cutoffs)
+            graph = network_graph.build_graph(**kwargs)
+            filename = self.output_filename(
+                file_prefix, database, GraphBuilder.name, cutoff, databases, extension
+            )
+            renders.append(
+                render_pool.submit(with_context(self._render), network_graph, graph, filename)
+            )
+        return renders
+
+    def _render(self, network_graph, graph, filename):
+        self.render(network_graph, graph, filename)
+        return filename
@@ -0,0 +1,98 @@
+"""Compact columnar representation of parsed Notion records."""
+from array import array
+
+import numpy as np
+
+
+class RecordStore:
+    """Parsed records with page ids interned to dense integer indices.
+
+    ``titles`` and ``summaries`` are arrays indexed by page index and the
+    children relations are stored CSR style: the children of page ``i`` are
+    ``targets[offsets[i]:offsets[i + 1]]``. Pages only known as the child of
+    another page keep a ``None`` title and are flagged in ``known``.
+    """
+
+    def __init__(self, ids, titles, summaries, known, offsets, targets):
+        self.ids = ids
+        self.index = {page_id: i for i, page_id in enumerate(ids)}
+        self.titles = titles
+        self.summaries = summaries
+        self.known = known
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_records(cls, records, id_to_title=None):
+        """Build a store from an iterable of records, consumed in a single pass."""
+        index = {}
+        ids, titles, summaries, known = [], [], [], []
+        sources, targets = array("q"), array("q")
+
+        def intern(page_id):
+            i = index.get(page_id)
+            if i is None:
+                i = index[page_id] = len(ids)
+                ids.append(page_id)
+                titles.append(None)
+                summaries.append(None)
+                known.append(False)
+            return i
+
+        for record in records:
+            i = intern(record["id"])
+            titles[i] = record.get("title")
+            summaries[i] = record.get("summary")
+            known[i] = True
+            for child in record["children"]:
+                sources.append(i)
+                targets.append(intern(child))
+        for page_id, title in (id_to_title or {}).items():
+            i = intern(page_id)
+            titles[i] = title
+            known[i] = True
+
+        sources = np.frombuffer(sources, dtype=np.int64)
+        targets = np.frombuffer(targets, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=len(ids))
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(
+            ids,
+            np.array(titles, dtype=object),
+            np.array(summaries, dtype=object),
+            np.array(known, dtype=bool),
+            offsets,
+            targets[order],
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """Iterate over the known pages as record dicts."""
+        for i in np.flatnonzero(self.known):
+            yield self.record(i)
+
+    def record(self, i) -> dict:
+        return {
+            "title": self.titles[i],
+            "id": self.ids[i],
+            "children": [self.ids[j] for j in self.children(i)],
+            "summary": self.summaries[i],
+        }
+
+    def children(self, i):
+        return self.targets[self.offsets[i] : self.offsets[i + 1]]
+
+    def edges(self):
+        """Return the (sources, targets) index arrays of relations between known pages."""
+        sources = np.repeat(np.arange(len(self.ids)), np.diff(self.offsets))
+        mask = self.known[sources] & self.known[self.targets]
+        return sources[mask], self.targets[mask]
+
+    def id_to_title(self) -> dict:
+        return {
+            self.ids[i]: self.titles[i] for i in np.flatnonzero(self.known)
+        }
@@ -0,0 +1,151 @@
+"""Persistent index of the databases of a workspace, to resolve names without searching."""
+import difflib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get(
+    "NOTION_UTILS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "notion_utils")
+)
+# Seconds during which the index is trusted without asking Notion for changes
+MAX_AGE = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS databases (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    self_relation_properties TEXT NOT NULL,
+    last_edited_time TEXT
+);
+CREATE TABLE IF NOT EXISTS index_state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    watermark TEXT,
+    refreshed_at REAL
+);
+"""
+
+
+def default_index_path(token, base_url) -> str:
+    """One file per workspace, named after a hash so that the token is not written."""
+    key = hashlib.sha256(f"{base_url}\n{token}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"schema-{key}.sqlite")
+
+
+class SchemaIndex:
+    """SQLite index of the databases of a workspace, with their self relations.
+
+    The databases are also held in memory by name, so that lookups are dict
+    lookups. Like ``PageStore``, the index keeps the latest
+    ``last_edited_time`` it has seen as a watermark, so that a refresh only
+    needs the databases edited since. Databases that disappear from the
+    workspace are only dropped by a ``full`` refresh. ``is_fresh`` tells
+    whether the last refresh is recent enough to skip asking Notion.
+    """
+
+    def __init__(self, path=":memory:", max_age=MAX_AGE, clock=time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._load()
+
+    def close(self):
+        self.conn.close()
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT id, name, self_relation_properties, last_edited_time FROM databases "
+            "ORDER BY last_edited_time, id"
+        )
+        # Notion allows duplicate names, the most recently edited database wins
+        self.by_name = {
+            name: {
+                "id": db_id,
+                "self_relation_properties": json.loads(properties),
+                "last_edited_time": last_edited_time,
+            }
+            for db_id, name, properties, last_edited_time in rows
+        }
+        self.by_casefold = {name.casefold(): name for name in self.by_name}
+        row = self.conn.execute(
+            "SELECT watermark, refreshed_at FROM index_state WHERE id = 0"
+        ).fetchone()
+        self.watermark, self.refreshed_at = row if row else (None, None)
+
+    def is_fresh(self) -> bool:
+        return self.refreshed_at is not None and self.clock() - self.refreshed_at < self.max_age
+
+    def apply(self, databases, full=False) -> dict:
+        """Merge parsed databases into the index and move the watermark forward.
+
+        Each database is a dict with ``id``, ``name``, ``self_relation_properties``
+        and ``last_edited_time``. With ``full`` they are the whole workspace,
+        so any other indexed database is dropped.
+        Returns the ids of the ``upserted`` and ``deleted`` databases.
+        """
+        with self.lock:
+            deleted = []
+            if full:
+                seen = {database["id"] for database in databases}
+                deleted = [
+                    row[0]
+                    for row in self.conn.execute("SELECT id FROM databases")
+                    if row[0] not in seen
+                ]
+            stamps = [el["last_edited_time"] for el in databases if el.get("last_edited_time")]
+            watermark = max(stamps, default=None)
+            if self.watermark is not None and (watermark is None or self.watermark > watermark):
+                watermark = self.watermark
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO databases VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            database["id"],
+                            database["name"],
+                            json.dumps(database["self_relation_properties"]),
+                            database.get("last_edited_time"),
+                        )
+                        for database in databases
+                    ],
+                )
+                self.conn.executemany(
+                    "DELETE FROM databases WHERE id = ?", [(db_id,) for db_id in deleted]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO index_state VALUES (0, ?, ?)",
+                    (watermark, self.clock()),
+                )
+            self._load()
+            return {"upserted": [database["id"] for database in databases], "deleted": deleted}
+
+    def databases(self) -> dict:
+        """Databases by name, as returned by ``list_databases``."""
+        return dict(self.by_name)
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def suggest(self, name, n=3) -> list:
+        """Names closest to ``name``, a case-insensitive match first."""
+        close = difflib.get_close_matches(name, list(self.by_name), n=n, cutoff=0.6)
+        exact = self.by_casefold.get(name.casefold())
+        if exact is None:
+            return close
+        return [exact] + [el for el in close if el != exact][: n - 1]
+
+    def resolve(self, name) -> str:
+        """Return the id of the database called ``name``."""
+        database = self.get(name)
+        if database is None:
+            raise ValueError(
+                f"Database {name} not found, closest matches: {self.suggest(name)}"
+            )
+        return database["id"]
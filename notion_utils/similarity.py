@@ -0,0 +1,138 @@
+"""Blockwise cosine similarity that only keeps the pairs worth drawing."""
+import numpy as np
+
+BLOCK_SIZE = 1024
+
+
+def normalize(embeddings) -> np.ndarray:
+    """Scale each embedding to unit norm, so that dot products are cosine similarities."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def _blocks(n, block_size):
+    return [(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+
+
+def threshold_pairs(embeddings, cutoff=0.5, block_size=BLOCK_SIZE):
+    """Return the ``(rows, cols, scores)`` of the pairs with similarity above ``cutoff``.
+
+    ``embeddings`` must be normalized. Only pairs with ``row < col`` are
+    returned and at most a ``block_size`` x ``block_size`` block of scores is
+    held in memory at a time.
+    """
+    rows, cols, scores = [], [], []
+    blocks = _blocks(len(embeddings), block_size)
+    for i, (i_start, i_end) in enumerate(blocks):
+        for j_start, j_end in blocks[i:]:
+            block = embeddings[i_start:i_end] @ embeddings[j_start:j_end].T
+            mask = block > cutoff
+            if i_start == j_start:
+                mask = np.triu(mask, k=1)
+            block_rows, block_cols = np.nonzero(mask)
+            rows.append(block_rows + i_start)
+            cols.append(block_cols + j_start)
+            scores.append(block[block_rows, block_cols])
+    return _concat(rows, np.int64), _concat(cols, np.int64), _concat(scores, np.float32)
+
+
+def top_k_pairs(embeddings, k, cutoff=-1.0, block_size=BLOCK_SIZE):
+    """Return the ``(rows, cols, scores)`` linking each node to its ``k`` nearest neighbours.
+
+    Neighbours must also have a similarity above ``cutoff``. ``embeddings``
+    must be normalized.
+    """
+    n = len(embeddings)
+    k = min(k, n - 1)
+    rows, cols, scores = [], [], []
+    if k <= 0:
+        return _concat(rows, np.int64), _concat(cols, np.int64), _concat(scores, np.float32)
+    blocks = _blocks(n, block_size)
+    for i_start, i_end in blocks:
+        best_scores = np.full((i_end - i_start, k), -np.inf, dtype=np.float32)
+        best_cols = np.zeros((i_end - i_start, k), dtype=np.int64)
+        for j_start, j_end in blocks:
+            block = embeddings[i_start:i_end] @ embeddings[j_start:j_end].T
+            if i_start == j_start:
+                np.fill_diagonal(block, -np.inf)
+            candidates = np.hstack([best_scores, block])
+            candidate_cols = np.hstack(
+                [best_cols, np.broadcast_to(np.arange(j_start, j_end), block.shape)]
+            )
+            top = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidates, top, axis=1)
+            best_cols = np.take_along_axis(candidate_cols, top, axis=1)
+        block_rows, slots = np.nonzero(best_scores > cutoff)
+        rows.append(block_rows + i_start)
+        cols.append(best_cols[block_rows, slots])
+        scores.append(best_scores[block_rows, slots])
+    return _concat(rows, np.int64), _concat(cols, np.int64), _concat(scores, np.float32)
+
+
+def _concat(chunks, dtype):
+    if not chunks:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(chunks).astype(dtype, copy=False)
+
+
+def to_sparse(rows, cols, scores, n):
+    """Pack pairs into a symmetric scipy CSR similarity matrix."""
+    from scipy import sparse
+
+    matrix = sparse.coo_matrix((scores, (rows, cols)), shape=(n, n)).tocsr()
+    return matrix.maximum(matrix.T).tocsr()
+
+
+class SimilarityEdges:
+    """Similarity pairs sorted by decreasing score, computed once down to ``min_cutoff``.
+
+    The pairs above any cutoff at least ``min_cutoff`` are then a prefix of
+    the sorted arrays, found with a binary search.
+    """
+
+    def __init__(self, rows, cols, scores, n, min_cutoff):
+        order = np.argsort(-scores, kind="stable")
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.scores = scores[order]
+        self.n = n
+        self.min_cutoff = min_cutoff
+
+    def __len__(self):
+        return len(self.scores)
+
+    def count(self, cutoff) -> int:
+        """Number of pairs with a score strictly above ``cutoff``."""
+        if cutoff < self.min_cutoff:
+            raise ValueError(f"Cutoff {cutoff} is below {self.min_cutoff}")
+        return int(np.searchsorted(-self.scores, -cutoff, side="left"))
+
+    def edges(self, cutoff):
+        """Return the ``(rows, cols, scores)`` of the pairs above ``cutoff``."""
+        k = self.count(cutoff)
+        return self.rows[:k], self.cols[:k], self.scores[:k]
+
+    def stats(self, cutoff) -> dict:
+        """Edge, node and connected component counts of the graph at ``cutoff``."""
+        from scipy import sparse
+        from scipy.sparse.csgraph import connected_components
+
+        rows, cols, scores = self.edges(cutoff)
+        adjacency = sparse.coo_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(self.n, self.n)
+        )
+        _, labels = connected_components(adjacency, directed=False)
+        nodes = np.union1d(rows, cols)
+        sizes = np.bincount(labels[nodes]) if len(nodes) else np.zeros(0, dtype=np.int64)
+        return {
+            "cutoff": cutoff,
+            "edges": len(rows),
+            "nodes": len(nodes),
+            "components": int((sizes > 0).sum()),
+            "largest_component": int(sizes.max()) if len(sizes) else 0,
+        }
+
+    def sweep(self, cutoffs) -> list:
+        return [self.stats(cutoff) for cutoff in cutoffs]
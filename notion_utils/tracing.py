@@ -0,0 +1,250 @@
+"""Lightweight tracing of the pipeline stages: spans, counts and memory."""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+TRACE_FORMATS = ("json", "chrome")
+NULL_SPAN = nullcontext()
+
+
+def with_context(function):
+    """Wrap ``function`` to run in a copy of the current context.
+
+    Threads start with an empty context, so functions handed to a thread or
+    a pool must be wrapped to record into the caller's traces. Each call runs
+    in its own copy, as a context cannot be entered by two threads at once.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
+
+
+def rss_mb():
+    """Current resident set size of the process in MB, ``None`` where unknown."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def peak_rss_mb():
+    """Peak resident set size over the whole life of the process in MB, ``None`` where unknown."""
+    try:
+        import resource
+    except ImportError:
+        # Windows, where the peak working set is only known through psutil
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+class Trace:
+    """Spans and counts recorded while a trace is active."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add_span(self, span: dict):
+        with self.lock:
+            self.spans.append(span)
+
+    def add_count(self, name, value):
+        with self.lock:
+            self.counts[name] += value
+
+    def summary(self) -> list:
+        """Total time, calls and memory of each span name, slowest first.
+
+        ``max_rss_delta_mb`` is the largest growth of the RSS over one call,
+        and ``process_peak_rss_mb`` the peak RSS of the process so far, which
+        stages running before may have set.
+        """
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(
+                span["name"],
+                {
+                    "name": span["name"],
+                    "calls": 0,
+                    "total_s": 0.0,
+                    "max_rss_delta_mb": None,
+                    "process_peak_rss_mb": None,
+                },
+            )
+            stage["calls"] += 1
+            stage["total_s"] += span["duration"]
+            stage["max_rss_delta_mb"] = _max(stage["max_rss_delta_mb"], span["rss_delta_mb"])
+            stage["process_peak_rss_mb"] = _max(
+                stage["process_peak_rss_mb"], span["process_peak_rss_mb"]
+            )
+        return sorted(stages.values(), key=lambda stage: -stage["total_s"])
+
+    def to_json(self) -> dict:
+        return {"spans": self.spans, "counts": dict(self.counts), "summary": self.summary()}
+
+    def to_chrome_trace(self) -> dict:
+        """Events in the Chrome trace format, to open in chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            ts = (span["start"] - self.start) * 1e6
+            events.append(
+                {
+                    "name": span["name"],
+                    "ph": "X",
+                    "ts": ts,
+                    "dur": span["duration"] * 1e6,
+                    "pid": pid,
+                    "tid": span["thread"],
+                    "args": span["args"],
+                }
+            )
+            if span["rss_mb"] is not None:
+                events.append(
+                    {
+                        "name": "rss_mb",
+                        "ph": "C",
+                        "ts": ts + span["duration"] * 1e6,
+                        "pid": pid,
+                        "args": {"rss_mb": span["rss_mb"]},
+                    }
+                )
+        end = max([event["ts"] for event in events], default=0)
+        events.extend(
+            {"name": name, "ph": "C", "ts": end, "pid": pid, "args": {name: value}}
+            for name, value in self.counts.items()
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path, fmt="json"):
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"Trace format {fmt} not in {TRACE_FORMATS}")
+        data = self.to_chrome_trace() if fmt == "chrome" else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+
+
+class Span:
+    """A timed stage, with the RSS of the process when it ends and its growth over it.
+
+    The growth includes the allocations of stages running concurrently.
+    """
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.start_rss = rss_mb()
+        return self
+
+    def __exit__(self, *exc_info):
+        rss = rss_mb()
+        span = {
+            "name": self.name,
+            "start": self.start,
+            "duration": time.perf_counter() - self.start,
+            "thread": threading.get_ident(),
+            "args": self.args,
+            "rss_mb": rss,
+            "rss_delta_mb": None if rss is None else rss - self.start_rss,
+            "process_peak_rss_mb": peak_rss_mb(),
+        }
+        for trace in self.tracer.traces:
+            trace.add_span(span)
+
+
+class Tracer:
+    """Records spans and counts into every ``Trace`` active in the current context.
+
+    With no active trace, ``span`` returns a shared no-op context manager and
+    ``count`` returns at once, so instrumented code costs next to nothing.
+    Active traces are held in a context variable, so traces started
+    concurrently, as by the sessions of the Streamlit app, only see their own
+    spans. Work sent to other threads must be wrapped with ``with_context``.
+    """
+
+    def __init__(self):
+        self.active = contextvars.ContextVar(f"traces_{id(self)}", default=())
+
+    @property
+    def traces(self) -> tuple:
+        return self.active.get()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.traces)
+
+    def start(self) -> Trace:
+        trace = Trace()
+        self.active.set(self.traces + (trace,))
+        return trace
+
+    def stop(self, trace):
+        self.active.set(tuple(el for el in self.traces if el is not trace))
+
+    @contextmanager
+    def recording(self):
+        trace = self.start()
+        try:
+            yield trace
+        finally:
+            self.stop(trace)
+
+    def span(self, name, **args):
+        if not self.traces:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def count(self, name, value=1):
+        for trace in self.traces:
+            trace.add_count(name, value)
+
+    def traced(self, name):
+        """Decorator recording each call of a function as a span."""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.traces:
+                    return function(*args, **kwargs)
+                with Span(self, name, {}):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+tracer = Tracer()
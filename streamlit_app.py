@@ -1,11 +1,15 @@
+import hashlib
 import streamlit as st
 from notion_utils.notion_api import NotionAPI, list_databases
-from notion_utils.network_graph import NetworkGraphCorrelation, NetworkGraphRelation
+from notion_utils.graph_kinds import GRAPH_KINDS, get_graph_kind
+from notion_utils.tracing import tracer
 import streamlit.components.v1 as components
-import os
 
-AVAILABLE_GRAPHS = [NetworkGraphRelation, NetworkGraphCorrelation]
-GRAPHS_DICT = {gr.name: gr for gr in AVAILABLE_GRAPHS}
+# Seconds before cached Notion data, and everything derived from it, is refreshed
+DATA_TTL = 600
+# Lowest cutoff of the slider: similarity pairs are computed once down to it,
+# then every cutoff only slices them
+MIN_CUTOFF = 0.3
 
 # Title of the app
 st.title("Notion Notes Graph Drawer")
@@ -14,9 +18,14 @@ st.title("Notion Notes Graph Drawer")
 token = st.text_input("Enter your Notion token:", type="password")
 
 
-@st.cache
-def list_databases_with_relations(token):
-    databases = list_databases(token)
+def hash_token(token):
+    """Key caches by a hash of the token, arguments starting with _ are not hashed."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def list_databases_with_relations(token_hash, _token):
+    databases = list_databases(_token)
     databases_with_relations = {}
     for db_name, db_info in databases.items():
         if db_info["self_relation_properties"]:
@@ -24,46 +33,90 @@ def list_databases_with_relations(token):
     return databases_with_relations
 
 
-@st.cache
-def get_notion_data(token, database_name):
-    return NotionAPI(token, database_name)
+@st.cache_resource(ttl=DATA_TTL, show_spinner=False)
+def get_notion_api(token_hash, database_name, _token):
+    return NotionAPI(_token, database_name)
+
+
+@st.cache_data(ttl=DATA_TTL, show_spinner="Fetching pages from Notion")
+def get_notion_data(token_hash, database_name, children_name, _token):
+    notion_api = get_notion_api(token_hash, database_name, _token)
+    return notion_api.full_process(children_name)
+
+
+@st.cache_resource(ttl=DATA_TTL, show_spinner="Embedding pages")
+def get_graph_builder(token_hash, database_name, children_name, graph_kind, _token):
+    """One builder per database and graph kind, keeping its embeddings and similarity pairs."""
+    data, id_to_title = get_notion_data(token_hash, database_name, children_name, _token)
+    network_graph = get_graph_kind(graph_kind)(data, id_to_title)
+    if network_graph.uses_cutoff:
+        network_graph.get_similarity_edges(MIN_CUTOFF)
+    return network_graph
+
+
+@st.cache_data(ttl=DATA_TTL, show_spinner="Building graph")
+def get_graph(token_hash, database_name, children_name, graph_kind, cutoff, _token):
+    network_graph = get_graph_builder(
+        token_hash, database_name, children_name, graph_kind, _token
+    )
+    return network_graph.build_graph(cutoff=cutoff, min_cutoff=MIN_CUTOFF)
+
+
+@st.cache_data(ttl=DATA_TTL, show_spinner="Rendering graph")
+def get_graph_html(
+    token_hash, database_name, children_name, graph_kind, cutoff, overlap, analytics, _token
+):
+    graph = get_graph(token_hash, database_name, children_name, graph_kind, cutoff, _token)
+    if analytics:
+        # Imported here, as it pulls in scipy
+        from notion_utils.analytics import GraphAnalytics
+
+        graph = graph.copy()
+        GraphAnalytics.from_graph(graph).annotate(graph)
+    return get_graph_kind(graph_kind)([]).render_html(graph, overlap=overlap)
 
 
 if token:
     try:
-        databases = list_databases_with_relations(token)
+        databases = list_databases_with_relations(hash_token(token), token)
         database_name = st.selectbox("Select a Notion database:", databases)
     except Exception as e:
         st.error(f"An error occurred: {e}")
     cutoff = st.slider(
-        "Select correlation cutoff:", min_value=0.0, max_value=1.0, value=0.5, step=0.1
+        "Select correlation cutoff:", min_value=MIN_CUTOFF, max_value=1.0, value=0.5, step=0.1
     )
     overlap = st.number_input(
         "Enter overlap for force atlas 2 based:", value=-1000, step=100
     )
-    graph_kind = st.selectbox("Select a graph kind to draw:", list(GRAPHS_DICT.keys()))
+    graph_kind = st.selectbox("Select a graph kind to draw:", list(GRAPH_KINDS))
     children_name = st.selectbox(
         "Name of the children property in Notion:",
         list(databases[database_name]["self_relation_properties"]),
     )
+    analytics = st.checkbox("Size pages by PageRank and colour them by community")
     # Button to trigger the graph drawing
     if st.button("Draw Graph"):
         if not token or not database_name:
             st.warning("Please enter a Notion token and select a database.")
         else:
             try:
-                # Get data from Notion API
-                notion_api = get_notion_data(token, database_name)
-                data, id_to_title = notion_api.full_process(children_name)
-                # Build and display graph
-                GraphBuilder = GRAPHS_DICT[graph_kind]
-                network_graph = GraphBuilder(data, id_to_title)
-                graph = network_graph.build_graph(cutoff=cutoff)
-                network_graph.save_graph_in_html(graph, "tmp.html", overlap=overlap)
-                HtmlFile = open("tmp.html", "r", encoding="utf-8")
-                source_code = HtmlFile.read()
+                GraphBuilder = get_graph_kind(graph_kind)
+                with tracer.recording() as trace:
+                    source_code = get_graph_html(
+                        hash_token(token),
+                        database_name,
+                        children_name,
+                        graph_kind,
+                        # The relation graph does not depend on the cutoff
+                        cutoff if GraphBuilder.uses_cutoff else None,
+                        overlap,
+                        analytics,
+                        token,
+                    )
                 components.html(source_code, height=600 * 2, width=800 * 2)
-                # components.iframe("./tmp.html")
+                with st.expander("Timings"):
+                    # Empty when every stage was served from the cache
+                    st.table(trace.summary())
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
@@ -0,0 +1,104 @@
+"""Local fake of the chat completion API used by the chatgpt_utils tests."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """Answer with the last message reversed, rate limiting some requests first.
+
+    Streamed requests get the answer word by word as server-sent events.
+    Requests whose last message starts with ``rate limit`` get a 429 the
+    first time they are seen, and ones starting with ``fail`` get a 400. Every request sleeps ``delay`` seconds, and the
+    server records how many requests were in flight at once.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = body["messages"][-1]["content"]
+        with server.lock:
+            server.requests.append(body)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            rate_limited = content.startswith("rate limit") and content not in server.seen
+            server.seen.add(content)
+        try:
+            time.sleep(server.delay)
+            if rate_limited:
+                self.send_json(429, {"error": {"message": "Rate limit"}}, {"Retry-After": "0"})
+            elif content.startswith("fail"):
+                self.send_json(400, {"error": {"message": "Bad request"}})
+            elif body.get("stream"):
+                self.send_stream(content[::-1].split(" "))
+            else:
+                self.send_json(200, completion(content[::-1]))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, words):
+        """Send the words as server-sent events, in a chunked response."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        deltas = [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+        events = [{"choices": [{"index": 0, "delta": {"role": "assistant"}}]}]
+        events += [{"choices": [{"index": 0, "delta": {"content": delta}}]} for delta in deltas]
+        for event in [f"data: {json.dumps(el)}" for el in events] + ["data: [DONE]"]:
+            data = f"{event}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def completion(content):
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"total_tokens": len(content) // 4 + 1},
+    }
+
+
+class FakeCompletionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, chunk_delay=0.0, handler=FakeCompletionHandler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.seen = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,84 @@
+import time
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from notion_utils.analytics import MAX_NODE_SIZE, GraphAnalytics
+from notion_utils.network_graph import NetworkGraphRelation
+
+
+class TestGraphAnalytics(unittest.TestCase):
+    def setUp(self):
+        # Two chains of tasks plus an unrelated pair
+        self.relations = nx.DiGraph(
+            [("a", "b"), ("b", "c"), ("c", "d"), ("a", "e"), ("x", "y")]
+        )
+        self.analytics = GraphAnalytics.from_graph(self.relations)
+
+    def test_components_and_degrees(self):
+        components = dict(zip(self.analytics.nodes, self.analytics.components()))
+        self.assertEqual(components["a"], 0)
+        self.assertEqual(components["d"], 0)
+        self.assertEqual(components["x"], 1)
+        in_degrees, out_degrees = self.analytics.degrees()
+        nodes = self.analytics.nodes
+        self.assertEqual(list(out_degrees), [self.relations.out_degree(el) for el in nodes])
+        self.assertEqual(list(in_degrees), [self.relations.in_degree(el) for el in nodes])
+        self.assertEqual(self.analytics.degree_stats()["max"], 2)
+
+    def test_pagerank_matches_networkx(self):
+        graph = nx.gnp_random_graph(200, 0.03, seed=0, directed=True)
+        expected = nx.pagerank(graph)
+        pagerank = GraphAnalytics.from_graph(graph).pagerank()
+        np.testing.assert_allclose(pagerank, [expected[el] for el in graph.nodes], atol=1e-5)
+
+    def test_depths_and_deepest_chains(self):
+        depths = dict(zip(self.analytics.nodes, self.analytics.depths()))
+        self.assertEqual((depths["a"], depths["d"], depths["e"], depths["y"]), (0, 3, 1, 1))
+        self.assertEqual(self.analytics.deepest_chains(1), [["a", "b", "c", "d"]])
+        # Neither prefixes of the longest chain nor a second chain from its root
+        self.assertEqual(self.analytics.deepest_chains(), [["a", "b", "c", "d"], ["x", "y"]])
+        cycle = GraphAnalytics.from_graph(nx.DiGraph([("a", "b"), ("b", "a")]))
+        self.assertEqual(list(cycle.depths()), [-1, -1])
+
+    def test_communities(self):
+        graph = nx.Graph()
+        # Two triangles joined by a weak edge
+        graph.add_weighted_edges_from(
+            [(0, 1, 1.0), (1, 2, 1.0), (0, 2, 1.0), (3, 4, 1.0), (4, 5, 1.0), (3, 5, 1.0)]
+        )
+        graph.add_edge(2, 3, weight=0.1)
+        communities = GraphAnalytics.from_graph(graph).communities()
+        self.assertEqual(len(set(communities[:3])), 1)
+        self.assertEqual(len(set(communities[3:])), 1)
+        self.assertNotEqual(communities[0], communities[3])
+
+    def test_empty_graph(self):
+        summary = GraphAnalytics.from_graph(nx.DiGraph()).summary()
+        self.assertEqual((summary["nodes"], summary["components"]), (0, 0))
+
+    def test_annotate_feeds_the_html_export(self):
+        summary = self.analytics.annotate(self.relations)
+        self.assertEqual(summary["components"], 2)
+        self.assertEqual(summary["deepest_chains"][0], ["a", "b", "c", "d"])
+        node = self.relations.nodes["d"]
+        self.assertEqual(node["depth"], 3)
+        self.assertEqual(node["group"], node["community"])
+        self.assertEqual(node["size"], MAX_NODE_SIZE)
+        network = NetworkGraphRelation([]).get_network(self.relations)
+        groups = {el["id"]: el["group"] for el in network.nodes}
+        self.assertEqual(groups["d"], node["community"])
+
+    def test_large_graph(self):
+        n, m = 100_000, 300_000
+        rng = np.random.default_rng(0)
+        analytics = GraphAnalytics(range(n), rng.integers(0, n, m), rng.integers(0, n, m))
+        start = time.perf_counter()
+        analysis = analytics.analyze()
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(len(analysis["community"]), n)
+
+
+if __name__ == "__main__":
+    unittest.main()
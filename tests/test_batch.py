@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from chatgpt_utils.batch import BatchRunner, completed_ids, read_requests
+from chatgpt_utils.client import AsyncChatClient
+from tests.completion_server import FakeCompletionServer
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmp.name, "prompts.jsonl")
+        self.output_path = os.path.join(self.tmp.name, "results.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_batch(self, url, **kwargs):
+        async def run():
+            async with AsyncChatClient("key", url, backoff=0.01) as client:
+                runner = BatchRunner(client, **kwargs)
+                return await runner.run(self.input_path, self.output_path)
+
+        return asyncio.run(run())
+
+    def test_read_requests_defaults_ids(self):
+        write_jsonl(self.input_path, [{"prompt": "a"}, {"id": "b", "prompt": "b"}])
+        self.assertEqual([el["id"] for el in read_requests(self.input_path)], [0, "b"])
+
+    def test_run_and_resume(self):
+        write_jsonl(
+            self.input_path,
+            [{"id": i, "prompt": f"prompt {i}"} for i in range(20)]
+            + [
+                {"id": "messages", "messages": [{"role": "user", "content": "rate limit"}]},
+                {"id": "failed", "prompt": "fail", "params": {"temperature": 0}},
+            ],
+        )
+        with FakeCompletionServer(delay=0.02) as server:
+            counts = self.run_batch(server.url, max_concurrency=4, chunk_size=8)
+        self.assertEqual(counts, {"answered": 21, "skipped": 0, "failed": 1})
+        self.assertLessEqual(server.max_in_flight, 4)
+        results = {el["id"]: el for el in read_jsonl(self.output_path)}
+        self.assertEqual(results[3]["response"], "3 tpmorp")
+        self.assertEqual(results["messages"]["response"], "timil etar")
+        self.assertIn("error", results["failed"])
+        self.assertEqual(len(completed_ids(self.output_path)), 21)
+
+        with FakeCompletionServer() as server:
+            counts = self.run_batch(server.url)
+        self.assertEqual(counts, {"answered": 0, "skipped": 21, "failed": 1})
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]["temperature"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
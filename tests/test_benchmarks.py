@@ -0,0 +1,64 @@
+import os
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from benchmarks.run import run_size
+from benchmarks.stub_server import StubNotionServer
+from benchmarks.workspace import CHILDREN_NAME, SyntheticWorkspace
+from notion_utils.notion_api import NotionAPI, sync_databases
+from notion_utils.schema_index import SchemaIndex
+
+
+class TestSyntheticWorkspace(unittest.TestCase):
+    def test_pages(self):
+        workspace = SyntheticWorkspace(20, fan_out=2, summary_words=5, n_databases=2)
+        self.assertEqual(len(workspace.databases), 2)
+        pages = workspace.pages["db-0001"]
+        self.assertEqual(len(pages), 20)
+        record = NotionAPI.parse_page(pages[3], CHILDREN_NAME)
+        self.assertEqual(len(record["children"]), 2)
+        self.assertEqual(len(record["summary"].split()), 5)
+        self.assertEqual(workspace.database_name(1), "Database 1")
+
+
+class TestStubNotionServer(unittest.TestCase):
+    def test_search_and_paginated_query_with_rate_limits(self):
+        workspace = SyntheticWorkspace(250)
+        with StubNotionServer(workspace, rate_limit_every=3) as server:
+            schema_index = SchemaIndex()
+            sync_databases("token", schema_index, server.url)
+            databases = schema_index.databases()
+            self.assertEqual(databases["Database 0"]["self_relation_properties"], [CHILDREN_NAME])
+            notion_api = NotionAPI(
+                "token", "Database 0", base_url=server.url, schema_index=schema_index
+            )
+            data, _ = notion_api.full_process(CHILDREN_NAME, ["2023-01-01T02:00:00.000Z"])
+            self.assertEqual(len(data), 250)
+            self.assertGreater(server.request_count, 6)
+            response = requests.post(f"{server.url}/databases/missing/query", json={})
+            self.assertIn(response.status_code, (404, 429))
+
+
+class TestRunSize(unittest.TestCase):
+    def test_run_size(self):
+        results = run_size(50, stages=("fetch", "relations", "correlations"))
+        self.assertEqual([el["stage"] for el in results], ["fetch", "relations", "correlations"])
+        self.assertEqual(results[1]["edges"], 150)
+        for row in results:
+            self.assertGreater(row["peak_rss_mb"], 0)
+            self.assertEqual(row["items"], 50)
+
+    def test_render_keeps_the_working_directory(self):
+        cwd = os.getcwd()
+        results = run_size(20, stages=("render",))
+        self.assertEqual([el["stage"] for el in results], ["fetch", "relations", "render"])
+        self.assertEqual(os.getcwd(), cwd)
+        with patch("benchmarks.run.MAX_RENDER_PAGES", 10):
+            results = run_size(20, stages=("render",))
+        self.assertEqual(results[-1]["stage"], "relations")
+
+
+if __name__ == "__main__":
+    unittest.main()
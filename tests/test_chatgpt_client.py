@@ -0,0 +1,163 @@
+import asyncio
+import email.utils
+import sys
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from chatgpt_utils.client import AsyncChatClient, estimate_tokens, parse_event
+from chatgpt_utils.interface import ROLE_ASSISTANT, ROLE_USER, AsyncChatGPTBot, ChatGPTBot
+from chatgpt_utils.rate_limit import RateLimiter, TokenBucket
+from tests.completion_server import FakeCompletionServer
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire_waits_for_refill(self):
+        async def run():
+            bucket = TokenBucket(600, capacity=1)
+            start = time.monotonic()
+            for _ in range(3):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.19)
+
+    def test_adjust_is_capped(self):
+        bucket = TokenBucket(60, capacity=10)
+        bucket.adjust(100)
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_rate_limiter_without_limits(self):
+        asyncio.run(RateLimiter().acquire(10**9))
+
+
+class TestAsyncChatClient(unittest.TestCase):
+    def test_retry_delay(self):
+        client = AsyncChatClient("key", backoff=0.01)
+
+        def response(retry_after):
+            return MagicMock(headers={"Retry-After": retry_after})
+
+        self.assertEqual(client.retry_delay(0, response("3")), 3.0)
+        # An HTTP date in the past, or an unreadable value, leaves the jittered backoff
+        for value in ("Wed, 21 Oct 2015 07:28:00 GMT", "soon"):
+            self.assertLessEqual(client.retry_delay(0, response(value)), 0.01)
+        later = email.utils.format_datetime(
+            datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True
+        )
+        self.assertAlmostEqual(client.retry_delay(0, response(later)), 30, delta=2)
+        asyncio.run(client.aclose())
+
+    def test_estimate_tokens(self):
+        messages = [{"role": ROLE_USER, "content": "a" * 40}]
+        with patch("chatgpt_utils.history.get_encoding", return_value=None):
+            self.assertEqual(estimate_tokens(messages, max_tokens=5), 19)
+        with patch("chatgpt_utils.client.message_tokens") as message_tokens:
+            self.assertEqual(estimate_tokens(messages, max_tokens=5, prompt_tokens=7), 12)
+        message_tokens.assert_not_called()
+
+    def test_bot_passes_its_token_count(self):
+        async def run(url):
+            async with AsyncChatClient("key", url) as client:
+                bot = AsyncChatGPTBot(client)
+                bot.add_message(ROLE_USER, "hello there")
+                with patch("chatgpt_utils.client.message_tokens") as message_tokens:
+                    await bot.generate_response()
+                    deltas = [delta async for delta in bot.stream_response()]
+                message_tokens.assert_not_called()
+                return bot, deltas
+
+        with FakeCompletionServer() as server:
+            bot, deltas = asyncio.run(run(server.url))
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(bot.messages[-1]["content"], "".join(deltas))
+
+    def test_bots_run_concurrently_within_limit(self):
+        async def run(url):
+            async with AsyncChatClient("key", url, max_concurrency=4) as client:
+                bots = [AsyncChatGPTBot(client) for _ in range(12)]
+                return bots, await asyncio.gather(
+                    *[
+                        bot.add_message_and_generate_response(ROLE_USER, f"hello {i}")
+                        for i, bot in enumerate(bots)
+                    ]
+                )
+
+        with FakeCompletionServer(delay=0.05) as server:
+            bots, responses = asyncio.run(run(server.url))
+        self.assertEqual(responses, [f"hello {i}"[::-1] for i in range(12)])
+        self.assertEqual(bots[3].messages[-1], {"role": ROLE_ASSISTANT, "content": "3 olleh"})
+        self.assertLessEqual(server.max_in_flight, 4)
+        self.assertGreater(server.max_in_flight, 1)
+
+    def test_retries_rate_limited_requests(self):
+        async def run(url):
+            async with AsyncChatClient("key", url, backoff=0.01) as client:
+                bot = AsyncChatGPTBot(client, temperature=0)
+                return await bot.add_message_and_generate_response(ROLE_USER, "rate limit")
+
+        with FakeCompletionServer() as server:
+            self.assertEqual(asyncio.run(run(server.url)), "timil etar")
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[0]["temperature"], 0)
+
+    def test_gives_up_after_max_retries(self):
+        async def run(url):
+            async with AsyncChatClient("key", url, max_retries=0) as client:
+                return await client.complete("model", [{"role": ROLE_USER, "content": "rate limit"}])
+
+        with FakeCompletionServer() as server:
+            with self.assertRaises(Exception):
+                asyncio.run(run(server.url))
+
+    def test_parse_event(self):
+        self.assertEqual(parse_event('data: {"choices": [{"delta": {"content": "a"}}]}'), "a")
+        self.assertEqual(parse_event('data: {"choices": [{"delta": {}}]}'), "")
+        self.assertEqual(parse_event(""), "")
+        self.assertIsNone(parse_event("data: [DONE]"))
+
+    def test_stream_response(self):
+        async def run(url):
+            async with AsyncChatClient("key", url, backoff=0.01) as client:
+                bot = AsyncChatGPTBot(client)
+                bot.add_message(ROLE_USER, "rate limit one two")
+                deltas, arrivals = [], []
+                async for delta in bot.stream_response():
+                    deltas.append(delta)
+                    arrivals.append(time.perf_counter())
+                return bot, deltas, arrivals
+
+        with FakeCompletionServer(chunk_delay=0.05) as server:
+            bot, deltas, arrivals = asyncio.run(run(server.url))
+        self.assertEqual(deltas, ["owt", " eno", " timil", " etar"])
+        self.assertEqual(bot.messages[-1], {"role": ROLE_ASSISTANT, "content": "owt eno timil etar"})
+        stats = bot.stream_stats
+        self.assertEqual(stats.tokens, 4)
+        # Each delta is yielded as its chunk arrives, not once the response is complete
+        self.assertGreaterEqual(arrivals[-1] - arrivals[0], 0.1)
+        self.assertGreaterEqual(stats.end - stats.first_token, 0.1)
+        self.assertGreater(stats.tokens_per_second, 0)
+
+
+class TestChatGPTBot(unittest.TestCase):
+    def test_stream_response(self):
+        openai = MagicMock()
+        openai.ChatCompletion.create.return_value = iter(
+            [
+                {"choices": [{"delta": {"role": ROLE_ASSISTANT}}]},
+                {"choices": [{"delta": {"content": "Hello"}}]},
+                {"choices": [{"delta": {"content": " there"}}]},
+            ]
+        )
+        bot = ChatGPTBot("key")
+        bot.add_message(ROLE_USER, "Hi")
+        with patch.dict(sys.modules, {"openai": openai}):
+            self.assertEqual(list(bot.stream_response()), ["Hello", " there"])
+        self.assertEqual(openai.ChatCompletion.create.call_args.kwargs["api_key"], "key")
+        self.assertEqual(bot.messages[-1], {"role": ROLE_ASSISTANT, "content": "Hello there"})
+        self.assertEqual(bot.stream_stats.tokens, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from chatgpt_utils.cache import CacheMiss, CompletionCache, completion_key, text_completion
+from chatgpt_utils.client import AsyncChatClient
+from chatgpt_utils.interface import ROLE_USER, AsyncChatGPTBot, ChatGPTBot
+from tests.completion_server import FakeCompletionServer
+
+MESSAGES = [{"role": ROLE_USER, "content": "Hi"}]
+
+
+class TestCompletionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "completions.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_completion_key(self):
+        key = completion_key("model", MESSAGES, {"temperature": 0})
+        self.assertEqual(key, completion_key("model", MESSAGES, {"temperature": 0, "stream": True}))
+        self.assertNotEqual(key, completion_key("model", MESSAGES, {"temperature": 1}))
+        self.assertNotEqual(key, completion_key("other", MESSAGES, {"temperature": 0}))
+
+    def test_memory_lru(self):
+        cache = CompletionCache(max_entries=2)
+        for key in "abc":
+            cache.put(key, text_completion(key))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), text_completion("c"))
+
+    def test_disk_tier_survives_restart(self):
+        cache = CompletionCache(self.path, max_entries=1)
+        cache.put("a", text_completion("a"))
+        cache.put("b", text_completion("b"))
+        self.assertEqual(cache.get("a"), text_completion("a"))
+        cache.close()
+        cache = CompletionCache(self.path)
+        self.assertEqual(cache.get("b"), text_completion("b"))
+        cache.close()
+
+    def test_disk_eviction_by_size(self):
+        cache = CompletionCache(self.path, max_entries=1, max_bytes=250)
+        for key in "abcd":
+            cache.put(key, text_completion(key * 10))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("d"), text_completion("d" * 10))
+        cache.close()
+
+    def test_modes(self):
+        with self.assertRaises(ValueError):
+            CompletionCache(mode="bogus")
+        cache = CompletionCache(mode="replay")
+        with self.assertRaises(CacheMiss):
+            cache.lookup("a")
+        cache.put("a", text_completion("a"))
+        self.assertEqual(cache.lookup("a"), text_completion("a"))
+        cache.mode = "record"
+        self.assertIsNone(cache.lookup("a"))
+
+
+class TestCachedBots(unittest.TestCase):
+    def test_chatgpt_bot_uses_cache(self):
+        openai = MagicMock()
+        openai.ChatCompletion.create.return_value.choices[0].message.content = "Hello"
+        cache = CompletionCache()
+        with patch.dict(sys.modules, {"openai": openai}):
+            for _ in range(2):
+                bot = ChatGPTBot("key", cache=cache)
+                self.assertEqual(bot.add_message_and_generate_response(ROLE_USER, "Hi"), "Hello")
+        openai.ChatCompletion.create.assert_called_once()
+
+    def test_chatgpt_bot_streams_through_cache(self):
+        openai = MagicMock()
+        openai.ChatCompletion.create.return_value = iter(
+            [
+                {"choices": [{"delta": {"content": "Hel"}}]},
+                {"choices": [{"delta": {"content": "lo"}}]},
+            ]
+        )
+        cache = CompletionCache()
+        with patch.dict(sys.modules, {"openai": openai}):
+            for deltas in (["Hel", "lo"], ["Hello"]):
+                bot = ChatGPTBot("key", cache=cache)
+                bot.add_message(ROLE_USER, "Hi")
+                self.assertEqual(list(bot.stream_response()), deltas)
+                self.assertEqual(bot.messages[-1]["content"], "Hello")
+        openai.ChatCompletion.create.assert_called_once()
+        cache.mode = "replay"
+        bot = ChatGPTBot("key", cache=cache)
+        bot.add_message(ROLE_USER, "Unknown")
+        with self.assertRaises(CacheMiss):
+            list(bot.stream_response())
+
+    def test_record_then_replay_offline(self):
+        async def run(url, cache, stream):
+            async with AsyncChatClient("key", url, cache=cache) as client:
+                bot = AsyncChatGPTBot(client, temperature=0)
+                bot.add_message(ROLE_USER, "hello there")
+                if stream:
+                    return "".join([delta async for delta in bot.stream_response()])
+                return await bot.generate_response()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "completions.sqlite")
+            cache = CompletionCache(path, mode="record")
+            with FakeCompletionServer() as server:
+                self.assertEqual(asyncio.run(run(server.url, cache, False)), "ereht olleh")
+            cache.close()
+            replay = CompletionCache(path, mode="replay")
+            # Nothing listens on this port anymore
+            self.assertEqual(asyncio.run(run(server.url, replay, False)), "ereht olleh")
+            self.assertEqual(asyncio.run(run(server.url, replay, True)), "ereht olleh")
+            replay.close()
+        self.assertEqual(len(server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from chatgpt_utils.client import AsyncChatClient
+from chatgpt_utils.discussion import (
+    ChatGPTDiscussion,
+    JsonlSink,
+    run_discussions,
+    stop_on_phrase,
+)
+from chatgpt_utils.interface import (
+    ROLE_ASSISTANT,
+    ROLE_SYSTEM,
+    ROLE_USER,
+    AsyncChatGPTBot,
+    ChatGPTBot,
+)
+from tests.completion_server import FakeCompletionServer
+
+
+class TestChatGPTDiscussion(unittest.TestCase):
+    def test_astream_turn_pipes_response_to_listener(self):
+        async def run(url):
+            async with AsyncChatClient("key", url) as client:
+                bot1, bot2 = AsyncChatGPTBot(client), AsyncChatGPTBot(client)
+                discussion = ChatGPTDiscussion(bot1, bot2)
+                bot1.add_message(ROLE_USER, "good morning")
+                deltas = [delta async for delta in discussion.astream_turn(bot1, bot2)]
+                reply = [delta async for delta in discussion.astream_turn(bot2, bot1)]
+                return bot1, bot2, deltas, reply
+
+        with FakeCompletionServer() as server:
+            bot1, bot2, deltas, reply = asyncio.run(run(server.url))
+        self.assertEqual("".join(deltas), "gninrom doog")
+        self.assertEqual(bot2.messages[0], {"role": ROLE_USER, "content": "gninrom doog"})
+        self.assertEqual("".join(reply), "good morning")
+        self.assertEqual(bot1.messages[-1], {"role": ROLE_USER, "content": "good morning"})
+        self.assertEqual(bot2.messages[-1], {"role": ROLE_ASSISTANT, "content": "good morning"})
+
+    def test_set_role_does_not_call_the_api(self):
+        bot1, bot2 = ChatGPTBot("key"), ChatGPTBot("key")
+        bot1.generate_response = MagicMock()
+        ChatGPTDiscussion(bot1, bot2).set_role("Plato", "Socrates")
+        bot1.generate_response.assert_not_called()
+        self.assertEqual(bot1.messages[0]["role"], ROLE_SYSTEM)
+        self.assertIn("Socrates", bot2.messages[0]["content"])
+
+    def test_kickoff_discussion_stops_on_condition(self):
+        bot1, bot2 = ChatGPTBot("key"), ChatGPTBot("key")
+        bot1.generate_response = MagicMock(side_effect=["Hello", "Goodbye then"])
+        bot2.generate_response = MagicMock(side_effect=["How are you?"])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "transcripts.jsonl")
+            with JsonlSink(path) as sink:
+                discussion = ChatGPTDiscussion(
+                    bot1,
+                    bot2,
+                    stop_conditions=[stop_on_phrase("goodbye")],
+                    sink=sink,
+                    discussion_id=7,
+                )
+                self.assertEqual(discussion.kickoff_discussion("Hi"), 3)
+            with open(path, encoding="utf-8") as f:
+                turns = [json.loads(line) for line in f]
+        self.assertEqual(
+            [(el["turn"], el["speaker"], el["content"]) for el in turns],
+            [(0, "bot1", "Hello"), (1, "bot2", "How are you?"), (2, "bot1", "Goodbye then")],
+        )
+        self.assertEqual(turns[0]["discussion"], 7)
+        self.assertEqual(bot2.messages[0], {"role": ROLE_USER, "content": "Hello"})
+
+    def test_run_discussions_concurrently(self):
+        async def run(url, path):
+            async with AsyncChatClient("key", url, max_concurrency=8) as client:
+                with JsonlSink(path) as sink:
+                    discussions = [
+                        ChatGPTDiscussion(
+                            AsyncChatGPTBot(client),
+                            AsyncChatGPTBot(client),
+                            max_turns=4,
+                            sink=sink,
+                            discussion_id=i,
+                        )
+                        for i in range(10)
+                    ]
+                    return await run_discussions(
+                        discussions, [f"topic {i}" for i in range(10)], max_concurrency=5
+                    )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "transcripts.jsonl")
+            with FakeCompletionServer(delay=0.02) as server:
+                counts = asyncio.run(run(server.url, path))
+            with open(path, encoding="utf-8") as f:
+                turns = [json.loads(line) for line in f]
+        self.assertEqual(counts, [4] * 10)
+        self.assertEqual(len(turns), 40)
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLessEqual(server.max_in_flight, 5)
+        first = [el for el in turns if el["discussion"] == 3]
+        self.assertEqual([el["content"] for el in first], ["3 cipot", "topic 3"] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from notion_utils.embedding_cache import VECTORS_FILE, EmbeddingCache, embedding_key
+
+
+def fake_encode(texts):
+    return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_embedding_key(self):
+        self.assertNotEqual(embedding_key("model1", "a"), embedding_key("model2", "a"))
+        self.assertEqual(embedding_key("model1", "a"), embedding_key("model1", "a"))
+
+    def test_embed_only_encodes_missing_texts(self):
+        cache = EmbeddingCache(self.path)
+        encode = MagicMock(side_effect=fake_encode)
+        embeddings = cache.embed("model", ["a", "bb", "a"], encode)
+        np.testing.assert_array_equal(embeddings[:, 0], [1, 2, 1])
+        encode.assert_called_once_with(["a", "bb"])
+
+        encode.reset_mock()
+        cache.embed("model", ["bb", "ccc"], encode)
+        encode.assert_called_once_with(["ccc"])
+
+    def test_embed_without_batch_size_encodes_once(self):
+        cache = EmbeddingCache(self.path)
+        encode = MagicMock(side_effect=fake_encode)
+        cache.embed("model", [str(i) for i in range(600)], encode, batch_size=None)
+        encode.assert_called_once()
+        cache.embed("model", [], encode, batch_size=None)
+        encode.assert_called_once()
+
+    def test_warm_run_does_not_encode(self):
+        EmbeddingCache(self.path).embed("model", ["a", "bb"], fake_encode)
+        encode = MagicMock(side_effect=fake_encode)
+        cache = EmbeddingCache(self.path)
+        embeddings = cache.embed("model", ["bb", "a"], encode)
+        encode.assert_not_called()
+        np.testing.assert_array_equal(embeddings[:, 0], [2, 1])
+
+    def test_evict_least_recently_used(self):
+        row_bytes = 3 * 4
+        EmbeddingCache(self.path).embed("model", ["a", "bb"], fake_encode)
+        cache = EmbeddingCache(self.path, max_bytes=2 * row_bytes)
+        cache.embed("model", ["ccc"], fake_encode)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(embedding_key("model", "ccc"), cache.entries)
+
+    def test_file_respects_the_budget(self):
+        max_bytes = 64 * 2**10
+        cache = EmbeddingCache(self.path, max_bytes=max_bytes)
+        for start in range(0, 20000, 2500):
+            cache.embed("model", [str(i) for i in range(start, start + 2500)], fake_encode)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        # The npy header is 128 bytes
+        self.assertLessEqual(os.path.getsize(vectors_path), max_bytes + 128)
+        cache = EmbeddingCache(self.path, max_bytes=max_bytes)
+        encode = MagicMock(side_effect=fake_encode)
+        embeddings = cache.embed("model", ["19999", "19998"], encode)
+        encode.assert_not_called()
+        np.testing.assert_array_equal(embeddings[:, 0], [5, 5])
+
+    def test_model_with_another_size(self):
+        cache = EmbeddingCache(self.path)
+        cache.embed("model", ["a"], fake_encode)
+        with self.assertRaisesRegex(ValueError, "size 3, not 2"):
+            cache.embed("other", ["a"], lambda texts: np.zeros((len(texts), 2)))
+        np.testing.assert_array_equal(cache.embed("model", ["a"], fake_encode), [[1, 1, 0]])
+
+    def test_float16(self):
+        cache = EmbeddingCache(self.path, dtype="float16")
+        embeddings = cache.embed("model", ["a"], fake_encode)
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(cache.vectors.dtype, np.float16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+from notion_utils.embedding_pipeline import encode_parallel, length_sorted_batches
+
+
+def fake_encode(texts, **kwargs):
+    return np.array([[len(text), 0.0] for text in texts], dtype=np.float32)
+
+
+class TestEmbeddingPipeline(unittest.TestCase):
+    def test_length_sorted_batches(self):
+        batches = length_sorted_batches(["ccc", "a", "dddd", "bb", "e"], batch_size=2)
+        self.assertEqual([list(batch) for batch in batches], [[1, 4], [3, 0], [2]])
+
+    @patch("notion_utils.embedding_pipeline.get_model")
+    def test_encode_in_process(self, mock_get_model):
+        mock_get_model.return_value.encode.side_effect = fake_encode
+        progress = MagicMock()
+        texts = ["ccc", "a", "dddd", "bb", "e"]
+        embeddings = encode_parallel(texts, batch_size=2, workers=1, progress=progress)
+        np.testing.assert_array_equal(embeddings[:, 0], [3, 1, 4, 2, 1])
+        self.assertEqual(progress.call_count, 3)
+        self.assertEqual(progress.call_args.args[:2], (5, 5))
+
+    @patch("notion_utils.embedding_pipeline.get_model")
+    def test_encode_into_preallocated_output(self, mock_get_model):
+        mock_get_model.return_value.encode.side_effect = fake_encode
+        out = np.zeros((2, 2), dtype=np.float32)
+        result = encode_parallel(["a", "bb"], workers=1, out=out, progress=None)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out[:, 0], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
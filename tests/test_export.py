@@ -0,0 +1,50 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from notion_utils.export import export_graph
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.graph = nx.Graph()
+        self.graph.add_node("id1", label="Title1")
+        self.graph.add_node("id2", label="Title2")
+        self.graph.add_edge("id1", "id2", weight=0.75)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_json_gz(self):
+        export_graph(self.graph, self.path("graph.json.gz"), "json.gz")
+        with gzip.open(self.path("graph.json.gz"), "rt") as f:
+            data = json.load(f)
+        self.assertEqual(len(data["nodes"]), 2)
+        self.assertEqual(data["links"][0]["weight"], 0.75)
+
+    def test_gexf(self):
+        export_graph(self.graph, self.path("graph.gexf"), "gexf")
+        graph = nx.read_gexf(self.path("graph.gexf"))
+        self.assertEqual(set(graph.edges), {("id1", "id2")})
+
+    def test_npz(self):
+        export_graph(self.graph, self.path("graph.npz"), "npz")
+        with np.load(self.path("graph.npz")) as data:
+            self.assertEqual(list(data["labels"]), ["Title1", "Title2"])
+            self.assertEqual(data["sources"].dtype, np.int32)
+            np.testing.assert_allclose(data["weights"], [0.75])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_graph(self.graph, self.path("graph.csv"), "csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from chatgpt_utils.history import (
+    MESSAGE_OVERHEAD,
+    SUMMARY_PREFIX,
+    ConversationHistory,
+    count_tokens,
+    get_encoding,
+)
+from chatgpt_utils.interface import ROLE_ASSISTANT, ROLE_SYSTEM, ROLE_USER, ChatGPTBot
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 40 characters, 10 tokens without tiktoken
+TEXT = "a" * 40
+
+
+def without_tiktoken(test_case):
+    """Count four characters per token, whether tiktoken is installed or not."""
+    patcher = patch("chatgpt_utils.history.get_encoding", return_value=None)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+class FakeEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+class TestCountTokens(unittest.TestCase):
+    def test_fallback(self):
+        without_tiktoken(self)
+        self.assertEqual(count_tokens(TEXT), 10)
+
+    def test_encoding(self):
+        with patch("chatgpt_utils.history.get_encoding", return_value=FakeEncoding()):
+            self.assertEqual(count_tokens("one two three"), 3)
+            history = ConversationHistory()
+            history.append(ROLE_USER, "one two")
+            self.assertEqual(history.total, 2 + MESSAGE_OVERHEAD)
+
+    @unittest.skipIf(tiktoken is None, "tiktoken is not installed")
+    def test_tiktoken(self):
+        self.assertIsNotNone(get_encoding("gpt-3.5-turbo"))
+        self.assertIsNotNone(get_encoding("unknown-model"))
+        self.assertEqual(count_tokens("hello world"), 2)
+
+
+class TestConversationHistory(unittest.TestCase):
+    def setUp(self):
+        without_tiktoken(self)
+
+    def test_counts_tokens_once(self):
+        history = ConversationHistory()
+        history.append(ROLE_USER, TEXT)
+        history.append(ROLE_ASSISTANT, TEXT)
+        self.assertEqual(history.total, 2 * (10 + MESSAGE_OVERHEAD))
+        self.assertEqual(history.request_tokens(max_tokens=5), 2 * (10 + MESSAGE_OVERHEAD) + 5)
+
+    def test_compact_evicts_oldest_turns_and_keeps_system_prompt(self):
+        history = ConversationHistory(max_tokens=3 * (10 + MESSAGE_OVERHEAD))
+        history.append(ROLE_SYSTEM, TEXT, pin=True)
+        for i in range(5):
+            history.append(ROLE_USER, f"{i}" + TEXT[1:])
+        history.compact()
+        self.assertLessEqual(history.total, history.max_tokens)
+        self.assertEqual(history.messages[0]["role"], ROLE_SYSTEM)
+        self.assertEqual([el["content"][0] for el in history.messages[1:]], ["3", "4"])
+        self.assertEqual(history.total, sum(history.token_counts))
+
+    def test_compact_keeps_last_messages_over_budget(self):
+        history = ConversationHistory(max_tokens=1)
+        history.append(ROLE_USER, TEXT)
+        history.append(ROLE_ASSISTANT, TEXT)
+        history.compact()
+        self.assertEqual(len(history), 2)
+
+    def test_compact_summarizes_evicted_turns(self):
+        summarize = MagicMock(side_effect=lambda messages: f"{len(messages)} messages")
+        history = ConversationHistory(max_tokens=50, summarize=summarize, keep_last=1)
+        history.append(ROLE_SYSTEM, TEXT, pin=True)
+        for _ in range(4):
+            history.append(ROLE_USER, TEXT)
+        history.compact()
+        self.assertLessEqual(history.total, 50)
+        self.assertEqual(history.messages[0]["content"], TEXT)
+        self.assertEqual(history.messages[1]["content"], f"{SUMMARY_PREFIX}2 messages")
+        self.assertEqual(len(history), 3)
+        history.append(ROLE_USER, TEXT)
+        history.append(ROLE_USER, TEXT)
+        history.compact()
+        # The previous summary is folded into the new one
+        self.assertEqual(
+            summarize.call_args.args[0][0]["content"], f"{SUMMARY_PREFIX}2 messages"
+        )
+        self.assertEqual(history.messages[1]["content"], f"{SUMMARY_PREFIX}3 messages")
+        self.assertEqual(history.total, sum(history.token_counts))
+
+
+class TestChatGPTBotHistory(unittest.TestCase):
+    def setUp(self):
+        without_tiktoken(self)
+
+    def test_request_tokens_reported_before_sending(self):
+        on_request = MagicMock()
+        bot = ChatGPTBot("key", max_history_tokens=100, on_request=on_request)
+        bot.add_message(ROLE_SYSTEM, TEXT)
+        bot.add_message(ROLE_USER, TEXT)
+        self.assertEqual(bot.prepare_request(max_tokens=10), bot.messages)
+        on_request.assert_called_once_with(2 * (10 + MESSAGE_OVERHEAD) + 10)
+        bot.reset_conversation()
+        self.assertEqual(bot.messages, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from notion_utils.incremental import IncrementalGraphs
+
+VECTORS = {
+    "alpha": [1.0, 0.0, 0.0],
+    "alpha bis": [0.9, 0.1, 0.0],
+    "beta": [0.0, 1.0, 0.0],
+    "gamma": [0.0, 0.0, 1.0],
+}
+
+
+def encode(texts):
+    return np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+
+def make_record(page_id, title, children=()):
+    return {"id": page_id, "title": title, "summary": "", "children": list(children)}
+
+
+class TestIncrementalGraphs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.encode = MagicMock(side_effect=encode)
+        self.graphs = IncrementalGraphs(self.tmp.name, self.encode, cutoff=0.5)
+        self.graphs.apply(
+            [
+                make_record("a", "alpha", ["b", "c"]),
+                make_record("b", "alpha bis"),
+                make_record("c", "beta"),
+            ]
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_initial_build(self):
+        self.assertEqual(set(self.graphs.relations.edges), {("a", "b"), ("a", "c")})
+        self.assertEqual(set(map(frozenset, self.graphs.similarities.edges)), {frozenset("ab")})
+        self.assertEqual(self.graphs.relations.nodes["a"]["label"], "alpha")
+
+    def test_unchanged_pages_are_not_embedded_again(self):
+        self.encode.reset_mock()
+        changed = self.graphs.apply([make_record("b", "alpha bis")])
+        self.assertEqual(changed, set())
+        self.encode.assert_not_called()
+
+    def test_edit_only_embeds_changed_pages(self):
+        self.encode.reset_mock()
+        changed = self.graphs.apply([make_record("b", "gamma")])
+        self.assertEqual(changed, {"relations", "similarities"})
+        self.encode.assert_called_once_with(["gamma"])
+        self.assertEqual(self.graphs.similarities.number_of_edges(), 0)
+
+    def test_children_edit_and_pending_child(self):
+        changed = self.graphs.apply([make_record("a", "alpha", ["c", "d"])])
+        self.assertEqual(changed, {"relations"})
+        self.assertEqual(set(self.graphs.relations.edges), {("a", "c")})
+        self.graphs.apply([make_record("d", "gamma")])
+        self.assertEqual(set(self.graphs.relations.edges), {("a", "c"), ("a", "d")})
+
+    def test_dropped_pending_child(self):
+        self.graphs.apply([make_record("a", "alpha", ["b", "c", "d"])])
+        self.graphs.apply([make_record("a", "alpha", ["b", "c"])])
+        self.graphs.apply([make_record("d", "gamma")])
+        self.assertNotIn(("a", "d"), self.graphs.relations.edges)
+        self.assertEqual(self.graphs.pending, {})
+
+    def test_load_with_another_cutoff_rescores(self):
+        self.graphs.save()
+        self.encode.reset_mock()
+        loaded = IncrementalGraphs(self.tmp.name, self.encode, cutoff=0.999)
+        self.assertEqual(loaded.cutoff, 0.999)
+        self.assertEqual(loaded.similarities.number_of_edges(), 0)
+        self.assertEqual(loaded.apply([]), {"similarities"})
+        self.encode.assert_not_called()
+        loaded = IncrementalGraphs(self.tmp.name, self.encode, cutoff=0.5)
+        self.assertEqual(set(map(frozenset, loaded.similarities.edges)), {frozenset("ab")})
+
+    def test_delete(self):
+        changed = self.graphs.apply([], deleted=["b", "unknown"])
+        self.assertEqual(changed, {"relations", "similarities"})
+        self.assertNotIn("b", self.graphs.relations)
+        self.assertEqual(self.graphs.similarities.number_of_edges(), 0)
+        self.assertEqual(self.graphs.apply([], deleted=["b"]), set())
+
+    def test_full_apply_deletes_missing_pages(self):
+        changed = self.graphs.apply(
+            [make_record("a", "alpha", ["b", "c"]), make_record("c", "beta")], full=True
+        )
+        self.assertEqual(changed, {"relations", "similarities"})
+        self.assertEqual(set(self.graphs.relations), {"a", "c"})
+        self.assertNotIn("b", self.graphs.text_hashes)
+
+    def test_save_and_load(self):
+        self.graphs.apply([make_record("a", "alpha", ["b", "c", "d"])])
+        self.graphs.watermark = "t1"
+        self.graphs.save()
+        loaded = IncrementalGraphs(self.tmp.name, self.encode)
+        self.assertEqual(loaded.watermark, "t1")
+        self.assertEqual(set(loaded.relations.edges), set(self.graphs.relations.edges))
+        self.assertEqual(
+            set(map(frozenset, loaded.similarities.edges)),
+            set(map(frozenset, self.graphs.similarities.edges)),
+        )
+        self.encode.reset_mock()
+        changed = loaded.apply([make_record("d", "alpha")])
+        self.encode.assert_called_once_with(["alpha"])
+        self.assertEqual(changed, {"relations", "similarities"})
+        self.assertIn(("a", "d"), loaded.relations.edges)
+        self.assertEqual(loaded.similarities.nodes["a"]["label"], "alpha")
+
+
+if __name__ == "__main__":
+    unittest.main()
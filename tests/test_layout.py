@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from notion_utils.layout import (
+    _exact_repulsion,
+    _grid_repulsion,
+    compute_layout,
+    force_layout,
+)
+
+
+class TestLayout(unittest.TestCase):
+    def test_force_layout(self):
+        graph = nx.path_graph(30)
+        sources, targets = np.array(graph.edges).T
+        pos = force_layout(30, sources, targets, iterations=50)
+        self.assertEqual(pos.shape, (30, 2))
+        self.assertLessEqual(np.abs(pos).max(), 1.0)
+        # Linked nodes end up closer than the ends of the path
+        linked = np.linalg.norm(pos[0] - pos[1])
+        self.assertLess(linked, np.linalg.norm(pos[0] - pos[29]))
+
+    def test_grid_repulsion_approximates_exact(self):
+        pos = np.random.default_rng(0).uniform(-1, 1, size=(2000, 2))
+        exact = _exact_repulsion(pos, 0.01)
+        approx = _grid_repulsion(pos, 0.01)
+        error = np.linalg.norm(exact - approx) / np.linalg.norm(exact)
+        self.assertLess(error, 0.1)
+
+    def test_large_graph_uses_grid(self):
+        rng = np.random.default_rng(0)
+        pos = force_layout(
+            300, rng.integers(300, size=600), rng.integers(300, size=600), 10, exact_limit=100
+        )
+        self.assertTrue(np.isfinite(pos).all())
+
+    def test_compute_layout_cache(self):
+        graph = nx.Graph([("a", "b"), ("b", "c")])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            positions = compute_layout(graph, tmp_dir, iterations=10)
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            cached = compute_layout(graph, tmp_dir, iterations=10)
+        self.assertEqual(set(positions), {"a", "b", "c"})
+        np.testing.assert_array_equal(positions["a"], cached["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
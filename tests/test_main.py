@@ -0,0 +1,50 @@
+import json
+import subprocess
+import sys
+import time
+import unittest
+
+from notion_utils.graph_kinds import GRAPH_KINDS, get_graph_kind
+
+HEAVY_MODULES = ["networkx", "pandas", "pyvis", "scipy", "sentence_transformers", "sklearn", "torch"]
+# Seconds, --help took 3.4s with the heavy imports at module level and 0.6s without
+STARTUP_BUDGET = 2.0
+
+
+def imported_heavy_modules(module) -> list:
+    """Heavy modules loaded by importing ``module`` in a fresh interpreter."""
+    code = (
+        f"import json, sys, {module}; "
+        f"print(json.dumps([el for el in {HEAVY_MODULES!r} if el in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_does_not_import_heavy_modules(self):
+        self.assertEqual(imported_heavy_modules("notion_utils.main"), [])
+        self.assertEqual(imported_heavy_modules("notion_utils.notion_api"), [])
+
+    def test_help_within_budget(self):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "notion_utils.main", "--help"],
+            capture_output=True,
+            check=True,
+        )
+        self.assertLess(time.perf_counter() - start, STARTUP_BUDGET)
+
+
+class TestGraphKinds(unittest.TestCase):
+    def test_get_graph_kind(self):
+        for name in GRAPH_KINDS:
+            self.assertEqual(get_graph_kind(name).name, name)
+        with self.assertRaises(ValueError):
+            get_graph_kind("missing_graph")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import patch
+from notion_utils.models import ModelRegistry
+
+
+@patch("sentence_transformers.SentenceTransformer")
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry(idle_timeout=0)
+
+    def tearDown(self):
+        self.registry.clear()
+
+    def test_model_loaded_once(self, mock_model):
+        first = self.registry.get("model")
+        second = self.registry.get("model")
+        self.assertIs(first, second)
+        mock_model.assert_called_once_with("model", device="cpu")
+
+    def test_models_keyed_by_backend(self, mock_model):
+        self.registry.get("model")
+        self.registry.get("model", backend="onnx")
+        self.assertEqual(mock_model.call_count, 2)
+        self.assertEqual(mock_model.call_args.kwargs["backend"], "onnx")
+
+    def test_unload_idle(self, mock_model):
+        self.registry.idle_timeout = 10
+        self.registry.get("model")
+        self.registry.unload_idle(now=0)
+        self.assertEqual(self.registry.loaded(), [("model", "torch", False)])
+        self.registry.unload_idle(now=float("inf"))
+        self.assertEqual(self.registry.loaded(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from notion_utils.neighbours import ExactIndex, IVFIndex, NeighbourIndex, load_index
+from notion_utils.similarity import normalize, threshold_pairs
+
+
+def clustered_embeddings(n=300, dim=16, n_clusters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = rng.integers(n_clusters, size=n)
+    return normalize(centers[labels] + 0.3 * rng.normal(size=(n, dim)))
+
+
+class TestNeighbourIndex(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = clustered_embeddings()
+        self.ids = [f"id{i}" for i in range(len(self.embeddings))]
+
+    def test_base_index_is_abstract(self):
+        with self.assertRaises(TypeError):
+            NeighbourIndex()
+
+    def test_exact_index_matches_threshold_pairs(self):
+        index = ExactIndex()
+        index.upsert(self.ids, self.embeddings)
+        rows, cols, _ = index.search_pairs(0.8)
+        expected_rows, expected_cols, _ = threshold_pairs(self.embeddings, 0.8)
+        self.assertEqual(set(zip(rows, cols)), set(zip(expected_rows, expected_cols)))
+        self.assertEqual(index.recall(0.8), 1.0)
+
+    def test_ivf_index_recall(self):
+        index = IVFIndex(n_probe=3)
+        index.upsert(self.ids, self.embeddings)
+        rows, cols, scores = index.search_pairs(0.8)
+        self.assertTrue((rows < cols).all())
+        self.assertTrue((scores > 0.8).all())
+        self.assertGreater(index.recall(0.8), 0.9)
+
+    def test_incremental_upsert_and_remove(self):
+        index = IVFIndex()
+        index.upsert(self.ids[:200], self.embeddings[:200])
+        centroids = index.centroids
+        index.upsert(self.ids[150:], self.embeddings[150:])
+        self.assertIs(index.centroids, centroids)
+        self.assertEqual(len(index.ids), 300)
+        index.retain(self.ids[:100])
+        rows, cols, _ = index.search_pairs(0.5)
+        self.assertTrue((rows < 100).all() and (cols < 100).all())
+
+    def test_save_and_load(self):
+        index = IVFIndex(n_probe=2)
+        index.upsert(self.ids, self.embeddings)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "index")
+            index.save(path)
+            self.assertEqual(os.listdir(tmp_dir), ["index"])
+            loaded = load_index(path)
+        self.assertIsInstance(loaded, IVFIndex)
+        self.assertEqual(loaded.n_probe, 2)
+        self.assertEqual(loaded.ids, self.ids)
+        np.testing.assert_array_equal(loaded.search_pairs(0.8)[0], index.search_pairs(0.8)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,14 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
-from pyvis.network import Network
+from unittest.mock import patch
 import networkx as nx
+import numpy as np
 import pandas as pd
+from notion_utils.embedding_cache import EmbeddingCache
+from notion_utils.embedding_pipeline import print_progress
+from notion_utils.neighbours import ExactIndex
+from notion_utils.records import RecordStore
 from notion_utils.network_graph import (
     NetworkGraphRelation,
     NetworkGraphCorrelation,
@@ -35,26 +41,55 @@ class TestNetworkGraphRelation(unittest.TestCase):
 class TestNetworkGraphCorrelation(unittest.TestCase):
     def setUp(self):
         self.data = [
-            {"title": "Title1", "summary": "Summary1"},
-            {"title": "Title2", "summary": "Summary2"},
+            {"id": "id1", "title": "Title1", "summary": "Summary1"},
+            {"id": "id2", "title": "Title1", "summary": "Summary2"},
+            {"id": "id3", "title": "Title3", "summary": "Summary3"},
         ]
-        self.id_to_title = {"id1": "Title1", "id2": "Title2"}
+        self.id_to_title = {"id1": "Title1", "id2": "Title1", "id3": "Title3"}
         self.graph_builder = NetworkGraphCorrelation(self.data, self.id_to_title)
 
     @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_embeddings")
-    @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_correlation_matrix")
-    @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_links")
-    @patch("notion_utils.network_graph.NetworkGraphCorrelation.filter_links")
-    def test_build_graph(
-        self,
-        mock_filter_links,
-        mock_get_links,
-        mock_get_correlation_matrix,
-        mock_get_embeddings,
-    ):
-        mock_get_links.return_value = MagicMock()
-        mock_filter_links.return_value = MagicMock()
-        self.graph_builder.build_graph()
+    def test_build_graph(self, mock_get_embeddings):
+        mock_get_embeddings.return_value = np.array(
+            [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+        )
+        graph = self.graph_builder.build_graph(cutoff=0.5)
+        # Pages sharing a title stay distinct nodes
+        self.assertEqual(set(graph.nodes), {"id1", "id2"})
+        self.assertEqual(graph.nodes["id2"]["label"], "Title1")
+        self.assertEqual(set(graph.edges), {("id1", "id2")})
+
+    @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_embeddings")
+    def test_build_graph_top_k(self, mock_get_embeddings):
+        mock_get_embeddings.return_value = np.array(
+            [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+        )
+        graph = self.graph_builder.build_graph(cutoff=-1.0, top_k=1)
+        self.assertEqual(set(graph.nodes), {"id1", "id2", "id3"})
+        self.assertEqual(graph.degree["id1"], 1)
+
+    @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_embeddings")
+    def test_build_graph_reuses_similarities(self, mock_get_embeddings):
+        mock_get_embeddings.return_value = np.array(
+            [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+        )
+        graph = self.graph_builder.build_graph(cutoff=0.999, min_cutoff=-1.0)
+        self.assertEqual(len(graph.edges), 0)
+        graph = self.graph_builder.build_graph(cutoff=-1.0)
+        self.assertEqual(len(graph.edges), 3)
+        mock_get_embeddings.assert_called_once()
+        stats = self.graph_builder.sweep([-1.0, 0.5])
+        self.assertEqual([el["edges"] for el in stats], [3, 1])
+
+    @patch("notion_utils.network_graph.NetworkGraphCorrelation.get_embeddings")
+    def test_build_graph_with_index(self, mock_get_embeddings):
+        mock_get_embeddings.return_value = np.array(
+            [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+        )
+        self.graph_builder.index = ExactIndex()
+        self.graph_builder.index.upsert(["gone"], np.array([[1.0, 0.0]]))
+        graph = self.graph_builder.build_graph(cutoff=0.5)
+        self.assertEqual(set(graph.edges), {("id1", "id2")})
 
 
 class TestNetworkGraphRelationIntegration(unittest.TestCase):
@@ -82,8 +117,33 @@ class TestNetworkGraphRelationIntegration(unittest.TestCase):
 
     def test_save_graph_in_html(self):
         graph = self.graph_builder.build_graph()
-        self.graph_builder.save_graph_in_html(graph, "test_graph.html")
-        # Here you would check if the file was created and if it has the correct content.
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "test_graph.html")
+            self.graph_builder.save_graph_in_html(graph, filename)
+            self.assertEqual(os.listdir(tmp_dir), ["test_graph.html"])
+
+    def test_save_graph_in_html_with_layout(self):
+        graph = self.graph_builder.build_graph()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "test_graph.html")
+            self.graph_builder.save_graph_in_html(graph, filename, layout=True)
+            with open(filename, encoding="utf-8") as f:
+                html = f.read()
+        self.assertRegex(html, r'"physics": \{\s*"enabled": false')
+        self.assertIn('"x": ', html)
+
+    def test_render_html(self):
+        graph = self.graph_builder.build_graph()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                html = self.graph_builder.render_html(graph)
+                self.assertEqual(os.listdir(tmp_dir), [])
+            finally:
+                os.chdir(cwd)
+        self.assertIn("Title1", html)
+        self.assertIn("<html>", html)
 
 
 class TestNetworkGraphCorrelationIntegration(unittest.TestCase):
@@ -99,6 +159,38 @@ class TestNetworkGraphCorrelationIntegration(unittest.TestCase):
         embeddings = self.graph_builder.get_embeddings()
         # Here you would check the shape and type of the embeddings, and perhaps some properties of the embeddings.
 
+    @patch("notion_utils.network_graph.encode_parallel")
+    def test_get_embeddings_with_cache_and_workers(self, mock_encode_parallel):
+        mock_encode_parallel.side_effect = lambda texts, *args, **kwargs: np.ones(
+            (len(texts), 3), dtype=np.float32
+        )
+        data = [{"title": f"Title{i}", "summary": ""} for i in range(1000)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph_builder = NetworkGraphCorrelation(
+                data, cache=EmbeddingCache(tmp_dir), workers=2
+            )
+            self.assertEqual(graph_builder.get_embeddings().shape, (1000, 3))
+            # One pool for all the missing texts, and none once they are cached
+            mock_encode_parallel.assert_called_once()
+            self.assertEqual(len(mock_encode_parallel.call_args.args[0]), 1000)
+            self.assertEqual(mock_encode_parallel.call_args.kwargs["workers"], 2)
+            self.assertIs(mock_encode_parallel.call_args.kwargs["progress"], print_progress)
+            graph_builder.get_embeddings()
+            mock_encode_parallel.assert_called_once()
+
+    def test_columns_from_record_store(self):
+        store = RecordStore.from_records(
+            [
+                {"id": "id1", "title": "Title1", "summary": "S1", "children": ["out"]},
+                {"id": "id2", "title": "Title2", "summary": "S2", "children": []},
+            ]
+        )
+        graph_builder = NetworkGraphCorrelation(store)
+        with patch.object(RecordStore, "__iter__", side_effect=AssertionError):
+            ids, titles = graph_builder.columns("id", "title")
+        self.assertEqual(list(ids), ["id1", "id2"])
+        self.assertEqual(list(titles), ["Title1", "Title2"])
+
     def test_get_correlation_matrix(self):
         matrix = self.graph_builder.get_correlation_matrix()
         self.assertIsInstance(matrix, pd.DataFrame)
@@ -1,43 +1,164 @@
+import email.utils
+import json
+import threading
 import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
-from notion_utils.notion_api import NotionAPI  # replace with the actual module name
+from notion_utils.notion_api import (
+    NotionAPI,
+    created_time_partitions,
+    post_with_backoff,
+    prefetch,
+    retry_after_seconds,
+    sync_databases,
+)
+from notion_utils.schema_index import SchemaIndex
+
+
+def fake_schema_index():
+    schema_index = SchemaIndex()
+    schema_index.apply(
+        [{"id": "fake_id", "name": "fake_database", "self_relation_properties": []}]
+    )
+    return schema_index
+
+
+class TestBackoff(unittest.TestCase):
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after_seconds("2"), 2.0)
+        self.assertEqual(retry_after_seconds(None), None)
+        self.assertEqual(retry_after_seconds("soon"), None)
+        self.assertEqual(retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        later = email.utils.format_datetime(
+            datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True
+        )
+        self.assertAlmostEqual(retry_after_seconds(later), 30, delta=2)
+
+    @patch("notion_utils.notion_api.time.sleep")
+    def test_post_with_backoff(self, mock_sleep):
+        rate_limited = [
+            MagicMock(status_code=429, headers={"Retry-After": value})
+            for value in ("Wed, 21 Oct 2015 07:28:00 GMT", "bogus")
+        ]
+        ok = MagicMock(status_code=200)
+        session = MagicMock()
+        session.post.side_effect = rate_limited + [ok]
+        resp = post_with_backoff(session, "url", {}, backoff=1.0, stream=True)
+        self.assertIs(resp, ok)
+        for el in rate_limited:
+            el.close.assert_called_once()
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        # The past date means no wait, then exponential backoff for the unreadable header
+        self.assertLessEqual(delays[0], 0.1)
+        self.assertGreaterEqual(delays[1], 2.0)
+
+
+class StubNotionHandler(BaseHTTPRequestHandler):
+    """Serve a paginated database query, rate limiting the first request."""
+
+    pages = [{"id": f"id{i}", "created_time": f"2023-01-{i + 1:02d}"} for i in range(7)]
+    page_size = 3
+    rate_limited = set()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        key = json.dumps(body, sort_keys=True)
+        if key not in self.rate_limited:
+            self.rate_limited.add(key)
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        condition = body.get("filter", {}).get("created_time", {})
+        pages = [
+            page
+            for page in self.pages
+            if page["created_time"] >= condition.get("on_or_after", "")
+            and page["created_time"] < condition.get("before", "9999")
+        ]
+        start = int(body.get("start_cursor", 0))
+        end = start + min(body["page_size"], self.page_size)
+        payload = json.dumps(
+            {
+                "results": pages[start:end],
+                "has_more": end < len(pages),
+                "next_cursor": str(end) if end < len(pages) else None,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
 
 
 class TestNotionAPI(unittest.TestCase):
-    @patch("notion_utils.notion_api.NotionAPI.list_databases")
-    @patch("requests.post")
-    def setUp(self, mock_post, mock_list_databases):
-        self.mock_post = mock_post
+    def setUp(self):
         self.token = "fake_token"
         self.database_name = "fake_database"
-        mock_list_databases.return_value = {"fake_database": "fake_id"}
-        self.notion_api = NotionAPI(self.token, self.database_name)
+        self.notion_api = NotionAPI(
+            self.token, self.database_name, schema_index=fake_schema_index()
+        )
 
-    @patch("requests.post")
-    def test_retrieve_data(self, mock_post):
+    def test_retrieve_data(self):
         # Success path
-        mock_post.return_value.json.return_value = {"results": "fake_results"}
-        self.assertEqual(self.notion_api.retrieve_data(), "fake_results")
+        self.notion_api.session = MagicMock()
+        mock_post = self.notion_api.session.post
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            "results": ["fake_result"],
+            "has_more": False,
+        }
+        self.assertEqual(self.notion_api.retrieve_data(), ["fake_result"])
 
         # Failure path
+        self.notion_api.retrieve_data.cache_clear()
         mock_post.return_value.json.side_effect = Exception("API error")
         with self.assertRaises(Exception):
             self.notion_api.retrieve_data()
 
-    @patch("requests.post")
-    def test_list_databases(self, mock_post):
-        # Success path
-        mock_post.return_value.json.return_value = {
-            "results": [
-                {"title": [{"text": {"content": "fake_database"}}], "id": "fake_id"}
-            ]
-        }
-        self.assertEqual(self.notion_api.list_databases(), {"fake_database": "fake_id"})
+    @patch("notion_utils.notion_api.get_session")
+    def test_sync_databases(self, mock_get_session):
+        # Success path, over two pages of search results
+        def database(db_id, name):
+            return {
+                "id": db_id,
+                "title": [{"text": {"content": name}}] if name else [],
+                "last_edited_time": "2023-01-01T00:00:00.000Z",
+                "properties": {
+                    "Child": {"type": "relation", "relation": {"database_id": db_id}}
+                },
+            }
+
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.side_effect = [
+            {"results": [database("id1", "first")], "has_more": True, "next_cursor": "1"},
+            {"results": [database("id2", "second"), database("id3", None)], "has_more": False},
+        ]
+        schema_index = SchemaIndex()
+        sync_databases(self.token, schema_index)
+        self.assertEqual(
+            {name: val["id"] for name, val in schema_index.databases().items()},
+            {"first": "id1", "second": "id2"},
+        )
+        self.assertEqual(schema_index.get("first")["self_relation_properties"], ["Child"])
+        self.assertEqual(mock_post.call_args.kwargs["json"]["start_cursor"], "1")
 
         # Failure path
         mock_post.return_value.json.side_effect = Exception("API error")
         with self.assertRaises(Exception):
-            self.notion_api.list_databases()
+            sync_databases(self.token, schema_index, full=True)
+
+    @patch("notion_utils.notion_api.sync_databases")
+    def test_unknown_database(self, mock_sync_databases):
+        with self.assertRaisesRegex(ValueError, "fake_database"):
+            NotionAPI(self.token, "Fake Database", schema_index=fake_schema_index())
+        mock_sync_databases.assert_called_once()
 
     def test_get_property(self):
         # Assuming 'properties' exists in the result
@@ -127,5 +248,71 @@ class TestNotionAPI(unittest.TestCase):
         self.assertEqual(id_to_title, "fake_id_to_title")
 
 
+class TestNotionAPIPagination(unittest.TestCase):
+    def setUp(self):
+        StubNotionHandler.rate_limited = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubNotionHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.notion_api = NotionAPI(
+            "fake_token",
+            "fake_database",
+            base_url=f"http://127.0.0.1:{self.server.server_port}",
+            schema_index=fake_schema_index(),
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retrieve_data_follows_cursor(self):
+        results = self.notion_api.retrieve_data()
+        self.assertEqual([el["id"] for el in results], [f"id{i}" for i in range(7)])
+
+    def test_retrieve_data_partitions(self):
+        results = self.notion_api.retrieve_data(("2023-01-03", "2023-01-06"))
+        self.assertEqual([el["id"] for el in results], [f"id{i}" for i in range(7)])
+
+    def test_iter_records(self):
+        records = list(self.notion_api.iter_records())
+        self.assertEqual([el["id"] for el in records], [f"id{i}" for i in range(7)])
+        self.assertEqual(records[0]["children"], [])
+
+    def test_iter_records_incremental(self):
+        records = list(self.notion_api.iter_records(incremental=True))
+        self.assertEqual([el["id"] for el in records], [f"id{i}" for i in range(7)])
+
+    def test_record_store(self):
+        store = self.notion_api.record_store()
+        self.assertEqual(store.ids, [f"id{i}" for i in range(7)])
+        partitioned = self.notion_api.record_store(created_time_boundaries=["2023-01-03"])
+        self.assertEqual(partitioned.ids, store.ids)
+
+    def test_prefetch_stops_with_the_consumer(self):
+        closed = threading.Event()
+
+        def pages():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        threads = threading.active_count()
+        items = prefetch(pages(), depth=2)
+        self.assertEqual([next(items) for _ in range(3)], [0, 1, 2])
+        items.close()
+        self.assertTrue(closed.is_set())
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_created_time_partitions(self):
+        self.assertEqual(created_time_partitions(()), [None])
+        self.assertEqual(
+            [el["created_time"] for el in created_time_partitions(["a", "b"])],
+            [{"before": "a"}, {"on_or_after": "a", "before": "b"}, {"on_or_after": "b"}],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock
+from notion_utils.notion_api import NotionAPI
+from notion_utils.page_store import PageStore
+from notion_utils.schema_index import SchemaIndex
+
+
+def make_page(page_id, last_edited_time, **kwargs):
+    return {"id": page_id, "last_edited_time": last_edited_time, "properties": {}, **kwargs}
+
+
+class TestPageStore(unittest.TestCase):
+    def setUp(self):
+        self.store = PageStore(":memory:")
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_apply_and_watermark(self):
+        changes = self.store.apply(
+            "db", [make_page("a", "2023-01-01T00:00"), make_page("b", "2023-01-02T00:00")]
+        )
+        self.assertEqual(changes, {"upserted": ["a", "b"], "deleted": []})
+        self.assertEqual(self.store.get_watermark("db"), "2023-01-02T00:00")
+        self.assertEqual([el["id"] for el in self.store.pages("db")], ["a", "b"])
+
+    def test_apply_edit_and_archive(self):
+        self.store.apply("db", [make_page("a", "t1"), make_page("b", "t1")])
+        changes = self.store.apply(
+            "db", [make_page("a", "t2", archived=True), make_page("b", "t3")]
+        )
+        self.assertEqual(changes, {"upserted": ["b"], "deleted": ["a"]})
+        self.assertEqual([el["id"] for el in self.store.pages("db")], ["b"])
+        self.assertEqual(self.store.pages("db")[0]["last_edited_time"], "t3")
+
+    def test_full_apply_tombstones_missing_pages(self):
+        self.store.apply("db", [make_page("a", "t1"), make_page("b", "t1")])
+        changes = self.store.apply("db", [make_page("b", "t1")], full=True)
+        self.assertEqual(changes["deleted"], ["a"])
+        self.assertEqual(self.store.page_ids("db"), {"b"})
+
+    def test_watermark_never_goes_back(self):
+        self.store.apply("db", [make_page("a", "t2")])
+        self.store.apply("db", [])
+        self.assertEqual(self.store.get_watermark("db"), "t2")
+
+
+class TestNotionAPISync(unittest.TestCase):
+    def setUp(self):
+        schema_index = SchemaIndex()
+        schema_index.apply(
+            [{"id": "fake_id", "name": "fake_database", "self_relation_properties": []}]
+        )
+        self.notion_api = NotionAPI("fake_token", "fake_database", schema_index=schema_index)
+        self.notion_api.query_all = MagicMock()
+        self.store = PageStore(":memory:")
+
+    def test_sync_queries_since_watermark(self):
+        self.notion_api.query_all.return_value = [make_page("a", "t1")]
+        self.notion_api.sync(self.store)
+        self.notion_api.query_all.assert_called_with(None)
+
+        self.notion_api.query_all.return_value = [make_page("b", "t2")]
+        changes = self.notion_api.sync(self.store)
+        self.notion_api.query_all.assert_called_with(
+            {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": "t1"}}
+        )
+        self.assertEqual(changes, {"upserted": ["b"], "deleted": []})
+        self.assertEqual(self.store.page_ids("fake_id"), {"a", "b"})
+
+    def test_full_sync_sees_pages_left_out_by_the_api(self):
+        # Like the real endpoint, deleted pages are simply not returned
+        self.notion_api.query_all.return_value = [make_page("a", "t1"), make_page("b", "t1")]
+        self.notion_api.sync(self.store)
+        self.notion_api.query_all.return_value = []
+        self.assertEqual(self.notion_api.sync(self.store)["deleted"], [])
+        self.assertEqual(self.store.page_ids("fake_id"), {"a", "b"})
+        self.notion_api.query_all.return_value = [make_page("a", "t1")]
+        self.assertEqual(self.notion_api.sync(self.store, full=True)["deleted"], ["b"])
+        self.notion_api.query_all.assert_called_with(None)
+        self.assertEqual(self.notion_api.record_store(store=self.store, full=True).ids, ["a"])
+        records, deleted, _ = self.notion_api.changes(self.store)
+        self.assertEqual([el["id"] for el in records], ["a"])
+
+    def test_changes_returns_changed_records(self):
+        self.notion_api.query_all.return_value = [make_page("a", "t1"), make_page("b", "t1")]
+        self.notion_api.sync(self.store)
+        self.notion_api.query_all.return_value = [
+            make_page("a", "t2", archived=True),
+            make_page("c", "t2"),
+        ]
+        records, deleted, watermark = self.notion_api.changes(self.store, since="t1")
+        self.notion_api.query_all.assert_called_with(
+            {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": "t1"}}
+        )
+        self.assertEqual([el["id"] for el in records], ["c"])
+        self.assertEqual(deleted, ["a"])
+        self.assertEqual(watermark, "t2")
+        # The store's own watermark is left for sync
+        self.assertEqual(self.store.get_watermark("fake_id"), "t1")
+
+
+if __name__ == "__main__":
+    unittest.main()
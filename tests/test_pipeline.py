@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from notion_utils.network_graph import NetworkGraphRelation
+from notion_utils.pipeline import GraphPipeline, graph_filename, slugify
+from notion_utils.records import RecordStore
+
+
+class FakeCorrelationBuilder:
+    name = "correlations_graph"
+    uses_cutoff = True
+    instances = []
+
+    def __init__(self, data, **kwargs):
+        self.data = data
+        self.kwargs = kwargs
+        self.cutoffs = []
+        self.instances.append(self)
+
+    def build_graph(self, **kwargs):
+        self.cutoffs.append(kwargs["cutoff"])
+        return kwargs
+
+
+class TestGraphPipeline(unittest.TestCase):
+    def setUp(self):
+        FakeCorrelationBuilder.instances = []
+        self.records = RecordStore.from_records(
+            [{"id": "id1", "title": "Title1", "summary": "", "children": ["id2"]}],
+            {"id2": "Title2"},
+        )
+        self.fetch = MagicMock(return_value=self.records)
+        self.lock = threading.Lock()
+        self.rendered = {}
+
+    def render(self, network_graph, graph, filename):
+        with self.lock:
+            self.rendered[filename] = graph
+
+    def test_slugify(self):
+        self.assertEqual(slugify("GTD Tasks!"), "GTD_Tasks")
+
+    def test_graph_filename(self):
+        self.assertEqual(graph_filename("out", "relations_graph"), "out_relations_graph.html")
+        self.assertEqual(
+            graph_filename("out", "correlations_graph", "GTD Tasks", 0.7, "csv"),
+            "out_GTD_Tasks_correlations_graph_0.7.csv",
+        )
+
+    def test_single_database(self):
+        pipeline = GraphPipeline(
+            self.fetch, [NetworkGraphRelation, FakeCorrelationBuilder], self.render
+        )
+        filenames = pipeline.run(["GTD Tasks"], "out")
+        self.assertEqual(
+            sorted(filenames), ["out_correlations_graph.html", "out_relations_graph.html"]
+        )
+        self.assertEqual(set(self.rendered["out_relations_graph.html"].edges), {("Title1", "Title2")})
+
+    def test_fetch_once_per_database_and_reuse_builder(self):
+        pipeline = GraphPipeline(
+            self.fetch,
+            [NetworkGraphRelation, FakeCorrelationBuilder],
+            self.render,
+            builder_options=lambda GraphBuilder, database: {"database": database}
+            if GraphBuilder is FakeCorrelationBuilder
+            else {},
+            cutoffs=[0.3, 0.5],
+            build_kwargs={"top_k": 2},
+        )
+        pipeline.run(["db 1", "db 2"], "out", "gexf")
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(len(FakeCorrelationBuilder.instances), 2)
+        for builder in FakeCorrelationBuilder.instances:
+            self.assertEqual(builder.cutoffs, [0.3, 0.5])
+        self.assertEqual(
+            set(self.rendered),
+            {
+                "out_db_1_relations_graph.gexf",
+                "out_db_2_relations_graph.gexf",
+                "out_db_1_correlations_graph_0.3.gexf",
+                "out_db_1_correlations_graph_0.5.gexf",
+                "out_db_2_correlations_graph_0.3.gexf",
+                "out_db_2_correlations_graph_0.5.gexf",
+            },
+        )
+        self.assertEqual(
+            self.rendered["out_db_2_correlations_graph_0.3.gexf"],
+            {"top_k": 2, "cutoff": 0.3, "min_cutoff": 0.3},
+        )
+        self.assertIn(("db 1", "correlations_graph"), pipeline.built)
+
+    def test_concurrent_html_renders(self):
+        def render(network_graph, graph, filename):
+            network_graph.save_graph_in_html(graph, filename)
+
+        pipeline = GraphPipeline(self.fetch, [NetworkGraphRelation], render)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                filenames = pipeline.run([f"db {i}" for i in range(4)], "out")
+                self.assertEqual(sorted(os.listdir(tmp_dir)), sorted(filenames))
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from notion_utils.records import RecordStore
+
+
+class TestRecordStore(unittest.TestCase):
+    def setUp(self):
+        self.data = [
+            {"id": "id1", "title": "Title1", "summary": "S1", "children": ["id2", "id3"]},
+            {"id": "id4", "title": "Title4", "summary": "S4", "children": ["id1", "out"]},
+            {"id": "id2", "title": "Title2", "summary": "S2", "children": []},
+        ]
+        self.store = RecordStore.from_records(self.data, {"id3": "Title3"})
+
+    def test_interning(self):
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.store.index["id1"], 0)
+        self.assertEqual(list(self.store.known), [True, True, True, True, False])
+
+    def test_csr_children(self):
+        i = self.store.index
+        self.assertEqual(list(self.store.children(i["id1"])), [i["id2"], i["id3"]])
+        self.assertEqual(list(self.store.children(i["id4"])), [i["id1"], i["out"]])
+        self.assertEqual(len(self.store.children(i["id2"])), 0)
+
+    def test_edges_skip_unknown_pages(self):
+        sources, targets = self.store.edges()
+        titles = set(zip(self.store.titles[sources], self.store.titles[targets]))
+        self.assertEqual(
+            titles,
+            {("Title1", "Title2"), ("Title1", "Title3"), ("Title4", "Title1")},
+        )
+
+    def test_iter_records(self):
+        records = {el["id"]: el for el in self.store}
+        self.assertEqual(set(records), {"id1", "id2", "id3", "id4"})
+        self.assertEqual(records["id4"], self.data[1])
+        self.assertEqual(self.store.id_to_title()["id3"], "Title3")
+
+    def test_empty(self):
+        store = RecordStore.from_records([])
+        sources, targets = store.edges()
+        self.assertEqual(len(store), 0)
+        self.assertIsInstance(sources, np.ndarray)
+        self.assertEqual(len(targets), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.stub_server import StubNotionServer
+from benchmarks.workspace import SyntheticWorkspace, timestamp
+from notion_utils.notion_api import NotionAPI, get_schema_index, sync_databases
+from notion_utils.schema_index import SchemaIndex
+
+
+def make_database(db_id, name, last_edited_time="2023-01-01T00:00:00.000Z"):
+    return {
+        "id": db_id,
+        "name": name,
+        "self_relation_properties": ["Child"],
+        "last_edited_time": last_edited_time,
+    }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSchemaIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "schema.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_apply_lookup_and_persistence(self):
+        index = SchemaIndex(self.path)
+        index.apply([make_database("a", "Tasks"), make_database("b", "Notes")], full=True)
+        changes = index.apply([make_database("a", "Tasks v2", "2023-02-01T00:00:00.000Z")])
+        self.assertEqual(changes, {"upserted": ["a"], "deleted": []})
+        index.close()
+        index = SchemaIndex(self.path)
+        self.assertEqual(index.resolve("Tasks v2"), "a")
+        self.assertIsNone(index.get("Tasks"))
+        self.assertEqual(index.watermark, "2023-02-01T00:00:00.000Z")
+        self.assertEqual(index.apply([make_database("b", "Notes")], full=True)["deleted"], ["a"])
+        self.assertEqual(list(index.databases()), ["Notes"])
+        index.close()
+
+    def test_fuzzy_lookup(self):
+        index = SchemaIndex()
+        index.apply([make_database("a", "GTD Tasks"), make_database("b", "Reading notes")])
+        self.assertEqual(index.suggest("gtd tasks")[0], "GTD Tasks")
+        self.assertEqual(index.suggest("GTD Task"), ["GTD Tasks"])
+        self.assertEqual(index.suggest("Unrelated"), [])
+        with self.assertRaisesRegex(ValueError, "GTD Tasks"):
+            index.resolve("GTD Task")
+
+    def test_is_fresh(self):
+        clock = FakeClock()
+        index = SchemaIndex(max_age=60, clock=clock)
+        self.assertFalse(index.is_fresh())
+        index.apply([])
+        self.assertTrue(index.is_fresh())
+        clock.now = 61
+        self.assertFalse(index.is_fresh())
+
+
+class TestSyncDatabases(unittest.TestCase):
+    def test_paginated_then_incremental(self):
+        workspace = SyntheticWorkspace(1, n_databases=150)
+        for i, database in enumerate(workspace.databases):
+            database["last_edited_time"] = timestamp(i)
+        with StubNotionServer(workspace, rate_limit_every=3) as server:
+            index = SchemaIndex()
+            sync_databases("token", index, server.url)
+            self.assertEqual(len(index.databases()), 150)
+            workspace.databases[7]["title"][0]["text"]["content"] = "Renamed"
+            workspace.databases[7]["last_edited_time"] = timestamp(200)
+            requests_before = server.request_count
+            changes = sync_databases("token", index, server.url)
+            # The last database of the previous sync shares the watermark, so comes again
+            self.assertEqual(changes["upserted"], ["db-0007", "db-0149"])
+            self.assertEqual(index.resolve("Renamed"), "db-0007")
+            # One search page, and a retry when it was rate limited
+            self.assertLessEqual(server.request_count - requests_before, 2)
+
+    def test_warm_index_makes_no_request(self):
+        workspace = SyntheticWorkspace(1, n_databases=2)
+        with tempfile.TemporaryDirectory() as tmp_dir, StubNotionServer(workspace) as server:
+            with patch("notion_utils.schema_index.CACHE_DIR", tmp_dir):
+                get_schema_index("token", server.url)
+                requests_before = server.request_count
+                notion_api = NotionAPI("token", "Database 1", base_url=server.url)
+                self.assertEqual(notion_api.database_id, "db-0001")
+                self.assertEqual(server.request_count, requests_before)
+                self.assertEqual(len(os.listdir(tmp_dir)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+from notion_utils.similarity import (
+    SimilarityEdges,
+    normalize,
+    threshold_pairs,
+    top_k_pairs,
+    to_sparse,
+)
+
+
+class TestSimilarity(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.embeddings = normalize(rng.normal(size=(50, 8)))
+        self.dense = self.embeddings @ self.embeddings.T
+
+    def test_normalize(self):
+        embeddings = normalize([[3.0, 4.0], [0.0, 0.0]])
+        np.testing.assert_allclose(embeddings, [[0.6, 0.8], [0.0, 0.0]])
+
+    def test_threshold_pairs_match_dense(self):
+        rows, cols, scores = threshold_pairs(self.embeddings, cutoff=0.3, block_size=7)
+        expected = set(zip(*np.nonzero(np.triu(self.dense > 0.3, k=1))))
+        self.assertEqual(set(zip(rows, cols)), expected)
+        np.testing.assert_allclose(scores, self.dense[rows, cols], rtol=1e-5)
+
+    def test_top_k_pairs_match_dense(self):
+        rows, cols, scores = top_k_pairs(self.embeddings, k=3, block_size=7)
+        self.assertEqual(len(rows), 50 * 3)
+        dense = self.dense.copy()
+        np.fill_diagonal(dense, -np.inf)
+        for i in range(50):
+            expected = set(np.argsort(-dense[i])[:3])
+            self.assertEqual(set(cols[rows == i]), expected)
+
+    def test_top_k_pairs_cutoff(self):
+        rows, cols, scores = top_k_pairs(self.embeddings, k=3, cutoff=0.5, block_size=7)
+        self.assertTrue((scores > 0.5).all())
+
+    def test_to_sparse_is_symmetric(self):
+        rows, cols, scores = threshold_pairs(self.embeddings, cutoff=0.3)
+        matrix = to_sparse(rows, cols, scores, 50)
+        self.assertEqual((matrix != matrix.T).nnz, 0)
+        self.assertEqual(matrix.nnz, 2 * len(rows))
+
+
+class TestSimilarityEdges(unittest.TestCase):
+    def setUp(self):
+        rows = np.array([0, 1, 0, 3])
+        cols = np.array([1, 2, 2, 4])
+        scores = np.array([0.9, 0.5, 0.7, 0.6], dtype=np.float32)
+        self.edges = SimilarityEdges(rows, cols, scores, n=6, min_cutoff=0.4)
+
+    def test_edges_for_cutoff(self):
+        rows, cols, scores = self.edges.edges(0.65)
+        self.assertEqual(list(zip(rows, cols)), [(0, 1), (0, 2)])
+        self.assertEqual(self.edges.count(0.4), 4)
+        self.assertEqual(self.edges.count(0.95), 0)
+
+    def test_cutoff_below_min_cutoff(self):
+        with self.assertRaises(ValueError):
+            self.edges.edges(0.3)
+
+    def test_sweep(self):
+        stats = self.edges.sweep([0.4, 0.65, 0.95])
+        self.assertEqual(
+            [(el["edges"], el["nodes"], el["components"], el["largest_component"]) for el in stats],
+            [(4, 5, 2, 3), (2, 3, 1, 3), (0, 0, 0, 0)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
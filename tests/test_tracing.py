@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.run import random_encoder
+from benchmarks.stub_server import StubNotionServer
+from benchmarks.workspace import CHILDREN_NAME, SyntheticWorkspace
+from notion_utils.network_graph import NetworkGraphCorrelation
+from notion_utils.notion_api import NotionAPI
+from notion_utils.schema_index import SchemaIndex
+from notion_utils.tracing import NULL_SPAN, Tracer, peak_rss_mb, tracer, with_context
+
+
+class TestTracer(unittest.TestCase):
+    def test_disabled_tracer_is_a_no_op(self):
+        tracer = Tracer()
+        self.assertIs(tracer.span("stage"), NULL_SPAN)
+        tracer.count("items", 3)
+        with tracer.recording() as trace:
+            pass
+        self.assertEqual(trace.spans, [])
+        self.assertFalse(tracer.enabled)
+
+    def test_spans_and_counts(self):
+        tracer = Tracer()
+
+        @tracer.traced("decorated")
+        def decorated(value):
+            return value * 2
+
+        with tracer.recording() as trace:
+            with tracer.span("stage", size=2):
+                tracer.count("items", 2)
+                tracer.count("items")
+            self.assertEqual(decorated(2), 4)
+        self.assertEqual(decorated(3), 6)
+        self.assertEqual([span["name"] for span in trace.spans], ["stage", "decorated"])
+        self.assertEqual(trace.spans[0]["args"], {"size": 2})
+        self.assertEqual(trace.counts["items"], 3)
+        summary = {stage["name"]: stage for stage in trace.summary()}
+        self.assertEqual(summary["decorated"]["calls"], 1)
+        self.assertGreater(summary["stage"]["process_peak_rss_mb"], 0)
+        self.assertIsNotNone(summary["stage"]["max_rss_delta_mb"])
+
+    def test_span_records_its_memory_growth(self):
+        tracer = Tracer()
+        with tracer.recording() as trace:
+            with tracer.span("allocate"):
+                block = np.ones(64 * 2**20 // 8)
+            with tracer.span("idle"):
+                pass
+        del block
+        summary = {stage["name"]: stage for stage in trace.summary()}
+        self.assertGreater(summary["allocate"]["max_rss_delta_mb"], 48)
+        self.assertLess(summary["idle"]["max_rss_delta_mb"], 16)
+
+    def test_memory_without_resource_module(self):
+        # As on Windows without psutil
+        with patch.dict(sys.modules, {"resource": None, "psutil": None}):
+            self.assertIsNone(peak_rss_mb())
+            tracer = Tracer()
+            with tracer.recording() as trace:
+                with tracer.span("stage"):
+                    pass
+        self.assertEqual(trace.summary()[0]["calls"], 1)
+
+    def test_concurrent_recordings_are_separate(self):
+        tracer = Tracer()
+        barrier = threading.Barrier(2)
+        traces = {}
+
+        def session(name):
+            with tracer.recording() as trace:
+                # Both recordings are active while each records its span
+                barrier.wait()
+                with tracer.span(name):
+                    pass
+                barrier.wait()
+            traces[name] = trace
+
+        threads = [threading.Thread(target=session, args=(name,)) for name in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([span["name"] for span in traces["a"].spans], ["a"])
+        self.assertEqual([span["name"] for span in traces["b"].spans], ["b"])
+
+    def test_with_context_records_pool_threads(self):
+        tracer = Tracer()
+
+        def stage(i):
+            with tracer.span("stage"):
+                tracer.count("items")
+
+        with tracer.recording() as trace, ThreadPoolExecutor(2) as executor:
+            list(executor.map(with_context(stage), range(4)))
+            list(executor.map(stage, range(4)))
+        self.assertEqual(len(trace.spans), 4)
+        self.assertEqual(trace.counts["items"], 4)
+
+    def test_export(self):
+        tracer = Tracer()
+        with tracer.recording() as trace:
+            with tracer.span("stage"):
+                tracer.count("items", 2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trace.json")
+            trace.export(path, "chrome")
+            with open(path, encoding="utf-8") as f:
+                events = json.load(f)["traceEvents"]
+            self.assertEqual([event["ph"] for event in events], ["X", "C", "C"])
+            trace.export(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["counts"], {"items": 2})
+            with self.assertRaises(ValueError):
+                trace.export(path, "xml")
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_pipeline_stages(self):
+        workspace = SyntheticWorkspace(120)
+        with StubNotionServer(workspace) as server:
+            with tracer.recording() as trace:
+                notion_api = NotionAPI(
+                    "token", "Database 0", base_url=server.url, schema_index=SchemaIndex()
+                )
+                data, id_to_title = notion_api.full_process(CHILDREN_NAME)
+                builder = NetworkGraphCorrelation(data, id_to_title)
+                builder.encode = random_encoder
+                builder.build_graph(cutoff=0.1)
+        stages = {stage["name"] for stage in trace.summary()}
+        self.assertTrue(
+            {"notion.sync_databases", "notion.http", "notion.process_data", "similarity"}
+            <= stages
+        )
+        # The search result counts as a page too
+        self.assertEqual(trace.counts["notion.pages"], 121)
+        self.assertEqual(trace.counts["notion.requests"], server.request_count)
+        self.assertGreater(trace.counts["notion.bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()